@@ -6,7 +6,21 @@ import hub
 import bluetooth
 import struct
 import time
-import motor
+
+# Pick the motor API this firmware has once, not on every BLE write
+try:
+    import motor
+except ImportError:
+    motor = None
+
+if motor is not None and hasattr(motor, 'start'):
+    # 3.4.3 API
+    motor_start = motor.start
+    motor_stop = motor.stop
+else:
+    # Older firmware
+    motor_start = lambda motor_port, power: motor_port.motor.run(power)
+    motor_stop = lambda motor_port: motor_port.motor.stop()
 
 # Basic BLE setup
 ble = bluetooth.BLE()
@@ -56,17 +70,12 @@ def on_ble_event(event, data):
         hub.light_matrix.show("00000:00000:09990:00000:00000")
         hub.sound.beep(220, 100)  # Disconnection beep
         
-        # Stop motors using 3.4.3 API
+        # Stop motors
         try:
-            motor.stop(hub.port.A)
-            motor.stop(hub.port.B)
-        except:
-            try:
-                # Fallback if the primary method fails
-                hub.port.A.motor.stop()
-                hub.port.B.motor.stop()
-            except:
-                pass
+            motor_stop(hub.port.A)
+            motor_stop(hub.port.B)
+        except Exception:
+            pass
         
         # Restart advertising
         ble.gap_advertise(100, adv_data)
@@ -77,18 +86,12 @@ def on_ble_event(event, data):
         if len(buffer) == 3:
             drive, steer, _ = struct.unpack("bbB", buffer)
             
-            # Apply motor control using 3.4.3 API
+            # Apply motor control
             try:
-                # New 3.4.3 API
-                motor.start(hub.port.B, drive)  # Drive motor
-                motor.start(hub.port.A, steer)  # Steering motor
-            except:
-                try:
-                    # Fallback methods if the above doesn't work
-                    hub.port.B.motor.run(drive)
-                    hub.port.A.motor.run(steer)
-                except:
-                    pass
+                motor_start(hub.port.B, drive)  # Drive motor
+                motor_start(hub.port.A, steer)  # Steering motor
+            except Exception:
+                pass  # Motor unplugged
 
 # Register event handler
 ble.irq(on_ble_event)
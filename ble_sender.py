@@ -0,0 +1,195 @@
+# Latest-value-wins BLE sender
+# The control loop drops each new frame into a single-slot mailbox and goes
+# straight back to sampling the controller. A separate task writes whatever
+# frame is newest as soon as the previous write completes, so a slow or
+# congested link never delays input reads and stale commands never queue up.
+#
+# Control frames are streamed with unacknowledged writes (write without
+# response) when the characteristic allows it, so a write doesn't wait for
+# a connection-event round trip. Stop and handshake messages should still
+# use response=True. Compare both modes against a real hub with:
+#   python ble_sender.py --bench                 # robot_python_code.py (SPIKE app 3.x)
+#   python ble_sender.py --bench --text --name "Pybricks Hub"
+
+import argparse
+import asyncio
+import time
+
+UART_RX_CHAR_UUID = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"
+
+
+def stream_response(client, char):
+    """Return the response= flag to use when streaming frames to char
+
+    False (write without response) if the characteristic advertises it,
+    otherwise True so writes still work on hubs that only allow acknowledged
+    writes.
+    """
+    characteristic = char
+    if not hasattr(char, "properties"):
+        try:
+            characteristic = client.services.get_characteristic(char)
+        except Exception:
+            characteristic = None
+    if characteristic is not None and "write-without-response" in characteristic.properties:
+        return False
+    return True
+
+
+class FrameSender:
+    """Single-slot mailbox plus writer task for one GATT characteristic
+
+    submit() never waits: if the previous frame has not been written yet it
+    is replaced (and counted as coalesced). If encode is given, submit()
+    takes commands and encode(command) turns the newest one into bytes just
+    before it is written. Frames are written without
+    response when the characteristic allows it, unless response is given.
+    Counters:
+      produced  - frames handed to submit()
+      coalesced - frames replaced before they were written
+      sent      - frames actually written
+    """
+    def __init__(self, client, char, response=None, encode=None):
+        self.client = client
+        self.char = char
+        self.encode = encode
+        self.response = stream_response(client, char) if response is None else response
+        self.produced = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.error = None
+        self._pending = None
+        self._writing = False
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """Start the writer task on the running loop"""
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def submit(self, frame):
+        """Make frame the next one to send, replacing any unsent frame"""
+        if self.error is not None:
+            raise self.error
+        self.produced += 1
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = frame
+        self._ready.set()
+
+    async def _run(self):
+        """Writer task, sends the newest frame whenever one is waiting"""
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                frame = self._pending
+                self._pending = None
+                if frame is None:
+                    continue
+                if self.encode:
+                    frame = self.encode(frame)
+                self._writing = True
+                await self.client.write_gatt_char(self.char, frame, response=self.response)
+                self._writing = False
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+            print(f"\nError sending command: {e}")
+
+    async def close(self, flush=True):
+        """Stop the writer, sending the last pending frame first if flush"""
+        if self._task is None:
+            return
+        if flush and self.error is None:
+            # Let the writer finish the current write and pick up the last frame
+            while (self._pending is not None or self._writing) and not self._task.done():
+                await asyncio.sleep(0.005)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self):
+        """One-line summary of the counters"""
+        return f"Frames produced: {self.produced}, coalesced: {self.coalesced}, sent: {self.sent}"
+
+
+async def _time_writes(client, frame, frames, response):
+    """Write frames back to back, return (frames/s, per-write latencies in ms)"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(frames):
+        t = time.perf_counter()
+        await client.write_gatt_char(UART_RX_CHAR_UUID, frame, response=response)
+        latencies.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+    return frames / elapsed, sorted(latencies)
+
+
+async def benchmark(address=None, name=None, frames=300, text=False):
+    """Compare acknowledged and unacknowledged writes on a connected hub"""
+    from bleak import BleakClient, BleakScanner
+
+    if address:
+        device = await BleakScanner.find_device_by_address(address)
+    else:
+        device = await BleakScanner.find_device_by_filter(
+            lambda d, ad: bool(d.name) and (d.name == name if name else
+                                            any(x in d.name.upper() for x in ["SPIKE", "LEGO", "PYBRICKS", "HUB"])))
+    if device is None:
+        print("No hub found. Make sure it is powered on and running the robot code.")
+        return
+
+    # A motors-off command, harmless to send any number of times
+    frame = b"rc(0,0)\n" if text else bytes(3)
+
+    async with BleakClient(device) as client:
+        print(f"Connected to {device.name} ({device.address}), MTU {client.mtu_size}")
+        if stream_response(client, UART_RX_CHAR_UUID):
+            print("RX characteristic does not allow write without response, only acknowledged writes will work")
+
+        print(f"\n{frames} frames of {len(frame)} bytes per mode")
+        print(f"{'mode':<24} {'frames/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for label, response in (("acknowledged", True), ("without response", False)):
+            try:
+                fps, latencies = await _time_writes(client, frame, frames, response)
+            except Exception as e:
+                print(f"{label:<24} failed: {e}")
+                continue
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[int(len(latencies) * 0.95)]
+            print(f"{label:<24} {fps:>9.1f} {p50:>8.2f} {p95:>8.2f} {latencies[-1]:>8.2f}")
+            # Let queued unacknowledged writes drain before the next mode
+            await client.write_gatt_char(UART_RX_CHAR_UUID, frame, response=True)
+
+        print("\nLatency is how long each write call blocks the sender. Unacknowledged")
+        print("writes return once the frame is queued, acknowledged ones after the hub confirms it.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latest-value BLE sender")
+    parser.add_argument("--bench", action="store_true", help="Compare write modes against a hub")
+    parser.add_argument("--address", help="Hub Bluetooth address")
+    parser.add_argument("--name", help="Hub name (default: any SPIKE/LEGO/Pybricks hub)")
+    parser.add_argument("--frames", type=int, default=300, help="Frames per mode")
+    parser.add_argument("--text", action="store_true",
+                        help="Send rc(0,0) text frames (Pybricks receivers) instead of 3-byte frames")
+    args = parser.parse_args()
+
+    if not args.bench:
+        parser.print_help()
+        return
+    try:
+        asyncio.run(benchmark(args.address, args.name, args.frames, args.text))
+    except KeyboardInterrupt:
+        print("\nExiting...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Stick-to-motor mapping shared by the host scripts
+# Deadband, expo curve, trigger power scaling (30% -> 100%) and the 70%
+# steering limit are set once, when the mapping is built, and bound into
+# map(). Per frame, map() turns the raw stick and trigger values into the
+# -100..100 motor powers that go into the hubs' signed bytes or
+# rc(drive,steer) commands, the same values the old inline float math
+# gives for in-range input.
+#
+# Compare against the old inline float math with:
+#   python control_mapping.py --bench
+
+import argparse
+import math
+import random
+import timeit
+
+
+class ControlMapping:
+    """Stick/trigger -> motor power mapping with fixed settings
+
+    Sticks outside -1..1 and triggers above 1 are clamped, and NaN (a
+    glitching axis) counts as centered or released.
+    """
+    def __init__(self, deadband=0.1, expo=0.0, base_power=30, max_power=100,
+                 trigger_threshold=0.1, steer_scale=0.7):
+        self.deadband = deadband
+        self.expo = expo
+        self.base_power = base_power
+        self.max_power = max_power
+        self.trigger_threshold = trigger_threshold
+        self.steer_scale = steer_scale
+        self.map = self._build_map()
+
+    def _build_map(self):
+        """Return map(drive, steer, boost) -> (drive power, steer power, power %)
+
+        Settings are bound as closure variables, so a frame costs a few
+        comparisons and two multiplications per axis, with no attribute
+        lookups.
+        """
+        deadband = self.deadband
+        expo = self.expo
+        linear = 1.0 - expo
+        threshold = self.trigger_threshold
+        base_power = self.base_power
+        max_power = self.max_power
+        span = max_power - base_power
+        steer_scale = self.steer_scale
+        # No expo, and the results can't leave -100..100
+        plain = not expo and max_power <= 100 and steer_scale <= 1
+
+        def map(drive, steer, boost):
+            if threshold <= boost < 1.0:
+                power = base_power + boost * span
+                percent = int(power)
+            elif boost >= 1.0:
+                power = percent = max_power
+            else:
+                power = percent = base_power
+            # Anything that fails both comparisons is in the deadband or NaN
+            if drive > deadband:
+                if drive > 1.0:
+                    drive = 1.0
+            elif drive < -deadband:
+                if drive < -1.0:
+                    drive = -1.0
+            else:
+                drive = 0.0
+            if steer > deadband:
+                if steer > 1.0:
+                    steer = 1.0
+            elif steer < -deadband:
+                if steer < -1.0:
+                    steer = -1.0
+            else:
+                steer = 0.0
+            if plain:
+                return int(drive * (power / 100) * 100), int(steer * steer_scale * 100), percent
+            # Blend linear and cubic so small movements are finer near center
+            drive = linear * drive + expo * drive * drive * drive
+            steer = linear * steer + expo * steer * steer * steer
+            return (_clamp(int(drive * (power / 100) * 100)),
+                    _clamp(int(steer * steer_scale * 100)), percent)
+        return map
+
+
+def _clamp(value):
+    return max(-100, min(100, value))
+
+
+_default = None
+
+
+def default_mapping():
+    """Shared ControlMapping with the standard RC car settings"""
+    global _default
+    if _default is None:
+        _default = ControlMapping()
+    return _default
+
+
+def _inline_mapping(l_stick_ver, r_stick_hor, r_trigger, deadband=0.1):
+    """The per-frame float math the host scripts used before this module"""
+    if deadband >= abs(l_stick_ver) >= 0:
+        l_stick_ver = 0
+    if deadband >= abs(r_stick_hor) >= 0:
+        r_stick_hor = 0
+    if r_trigger < 0.1:
+        power_multiplier = 30
+    else:
+        power_multiplier = 30 + (r_trigger * 70)
+    drive_power = l_stick_ver * (power_multiplier / 100)
+    steering_power = r_stick_hor * 0.7
+    return int(drive_power * 100), int(steering_power * 100), power_multiplier
+
+
+def benchmark(samples=100000, repeat=5):
+    """Time map() against the inline float math it replaced"""
+    rng = random.Random(1)
+    inputs = [(rng.uniform(-1, 1), rng.uniform(-1, 1), rng.random()) for _ in range(samples)]
+    released = [(d, s, 0.0) for d, s, _ in inputs]
+    mapping_map = default_mapping().map
+
+    def run(fn, frames):
+        def loop():
+            for d, s, t in frames:
+                fn(d, s, t)
+        return min(timeit.repeat(loop, number=1, repeat=repeat)) / samples * 1e9
+
+    for name, frames in (("random trigger", inputs), ("trigger released", released)):
+        inline = run(_inline_mapping, frames)
+        mapped = run(mapping_map, frames)
+        differ = sum(1 for d, s, t in frames if _inline_mapping(d, s, t)[:2] != mapping_map(d, s, t)[:2])
+        print(f"{name}: inline float math {inline:5.0f} ns/frame, map() {mapped:5.0f} ns/frame "
+              f"({inline / mapped:.2f}x), {differ} of {samples} frames differ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RC control mapping")
+    parser.add_argument("--bench", action="store_true", help="Benchmark against the inline float math")
+    parser.add_argument("--samples", type=int, default=100000, help="Frames per benchmark run")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.samples)
+        return
+
+    mapping = default_mapping()
+    for drive, steer, boost in ((0, 0, 0), (0.05, -0.05, 0), (1, 1, 0), (-1, -1, 1), (0.5, 0.5, 0.5),
+                                 (-1.2, math.nan, 1.5)):
+        print(f"drive={drive:+.2f} steer={steer:+.2f} boost={boost:.2f} -> {mapping.map(drive, steer, boost)}")
+
+
+if __name__ == "__main__":
+    main()
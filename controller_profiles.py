@@ -0,0 +1,332 @@
+# Per-controller axis/button mapping profiles
+# Resolves which raw joystick axis, button and hat belongs to which control
+# once per device GUID, instead of re-checking the controller name and axis
+# counts on every poll. Resolved profiles are cached on disk so controllers
+# we have seen before skip detection entirely.
+#
+# Resolution order:
+#   1. Cached profile for this GUID (~/.spikerc/controller_profiles.json)
+#   2. SDL's GameController standard mapping, if SDL knows the device
+#   3. The old name-based guess (DualSense vs. generic layout)
+
+import json
+import os
+
+from controller_state import (BTN_CROSS, BTN_CIRCLE, BTN_SQUARE, BTN_TRIANGLE,
+                              BTN_L1, BTN_R1, BTN_DPAD_UP, BTN_DPAD_DOWN,
+                              BTN_DPAD_LEFT, BTN_DPAD_RIGHT)
+
+PROFILE_VERSION = 1
+
+# Cache location, can be overridden for testing or portable installs
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".spikerc", "controller_profiles.json")
+
+# Analog controls in ControllerState order
+ANALOG_NAMES = ("left_x", "left_y", "right_x", "right_y", "left_trigger", "right_trigger")
+
+# Digital controls and the ControllerState bit they set
+BUTTON_BITS = {
+    "cross": BTN_CROSS,
+    "circle": BTN_CIRCLE,
+    "square": BTN_SQUARE,
+    "triangle": BTN_TRIANGLE,
+    "l1": BTN_L1,
+    "r1": BTN_R1,
+    "dpad_up": BTN_DPAD_UP,
+    "dpad_down": BTN_DPAD_DOWN,
+    "dpad_left": BTN_DPAD_LEFT,
+    "dpad_right": BTN_DPAD_RIGHT,
+}
+
+# SDL GameController names -> our control names
+_SDL_ANALOG = {
+    "leftx": "left_x",
+    "lefty": "left_y",
+    "rightx": "right_x",
+    "righty": "right_y",
+    "lefttrigger": "left_trigger",
+    "righttrigger": "right_trigger",
+}
+_SDL_BUTTONS = {
+    "a": "cross",
+    "b": "circle",
+    "x": "square",
+    "y": "triangle",
+    "leftshoulder": "l1",
+    "rightshoulder": "r1",
+    "dpup": "dpad_up",
+    "dpdown": "dpad_down",
+    "dpleft": "dpad_left",
+    "dpright": "dpad_right",
+}
+
+# SDL hat bit -> (pygame hat tuple position, value)
+_SDL_HAT_BITS = {1: (1, 1), 2: (0, 1), 4: (1, -1), 8: (0, -1)}
+
+# Analog modes
+#   "axis"  full -1..1 axis, used as is
+#   "-axis" full axis, inverted
+#   "full"  trigger on a full -1..1 axis, rescaled to 0..1
+#   "half"  trigger on the positive half of an axis
+#   "-half" trigger on the negative half of an axis
+
+
+class ControllerProfile:
+    """Resolved raw-index layout for one controller model
+
+    analog maps each ANALOG_NAMES entry to [axis_index, mode] (index -1 if
+    the control is missing). buttons maps each BUTTON_BITS entry to either
+    ["b", button_index] or ["h", hat_index, hat_axis, hat_value].
+    """
+    def __init__(self, guid, name, source, analog, buttons):
+        self.guid = guid
+        self.name = name
+        self.source = source
+        self.analog = analog
+        self.buttons = buttons
+
+        # Flatten into tuples once so the hot path is plain indexed reads
+        self._analog = tuple(tuple(analog.get(n, (-1, "axis"))) for n in ANALOG_NAMES)
+        self._digital = tuple((BUTTON_BITS[n],) + tuple(spec) for n, spec in buttons.items()
+                              if n in BUTTON_BITS)
+        self._right_bumper = tuple(buttons.get("r1", ("b", -1)))
+
+    def to_dict(self):
+        return {
+            "version": PROFILE_VERSION,
+            "guid": self.guid,
+            "name": self.name,
+            "source": self.source,
+            "analog": self.analog,
+            "buttons": self.buttons,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["guid"], data["name"], data["source"], data["analog"], data["buttons"])
+
+    def snapshot(self, publisher, axes, buttons, hats):
+        """Publish a ControllerState built from raw engine arrays"""
+        lx, ly, rx, ry, lt, rt = self._analog
+        num_axes = len(axes)
+
+        pressed = 0
+        for spec in self._digital:
+            index = spec[2]
+            if spec[1] == "b":
+                if index < len(buttons) and buttons[index]:
+                    pressed |= spec[0]
+            elif index < len(hats) and hats[index][spec[3]] == spec[4]:
+                pressed |= spec[0]
+
+        return publisher.publish(
+            _convert(axes[lx[0]], lx[1]) if 0 <= lx[0] < num_axes else 0.0,
+            _convert(axes[ly[0]], ly[1]) if 0 <= ly[0] < num_axes else 0.0,
+            _convert(axes[rx[0]], rx[1]) if 0 <= rx[0] < num_axes else 0.0,
+            _convert(axes[ry[0]], ry[1]) if 0 <= ry[0] < num_axes else 0.0,
+            _convert(axes[lt[0]], lt[1]) if 0 <= lt[0] < num_axes else 0.0,
+            _convert(axes[rt[0]], rt[1]) if 0 <= rt[0] < num_axes else 0.0,
+            pressed,
+        )
+
+    def rc_controls(self, joystick):
+        """Read (drive, steer, boost, stop) straight from a pygame joystick
+
+        Used by the thread-free SimpleController scripts; only the four
+        controls the RC car needs are queried.
+        """
+        _, ly, rx, _, _, rt = self._analog
+        get_axis = joystick.get_axis
+        drive = -_convert(get_axis(ly[0]), ly[1]) if ly[0] >= 0 else 0.0  # Invert Y so up is positive
+        steer = _convert(get_axis(rx[0]), rx[1]) if rx[0] >= 0 else 0.0
+        boost = _convert(get_axis(rt[0]), rt[1]) if rt[0] >= 0 else 0.0
+
+        kind, index = self._right_bumper[0], self._right_bumper[1]
+        stop = 1 if kind == "b" and index >= 0 and joystick.get_button(index) else 0
+
+        return drive, steer, boost, stop
+
+
+def _convert(value, mode):
+    """Apply an analog mode to a raw -1..1 axis value"""
+    if mode == "axis":
+        return value
+    if mode == "-axis":
+        return -value
+    if mode == "full":
+        return (value + 1) / 2.0  # Convert from -1..1 to 0..1
+    if mode == "half":
+        return value if value > 0 else 0.0
+    return -value if value < 0 else 0.0  # "-half"
+
+
+def _parse_sdl_binding(binding):
+    """Parse an SDL mapping value such as 'a2', '+a4', 'a1~', 'b0' or 'h0.4'"""
+    inverted = binding.endswith("~")
+    binding = binding.rstrip("~")
+    half = ""
+    if binding[:1] in "+-":
+        half, binding = binding[0], binding[1:]
+
+    if binding.startswith("a"):
+        return "a", int(binding[1:]), half, inverted
+    if binding.startswith("b"):
+        return "b", int(binding[1:]), half, inverted
+    if binding.startswith("h"):
+        hat, mask = binding[1:].split(".")
+        return "h", int(hat), int(mask), inverted
+    raise ValueError(f"Unsupported SDL binding: {binding}")
+
+
+def profile_from_sdl_mapping(guid, name, mapping):
+    """Build a profile from a pygame._sdl2 Controller.get_mapping() dict"""
+    analog = {}
+    buttons = {}
+    for key, binding in mapping.items():
+        try:
+            kind, index, extra, inverted = _parse_sdl_binding(binding)
+        except ValueError:
+            continue
+
+        if key in _SDL_ANALOG and kind == "a":
+            control = _SDL_ANALOG[key]
+            if control.endswith("trigger"):
+                if extra == "+":
+                    mode = "half"
+                elif extra == "-":
+                    mode = "-half"
+                else:
+                    mode = "full"
+            else:
+                mode = "-axis" if inverted else "axis"
+            analog[control] = [index, mode]
+        elif key in _SDL_BUTTONS:
+            control = _SDL_BUTTONS[key]
+            if kind == "b":
+                buttons[control] = ["b", index]
+            elif kind == "h" and extra in _SDL_HAT_BITS:
+                hat_axis, hat_value = _SDL_HAT_BITS[extra]
+                buttons[control] = ["h", index, hat_axis, hat_value]
+
+    return ControllerProfile(guid, name, "sdl", analog, buttons)
+
+
+def profile_from_name(guid, name, num_axes, num_buttons, num_hats):
+    """Fallback guess based on the controller name (the original heuristic)"""
+    lowered = name.lower()
+    analog = {"left_x": [0, "axis"], "left_y": [1, "axis"]}
+
+    # For PS5 DualSense on Windows, right stick is usually axes 2 and 3
+    # and the triggers are axes 4 and 5. Other controllers use 3/4 and 2/5.
+    if "dualsense" in lowered or "dual sense" in lowered:
+        analog["right_x"] = [2, "axis"]
+        analog["right_y"] = [3, "axis"]
+        if num_axes > 5:
+            analog["left_trigger"] = [4, "full"]
+            analog["right_trigger"] = [5, "full"]
+    else:
+        analog["right_x"] = [3 if num_axes > 3 else -1, "axis"]
+        analog["right_y"] = [4 if num_axes > 4 else -1, "axis"]
+        if num_axes > 5:
+            analog["left_trigger"] = [2, "full"]
+            analog["right_trigger"] = [5, "full"]
+
+    buttons = {}
+    if num_buttons > 3:
+        # Common button mapping for PlayStation controllers
+        buttons["cross"] = ["b", 0]
+        buttons["circle"] = ["b", 1]
+        buttons["square"] = ["b", 2]
+        buttons["triangle"] = ["b", 3]
+    if num_buttons > 5:
+        buttons["l1"] = ["b", 4]
+        buttons["r1"] = ["b", 5]
+
+    # D-pad reported as a hat
+    if num_hats > 0:
+        buttons["dpad_up"] = ["h", 0, 1, 1]
+        buttons["dpad_down"] = ["h", 0, 1, -1]
+        buttons["dpad_left"] = ["h", 0, 0, -1]
+        buttons["dpad_right"] = ["h", 0, 0, 1]
+
+    return ControllerProfile(guid, name, "name", analog, buttons)
+
+
+def load_profile_cache(path=None):
+    """Load the GUID -> profile dict from disk, empty if missing or corrupt"""
+    path = path or os.environ.get("SPIKERC_PROFILE_CACHE", DEFAULT_CACHE_PATH)
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {guid: p for guid, p in data.items()
+            if isinstance(p, dict) and p.get("version") == PROFILE_VERSION}
+
+
+def save_profile(profile, path=None):
+    """Add or replace one profile in the on-disk cache"""
+    path = path or os.environ.get("SPIKERC_PROFILE_CACHE", DEFAULT_CACHE_PATH)
+    cache = load_profile_cache(path)
+    cache[profile.guid] = profile.to_dict()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not save controller profile: {e}")
+
+
+def _sdl_mapping(index):
+    """Return SDL's GameController mapping dict for a joystick index, or None"""
+    try:
+        from pygame._sdl2 import controller as sdl_controller
+    except ImportError:
+        return None
+
+    try:
+        if not sdl_controller.get_init():
+            sdl_controller.init()
+        if not sdl_controller.is_controller(index):
+            return None
+        pad = sdl_controller.Controller(index)
+        try:
+            return pad.get_mapping()
+        finally:
+            pad.quit()
+    except Exception as e:
+        print(f"SDL controller mapping unavailable: {e}")
+        return None
+
+
+def resolve_profile(joystick, index=0, cache_path=None):
+    """Return the ControllerProfile for a pygame joystick
+
+    Uses the on-disk cache when this GUID has been seen before; otherwise
+    resolves it (SDL mapping first, name heuristic second) and caches it.
+    """
+    name = joystick.get_name()
+    try:
+        guid = joystick.get_guid()
+    except AttributeError:
+        guid = name
+
+    cached = load_profile_cache(cache_path).get(guid)
+    if cached:
+        profile = ControllerProfile.from_dict(cached)
+        profile.source = "cache"
+        print(f"Using cached controller profile for {name}")
+        return profile
+
+    mapping = _sdl_mapping(index)
+    if mapping:
+        profile = profile_from_sdl_mapping(guid, name, mapping)
+    else:
+        profile = profile_from_name(guid, name, joystick.get_numaxes(),
+                                    joystick.get_numbuttons(), joystick.get_numhats())
+
+    print(f"Resolved controller profile for {name} from {profile.source} mapping")
+    save_profile(profile, cache_path)
+    return profile
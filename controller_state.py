@@ -0,0 +1,128 @@
+# Immutable controller state snapshots
+# The input thread builds one ControllerState per change and swaps it in with
+# a single reference assignment, so read() always sees one consistent frame
+# without taking a lock.
+
+import time
+from collections import namedtuple
+
+# Button bits packed into ControllerState.buttons
+BTN_CROSS = 1 << 0      # A/Cross
+BTN_CIRCLE = 1 << 1     # B/Circle
+BTN_SQUARE = 1 << 2     # X/Square
+BTN_TRIANGLE = 1 << 3   # Y/Triangle
+BTN_L1 = 1 << 4         # Left bumper
+BTN_R1 = 1 << 5         # Right bumper
+BTN_DPAD_UP = 1 << 6
+BTN_DPAD_DOWN = 1 << 7
+BTN_DPAD_LEFT = 1 << 8
+BTN_DPAD_RIGHT = 1 << 9
+
+_FIELDS = (
+    "seq",            # Monotonically increasing per controller
+    "timestamp_ns",   # time.monotonic_ns() when the change was captured
+    "left_x",
+    "left_y",
+    "right_x",
+    "right_y",
+    "left_trigger",   # 0..1
+    "right_trigger",  # 0..1
+    "buttons",        # BTN_* bitmask
+)
+
+
+class ControllerState(namedtuple("ControllerState", _FIELDS)):
+    """One consistent, read-only controller frame
+
+    Sticks are raw -1..1 values as reported by the device (Y is not inverted),
+    triggers are 0..1 and buttons are a BTN_* bitmask.
+    """
+    __slots__ = ()
+
+    def pressed(self, mask):
+        """Return 1 if any button in mask is held, else 0"""
+        return 1 if self.buttons & mask else 0
+
+    @property
+    def cross(self):
+        return self.pressed(BTN_CROSS)
+
+    @property
+    def circle(self):
+        return self.pressed(BTN_CIRCLE)
+
+    @property
+    def square(self):
+        return self.pressed(BTN_SQUARE)
+
+    @property
+    def triangle(self):
+        return self.pressed(BTN_TRIANGLE)
+
+    @property
+    def left_bumper(self):
+        return self.pressed(BTN_L1)
+
+    @property
+    def right_bumper(self):
+        return self.pressed(BTN_R1)
+
+    @property
+    def dpad_up(self):
+        return self.pressed(BTN_DPAD_UP)
+
+    @property
+    def dpad_down(self):
+        return self.pressed(BTN_DPAD_DOWN)
+
+    @property
+    def dpad_left(self):
+        return self.pressed(BTN_DPAD_LEFT)
+
+    @property
+    def dpad_right(self):
+        return self.pressed(BTN_DPAD_RIGHT)
+
+    def rc_controls(self):
+        """Return [drive, steer, boost, stop] as used by the RC car scripts"""
+        # Invert Y axis so pushing up drives forward
+        return [-self.left_y, self.right_x, self.right_trigger, self.right_bumper]
+
+
+# Snapshot used before the first event arrives
+EMPTY_STATE = ControllerState(0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+
+
+def hat_buttons(hat):
+    """Convert a pygame-style (x, y) hat tuple into BTN_DPAD_* bits"""
+    bits = 0
+    if hat[0] == -1:
+        bits |= BTN_DPAD_LEFT
+    elif hat[0] == 1:
+        bits |= BTN_DPAD_RIGHT
+    if hat[1] == 1:
+        bits |= BTN_DPAD_UP
+    elif hat[1] == -1:
+        bits |= BTN_DPAD_DOWN
+    return bits
+
+
+class StatePublisher:
+    """Single-writer helper that numbers snapshots and swaps them in
+
+    Only the input thread calls publish(); readers just grab .state, which
+    is replaced by one reference assignment and so can never be torn.
+    """
+    def __init__(self):
+        self.state = EMPTY_STATE
+
+    def publish(self, left_x, left_y, right_x, right_y, left_trigger, right_trigger, buttons):
+        state = ControllerState(
+            self.state.seq + 1,
+            time.monotonic_ns(),
+            left_x, left_y, right_x, right_y,
+            left_trigger, right_trigger,
+            buttons,
+        )
+        self.state = state
+        return state
@@ -1,10 +1,15 @@
 # Debug UART Connection Script
 # For diagnosing connection issues between computer and SPIKE Prime hub
 # Use this to test communication before running the main controller
+# The ping command times round trips to robot_python_code.py or
+# pybricks_uart_receiver.py with echoed ping frames (ping_monitor.py)
 
 import sys
 import asyncio
-from bleak import BleakScanner, BleakClient
+# bleak, or the loopback link with SPIKERC_TRANSPORT=loopback
+from transport import BleakScanner, BleakClient
+
+from ping_monitor import PingMonitor
 
 # Nordic UART Service UUIDs
 UART_SERVICE_UUID = "6e400001-b5a3-f393-e0a9-e50e24dcca9e"
@@ -14,13 +19,42 @@ UART_TX_CHAR_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"  # Read from this cha
 # Set threading model to MTA before importing bleak
 sys.coinit_flags = 0
 
+# Created once connected, takes ping echoes out of the notifications
+pings = None
+
 def notification_handler(sender, data):
     """Handle incoming data notifications from the hub"""
+    if pings:
+        # Echoes from a Pybricks hub can arrive in pieces between printed text
+        data = pings.feed(data)
+        if not data:
+            return
     try:
         print(f"[RECEIVED]: {data.decode('utf-8').strip()}")
     except:
         print(f"[RECEIVED RAW]: {data}")
 
+async def ping_command(client, rx_char, args):
+    """ping [COUNT] | ping on [HZ] | ping off | ping stats"""
+    global pings
+    if pings is None:
+        pings = PingMonitor(client, rx_char)
+    if args[:1] == ["on"]:
+        if pings._task is None:
+            pings.rate = float(args[1]) if len(args) > 1 else 2.0
+            pings.start()
+            print(f"Pinging {pings.rate:g} times a second in the background, 'ping stats' shows the RTT")
+    elif args[:1] == ["off"]:
+        await pings.close()
+        print(pings.report())
+    elif args[:1] == ["stats"]:
+        print(pings.report())
+    else:
+        count = int(args[0]) if args else 10
+        pings.histogram.reset()
+        await pings.burst(count)
+        print(pings.report())
+
 async def main():
     # Scan for devices
     print("Scanning for BLE devices...")
@@ -125,13 +159,25 @@ async def main():
         print("  rc(0,0)  - Stop motors")
         print("  rc(50,0) - Drive forward at 50% power")
         print("  stop()   - Emergency stop")
+        print("  ping [N] - Time N round trips (default 10)")
+        print("  ping on [HZ] / ping off / ping stats - Ping in the background")
         
         while client.is_connected:
-            command = input("\nCommand> ")
+            # Read input on a thread, so notifications and background pings keep running
+            command = await asyncio.to_thread(input, "\nCommand> ")
             
             if command.lower() == 'exit':
                 break
             
+            if command.split()[:1] == ["ping"]:
+                try:
+                    await ping_command(client, rx_char, command.split()[1:])
+                except ValueError:
+                    print("Usage: ping [COUNT] | ping on [HZ] | ping off | ping stats")
+                except Exception as e:
+                    print(f"Error sending ping: {e}")
+                continue
+            
             # Send command to the hub
             print(f"[SENDING]: {command}")
             try:
@@ -147,6 +193,10 @@ async def main():
     
     finally:
         # Clean up
+        if pings:
+            await pings.close()
+            if pings.sent:
+                print(pings.report())
         if client.is_connected:
             # Unsubscribe from notifications if we were subscribed
             if tx_char:
@@ -173,12 +223,12 @@ if __name__ == "__main__":
         if sys.platform == "win32":
             asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
         
-        # Additional STA handling for Windows 
-        try:
-            from bleak.backends.winrt.util import uninitialize_sta
-            uninitialize_sta()  # undo any unwanted STA configuration
-        except ImportError:
-            pass  # not Windows or older Bleak version
+            # Additional STA handling for Windows (the module fails to import elsewhere)
+            try:
+                from bleak.backends.winrt.util import uninitialize_sta
+                uninitialize_sta()  # undo any unwanted STA configuration
+            except ImportError:
+                pass  # older Bleak version
         
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -8,6 +8,9 @@ import sys
 import time
 import argparse
 
+from controller_profiles import resolve_profile
+from control_mapping import default_mapping
+
 # Initialize pygame for controller input
 pygame.init()
 
@@ -30,6 +33,9 @@ class SimpleController:
         print(f"Controller connected: {self.controller_name}")
         print(f"Number of axes: {self.controller.get_numaxes()}")
         print(f"Number of buttons: {self.controller.get_numbuttons()}")
+        
+        # Resolve axis/button indices once for this controller model
+        self.profile = resolve_profile(self.controller, 0)
     
     def read(self):
         """Read current controller state"""
@@ -39,15 +45,9 @@ class SimpleController:
         if not self.controller:
             return 0, 0, 0, 0
         
-        # Read stick values
-        left_y = -self.controller.get_axis(1)  # Invert Y so up is positive
-        right_x = self.controller.get_axis(2) if "dualsense" in self.controller_name.lower() else self.controller.get_axis(3)
-        
-        # Read trigger and bumper
-        right_trigger = (self.controller.get_axis(5) + 1) / 2.0 if self.controller.get_numaxes() > 5 else 0  # 0 to 1
-        right_bumper = self.controller.get_button(5) if self.controller.get_numbuttons() > 5 else 0
-        
-        return left_y, right_x, right_trigger, right_bumper
+        # Plain indexed reads through the resolved profile
+        # (drive with Y inverted so up is positive, steer, trigger 0..1, bumper)
+        return self.profile.rc_controls(self.controller)
     
     def close(self):
         """Clean up pygame resources"""
@@ -56,12 +56,8 @@ class SimpleController:
 
 async def main():
     # Create print function for the REPL
-    def print_pybricks_command(drive_value, steer_value):
-        """Print command in format for Pybricks REPL"""
-        # Scale values to the -100 to 100 range
-        drive_power = max(-100, min(100, int(drive_value * 100)))
-        steer_power = max(-100, min(100, int(steer_value * 100)))
-        
+    def print_pybricks_command(drive_power, steer_power):
+        """Print command in format for Pybricks REPL (powers are -100 to 100)"""
         # Format command to be directly pasted into REPL
         print(f"\rCommands: drive_motor.dc({drive_power}); steering_motor.dc({steer_power})       ", end="")
     
@@ -83,7 +79,7 @@ async def main():
     print("Press right bumper (R1) or Ctrl+C to exit.")
     
     try:
-        deadband = 0.1  # Ignore small stick movements
+        mapping = default_mapping()  # Deadband, trigger boost and steering limit
         
         while True:
             # Read controller values
@@ -95,19 +91,11 @@ async def main():
                 print("drive_motor.stop(); steering_motor.stop()")
                 break
             
-            # Apply deadband
-            if abs(drive) < deadband:
-                drive = 0
-            if abs(steer) < deadband:
-                steer = 0
-            
-            # Apply power scaling
-            power_scale = 0.3 + (trigger * 0.7)  # Scale from 30% to 100% based on trigger
-            final_drive = drive * power_scale
-            final_steer = steer * 0.7  # Limit steering to 70% to protect mechanisms
+            # Deadband, 30-100% trigger boost and 70% steering limit in one call
+            drive_power, steer_power, _ = mapping.map(drive, steer, trigger)
             
             # Output REPL command
-            print_pybricks_command(final_drive, final_steer)
+            print_pybricks_command(drive_power, steer_power)
             
             # Small delay
             await asyncio.sleep(0.1)
@@ -0,0 +1,361 @@
+# evdev input backend for headless Linux hosts
+# Reads gamepad events from /dev/input/event* with an asyncio reader and
+# never imports pygame, so there is no video/audio/font initialization cost.
+# No extra packages are needed: input_event structs are decoded with struct
+# and axis ranges are queried with the EVIOCGABS ioctl.
+#
+# Compare startup time and memory against the pygame backend with:
+#   python evdev_controller.py --startup-benchmark
+
+import argparse
+import asyncio
+import fcntl
+import glob
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from controller_state import (StatePublisher, hat_buttons, BTN_CROSS, BTN_CIRCLE,
+                              BTN_SQUARE, BTN_TRIANGLE, BTN_L1, BTN_R1)
+from input_engine import InputChannel
+
+# struct input_event { struct timeval time; __u16 type; __u16 code; __s32 value; }
+INPUT_EVENT = struct.Struct("llHHi")
+# struct input_absinfo { value, minimum, maximum, fuzz, flat, resolution }
+INPUT_ABSINFO = struct.Struct("6i")
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0
+
+ABS_X = 0x00
+ABS_Y = 0x01
+ABS_Z = 0x02
+ABS_RX = 0x03
+ABS_RY = 0x04
+ABS_RZ = 0x05
+ABS_HAT0X = 0x10
+ABS_HAT0Y = 0x11
+
+BTN_SOUTH = 0x130
+BTN_EAST = 0x131
+BTN_NORTH = 0x133
+BTN_WEST = 0x134
+BTN_TL = 0x136
+BTN_TR = 0x137
+
+# Linux gamepad API layout (hid-playstation, xpad, hid-generic with quirks)
+STICK_CODES = (ABS_X, ABS_Y, ABS_RX, ABS_RY)
+TRIGGER_CODES = (ABS_Z, ABS_RZ)
+KEY_BITS = {
+    BTN_SOUTH: BTN_CROSS,
+    BTN_EAST: BTN_CIRCLE,
+    BTN_WEST: BTN_SQUARE,
+    BTN_NORTH: BTN_TRIANGLE,
+    BTN_TL: BTN_L1,
+    BTN_TR: BTN_R1,
+}
+
+# Read up to this many events per wakeup
+_READ_SIZE = INPUT_EVENT.size * 64
+
+
+def _eviocgabs(code):
+    """ioctl number for EVIOCGABS(code) = _IOR('E', 0x40 + code, input_absinfo)"""
+    return (2 << 30) | (INPUT_ABSINFO.size << 16) | (ord("E") << 8) | (0x40 + code)
+
+
+def _bitmap_has(bitmap, bit):
+    """Check a bit in a sysfs capability bitmap ('ffff 0 1f...', MSB word first)"""
+    words = bitmap.split()
+    word_bits = struct.calcsize("l") * 8
+    index = len(words) - 1 - bit // word_bits
+    if index < 0:
+        return False
+    return bool(int(words[index], 16) >> (bit % word_bits) & 1)
+
+
+def find_gamepad_event_device():
+    """Return (path, name) of the first /dev/input/event* gamepad, or (None, None)"""
+    for sysfs in sorted(glob.glob("/sys/class/input/event*"),
+                        key=lambda p: int(p.rsplit("event", 1)[1])):
+        try:
+            with open(os.path.join(sysfs, "device", "capabilities", "key")) as f:
+                keys = f.read()
+            with open(os.path.join(sysfs, "device", "name")) as f:
+                name = f.read().strip()
+        except OSError:
+            continue
+        # A gamepad reports BTN_SOUTH (BTN_GAMEPAD); motion sensor and
+        # touchpad sub-devices of the same pad do not
+        if _bitmap_has(keys, BTN_SOUTH):
+            return os.path.join("/dev/input", os.path.basename(sysfs)), name
+    return None, None
+
+
+class EvdevController:
+    """Gamepad backend reading /dev/input/event* through an asyncio reader
+
+    Exposes the same interface as the pygame PS5Controller: controller,
+    controller_name, state, read(), wait_for_change() and close(). Events are
+    folded into raw state and one ControllerState is published per
+    SYN_REPORT, so every snapshot is a complete frame from the kernel.
+
+    Create it inside a running asyncio loop to share that loop; otherwise
+    it starts its own loop on a daemon thread.
+    """
+    def __init__(self, device=None):
+        self.states = StatePublisher()
+        self.channel = InputChannel()
+        self.event_count = 0
+        self._fd = None
+        self._loop = None
+        self._thread = None
+
+        if device:
+            self.device, self.controller_name = device, device
+        else:
+            self.device, self.controller_name = find_gamepad_event_device()
+        if not self.device:
+            print("No gamepad found on /dev/input/event*. Is it connected, and can you read the device?")
+            self.controller = None
+            return
+
+        try:
+            self._fd = os.open(self.device, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError as e:
+            print(f"Cannot open {self.device}: {e}")
+            print("Add your user to the 'input' group or run with permission to read event devices.")
+            self.controller = None
+            return
+
+        self.controller = self.device
+        print(f"Controller connected: {self.controller_name} ({self.device})")
+
+        # Axis ranges, so values can be normalized like pygame's -1..1 / 0..1
+        self._ranges = {}
+        for code in STICK_CODES + TRIGGER_CODES:
+            self._ranges[code] = self._abs_range(code)
+
+        # Raw state, updated per event and published on SYN_REPORT
+        self._sticks = {code: 0.0 for code in STICK_CODES}
+        self._triggers = {code: 0.0 for code in TRIGGER_CODES}
+        self._hat = [0, 0]
+        self._keys = 0
+        self._dirty = True
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            self._attach(loop)
+        else:
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_own_loop, args=(ready,))
+            self._thread.daemon = True
+            self._thread.start()
+            ready.wait()
+
+    @property
+    def state(self):
+        """Most recent ControllerState snapshot"""
+        return self.states.state
+
+    def _abs_range(self, code):
+        """Return (minimum, maximum) for an absolute axis, or None if absent"""
+        buffer = bytearray(INPUT_ABSINFO.size)
+        try:
+            fcntl.ioctl(self._fd, _eviocgabs(code), buffer)
+        except OSError:
+            return None
+        value, minimum, maximum, _, _, _ = INPUT_ABSINFO.unpack(buffer)
+        if maximum <= minimum:
+            return None
+        return minimum, maximum
+
+    def _attach(self, loop):
+        self._loop = loop
+        loop.add_reader(self._fd, self._on_readable)
+        self._publish()
+
+    def _run_own_loop(self, ready):
+        """Thread method for when no asyncio loop is running yet"""
+        loop = asyncio.new_event_loop()
+        self._attach(loop)
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _on_readable(self):
+        """asyncio reader callback, decodes every queued input_event"""
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Controller error: {e}")
+            self._loop.remove_reader(self._fd)
+            return
+
+        for offset in range(0, len(data) - INPUT_EVENT.size + 1, INPUT_EVENT.size):
+            _, _, ev_type, code, value = INPUT_EVENT.unpack_from(data, offset)
+            if ev_type == EV_SYN:
+                if code == SYN_REPORT and self._dirty:
+                    self._publish()
+            elif ev_type == EV_ABS:
+                self._on_abs(code, value)
+            elif ev_type == EV_KEY and code in KEY_BITS:
+                bit = KEY_BITS[code]
+                self._keys = self._keys | bit if value else self._keys & ~bit
+                self._dirty = True
+            self.event_count += 1
+
+    def _on_abs(self, code, value):
+        if code in self._sticks:
+            limits = self._ranges[code]
+            if limits:
+                center = (limits[0] + limits[1]) / 2.0
+                self._sticks[code] = (value - center) / ((limits[1] - limits[0]) / 2.0)
+        elif code in self._triggers:
+            limits = self._ranges[code]
+            if limits:
+                self._triggers[code] = (value - limits[0]) / float(limits[1] - limits[0])
+        elif code == ABS_HAT0X:
+            self._hat[0] = value
+        elif code == ABS_HAT0Y:
+            # evdev reports up as -1, pygame hats report up as +1
+            self._hat[1] = -value
+        else:
+            return
+        self._dirty = True
+
+    def _publish(self):
+        self._dirty = False
+        sticks = self._sticks
+        state = self.states.publish(
+            sticks[ABS_X], sticks[ABS_Y], sticks[ABS_RX], sticks[ABS_RY],
+            self._triggers[ABS_Z], self._triggers[ABS_RZ],
+            self._keys | hat_buttons(self._hat),
+        )
+        self.channel.publish(state)
+
+    def read(self):
+        """Return RC control values [drive, steer, boost, stop]"""
+        # Take one snapshot so every value comes from the same frame
+        return self.states.state.rc_controls()
+
+    async def wait_for_change(self, timeout=None):
+        """Wait until the controller reports a change, then return read()"""
+        await self.channel.wait(timeout)
+        return self.read()
+
+    def close(self):
+        """Stop reading and release the device"""
+        if self._fd is None:
+            return
+        loop = self._loop
+        if self._thread:
+            loop.call_soon_threadsafe(loop.remove_reader, self._fd)
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(timeout=1.0)
+        elif loop and not loop.is_closed():
+            loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+
+# Startup snippets for the comparison, each prints "<seconds> <max RSS KiB>"
+_STARTUP_SNIPPETS = {
+    "pygame (pygame.init + joystick)": (
+        "import time, resource; t = time.perf_counter()\n"
+        "import os; os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'\n"
+        "import pygame; pygame.init(); pygame.joystick.init()\n"
+        "n = pygame.joystick.get_count()\n"
+        "j = pygame.joystick.Joystick(0) if n else None\n"
+        "j and j.init()\n"
+        "print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+    ),
+    "evdev (no pygame)": (
+        "import time, resource; t = time.perf_counter()\n"
+        "import evdev_controller\n"
+        "path, name = evdev_controller.find_gamepad_event_device()\n"
+        "c = evdev_controller.EvdevController(path) if path else None\n"
+        "c and c.close()\n"
+        "print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+    ),
+}
+
+
+def compare_startup(runs=5):
+    """Time backend startup in fresh interpreters and print a comparison"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=here + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    print(f"Backend startup, median of {runs} fresh interpreters:")
+    print(f"{'backend':<34} {'import+init':>12} {'process':>10} {'max RSS':>10}")
+    for label, snippet in _STARTUP_SNIPPETS.items():
+        inner, total, rss = [], [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", snippet], env=env, cwd=here,
+                                    capture_output=True, text=True)
+            total.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                print(f"{label:<34} failed: {result.stderr.strip().splitlines()[-1:]}")
+                break
+            seconds, kib = result.stdout.split()[-2:]
+            inner.append(float(seconds))
+            rss.append(int(kib))
+        else:
+            inner.sort()
+            total.sort()
+            rss.sort()
+            print(f"{label:<34} {inner[runs // 2] * 1000:>10.1f}ms {total[runs // 2] * 1000:>8.1f}ms {rss[runs // 2] / 1024:>8.1f}MB")
+
+
+async def _show(controller):
+    while True:
+        state = controller.state
+        drive, steer, boost, stop = state.rc_controls()
+        print(f"\r#{state.seq:6d} | Drive: {drive:+.2f} | Steer: {steer:+.2f} | Boost: {boost:.2f} | Stop: {stop}   ", end="")
+        await controller.wait_for_change(timeout=1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="evdev gamepad backend (Linux, no pygame)")
+    parser.add_argument("--device", help="event device (default: first gamepad)")
+    parser.add_argument("--startup-benchmark", action="store_true",
+                        help="Compare startup time against the pygame backend")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per backend for --startup-benchmark")
+    args = parser.parse_args()
+
+    if args.startup_benchmark:
+        compare_startup(args.runs)
+        return
+
+    async def run():
+        controller = EvdevController(args.device)
+        if not controller.controller:
+            sys.exit(1)
+        try:
+            await _show(controller)
+        finally:
+            controller.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\nExiting...")
+
+
+if __name__ == "__main__":
+    main()
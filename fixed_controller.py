@@ -10,12 +10,20 @@ sys.coinit_flags = 0  # Use Multi-Threaded Apartment (MTA) model instead of STA
 
 # Now we can safely import pygame and bleak
 import asyncio
+import struct
 from bleak import BleakScanner, BleakClient
 
 # Nordic UART Service UUIDs
 UART_SERVICE_UUID = "6e400001-b5a3-f393-e0a9-e50e24dcca9e"
 UART_RX_CHAR_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"  # Write to this characteristic
 
+# Binary frames for pybricks_uart_receiver.py (same format as rc_protocol.py):
+# 0xA5, type (1 = drive, 2 = stop), drive int8, steer int8, checksum (sum of bytes 0-3)
+def rc_frame(msg, drive, steer):
+    return struct.pack("<BBbbB", 0xA5, msg, drive, steer, (0xA5 + msg + (drive & 0xFF) + (steer & 0xFF)) & 0xFF)
+
+STOP_FRAME = rc_frame(2, 0, 0)
+
 # Initialize pygame for controller
 
 sys.coinit_flags = 0  # Use Multi-Threaded Apartment (MTA) model instead of STA
@@ -68,10 +76,13 @@ async def main():
             
             # Find UART service and RX characteristic
             rx_char = None
+            rc_response = True
             for service in client.services:
                 for char in service.characteristics:
                     if UART_RX_CHAR_UUID.lower() in char.uuid.lower():
                         rx_char = char.uuid
+                        # Stream drive frames without response when allowed, stop stays acknowledged
+                        rc_response = "write-without-response" not in char.properties
                         break
                 if rx_char:
                     break
@@ -113,7 +124,7 @@ async def main():
                     # Check emergency stop
                     if right_bumper:
                         print("\nEmergency stop")
-                        await client.write_gatt_char(rx_char, "stop()\n".encode())
+                        await client.write_gatt_char(rx_char, STOP_FRAME, response=True)
                         break
                     
                     # Apply deadband
@@ -126,8 +137,8 @@ async def main():
                     steer_power = int(right_x * 0.7 * 100)
                     
                     # Send command
-                    command = f"rc({drive_power},{steer_power})\n"
-                    await client.write_gatt_char(rx_char, command.encode())
+                    command = rc_frame(1, max(-100, min(100, drive_power)), max(-100, min(100, steer_power)))
+                    await client.write_gatt_char(rx_char, command, response=rc_response)
                     
                     # Print status
                     print(f"\rDrive: {drive_power:4d} | Steer: {steer_power:4d} | Power: {int(power_scale*100):3d}%", end="")
@@ -139,7 +150,7 @@ async def main():
             
             # Send stop before disconnecting
             try:
-                await client.write_gatt_char(rx_char, "stop()\n".encode())
+                await client.write_gatt_char(rx_char, STOP_FRAME, response=True)
                 print("\nMotors stopped")
             except:
                 pass
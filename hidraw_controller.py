@@ -0,0 +1,308 @@
+# Raw hidraw DualSense reader (Linux only)
+# Reads DualSense HID input reports straight from /dev/hidraw*, skipping the
+# buffering and resampling that SDL and the 'inputs' library add on top of
+# the pad's native report rate. Reports are read into one preallocated
+# buffer and parsed in place through a memoryview.
+#
+# Reports can be captured to a file and replayed later, so the parser and
+# everything downstream can be tested without the physical controller:
+#   python hidraw_controller.py --capture pad.dshr --seconds 10
+#   python hidraw_controller.py --replay pad.dshr
+
+import argparse
+import glob
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from controller_state import (StatePublisher, BTN_CROSS, BTN_CIRCLE, BTN_SQUARE,
+                              BTN_TRIANGLE, BTN_L1, BTN_R1, BTN_DPAD_UP,
+                              BTN_DPAD_DOWN, BTN_DPAD_LEFT, BTN_DPAD_RIGHT)
+from input_engine import InputChannel
+
+SONY_VENDOR_ID = 0x054C
+DUALSENSE_PRODUCT_IDS = (0x0CE6, 0x0DF2)  # DualSense, DualSense Edge
+
+# Largest DualSense input report (Bluetooth 0x31) is 78 bytes
+REPORT_BUFFER_SIZE = 128
+
+# Byte offsets (including the report ID) of
+# (left x, left y, right x, right y, L2, R2, buttons0, buttons1)
+_LAYOUT_USB = (1, 2, 3, 4, 5, 6, 8, 9)            # 0x01, 64 bytes over USB
+_LAYOUT_BT_FULL = (2, 3, 4, 5, 6, 7, 9, 10)       # 0x31, 78 bytes over Bluetooth
+_LAYOUT_BT_SIMPLE = (1, 2, 3, 4, 8, 9, 5, 6)      # 0x01, 10 bytes before full mode
+
+# buttons0 high nibble
+_FACE_BITS = ((0x10, BTN_SQUARE), (0x20, BTN_CROSS), (0x40, BTN_CIRCLE), (0x80, BTN_TRIANGLE))
+
+# buttons0 low nibble is the D-pad direction, 8 (or more) means released
+_DPAD_BITS = (
+    BTN_DPAD_UP,
+    BTN_DPAD_UP | BTN_DPAD_RIGHT,
+    BTN_DPAD_RIGHT,
+    BTN_DPAD_DOWN | BTN_DPAD_RIGHT,
+    BTN_DPAD_DOWN,
+    BTN_DPAD_DOWN | BTN_DPAD_LEFT,
+    BTN_DPAD_LEFT,
+    BTN_DPAD_UP | BTN_DPAD_LEFT,
+)
+
+# Capture file format: magic, then (timestamp_ns, length) headers each
+# followed by the raw report bytes
+CAPTURE_MAGIC = b"DSHR\x01"
+_RECORD_HEADER = struct.Struct("<QH")
+
+
+def report_layout(report, length):
+    """Return the offset layout for a report, or None if it isn't an input report"""
+    report_id = report[0]
+    if report_id == 0x31 and length >= 11:
+        return _LAYOUT_BT_FULL
+    if report_id == 0x01 and length >= 64:
+        return _LAYOUT_USB
+    if report_id == 0x01 and length >= 10:
+        return _LAYOUT_BT_SIMPLE
+    return None
+
+
+def parse_report(report, layout, publisher):
+    """Publish a ControllerState from one report (a memoryview, no copies)"""
+    lx, ly, rx, ry, l2, r2, b0, b1 = layout
+    buttons0 = report[b0]
+    buttons1 = report[b1]
+
+    pressed = 0
+    for mask, bit in _FACE_BITS:
+        if buttons0 & mask:
+            pressed |= bit
+    dpad = buttons0 & 0x0F
+    if dpad < 8:
+        pressed |= _DPAD_BITS[dpad]
+    if buttons1 & 0x01:
+        pressed |= BTN_L1
+    if buttons1 & 0x02:
+        pressed |= BTN_R1
+
+    # Sticks are 0..255 with 128 at rest, triggers 0..255
+    return publisher.publish(
+        (report[lx] - 128) / 128.0,
+        (report[ly] - 128) / 128.0,
+        (report[rx] - 128) / 128.0,
+        (report[ry] - 128) / 128.0,
+        report[l2] / 255.0,
+        report[r2] / 255.0,
+        pressed,
+    )
+
+
+def find_dualsense_hidraw():
+    """Return the /dev/hidraw* path of the first DualSense, or None"""
+    for uevent in sorted(glob.glob("/sys/class/hidraw/hidraw*/device/uevent")):
+        try:
+            with open(uevent) as f:
+                fields = dict(line.strip().split("=", 1) for line in f if "=" in line)
+        except OSError:
+            continue
+
+        # HID_ID=<bus>:<vendor>:<product>, all hex
+        try:
+            _, vendor, product = (int(x, 16) for x in fields.get("HID_ID", "").split(":"))
+        except ValueError:
+            continue
+        if vendor == SONY_VENDOR_ID and product in DUALSENSE_PRODUCT_IDS:
+            node = uevent.split("/")[4]
+            return os.path.join("/dev", node)
+    return None
+
+
+def read_capture(path):
+    """Yield (timestamp_ns, report_bytes) records from a capture file"""
+    with open(path, "rb") as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a DualSense report capture")
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            timestamp_ns, length = _RECORD_HEADER.unpack(header)
+            report = f.read(length)
+            if len(report) < length:
+                return
+            yield timestamp_ns, report
+
+
+class HidrawDualSense:
+    """DualSense backend reading raw HID reports on a dedicated thread
+
+    Exposes the same interface as the pygame PS5Controller: controller,
+    controller_name, state, read(), wait_for_change() and close(). Pass
+    replay= to feed a capture file instead of a device, realtime=False to
+    replay it as fast as possible.
+    """
+    # Wake-up interval used only to notice close(), not to poll the device
+    IDLE_TIMEOUT_MS = 100
+
+    def __init__(self, device=None, replay=None, realtime=True, capture=None):
+        self.states = StatePublisher()
+        self.channel = InputChannel()
+        self.replay = replay
+        self.realtime = realtime
+        self.report_count = 0
+        self._last_controls = None
+        self._capture_file = None
+        self._fd = None
+
+        if replay:
+            self.device = replay
+            self.controller_name = f"DualSense replay ({os.path.basename(replay)})"
+        else:
+            self.device = device or find_dualsense_hidraw()
+            if not self.device:
+                print("No DualSense found on /dev/hidraw*. Is it connected, and can you read the device?")
+                self.controller = None
+                return
+            try:
+                self._fd = os.open(self.device, os.O_RDONLY)
+            except OSError as e:
+                print(f"Cannot open {self.device}: {e}")
+                print("Add a udev rule or run with permission to read hidraw devices.")
+                self.controller = None
+                return
+            self.controller_name = f"DualSense ({self.device})"
+
+        if capture:
+            self._capture_file = open(capture, "wb")
+            self._capture_file.write(CAPTURE_MAGIC)
+
+        self.controller = self.device
+        print(f"Controller connected: {self.controller_name}")
+
+        self.running = True
+        self.thread = threading.Thread(target=self._replay_reports if replay else self._read_reports)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def state(self):
+        """Most recent ControllerState snapshot"""
+        return self.states.state
+
+    def _handle_report(self, report, length):
+        """Parse one report and publish it if the controls changed"""
+        layout = report_layout(report, length)
+        if layout is None:
+            return
+        self.report_count += 1
+
+        # Sensor fields change in every report; only wake consumers when a
+        # stick, trigger or button byte actually moved
+        lx, ly, rx, ry, l2, r2, b0, b1 = layout
+        controls = (report[lx], report[ly], report[rx], report[ry],
+                    report[l2], report[r2], report[b0], report[b1])
+        if controls == self._last_controls:
+            return
+        self._last_controls = controls
+
+        self.channel.publish(parse_report(report, layout, self.states))
+
+    def _read_reports(self):
+        """Thread method that blocks on the hidraw device"""
+        buffer = bytearray(REPORT_BUFFER_SIZE)
+        report = memoryview(buffer)
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        while self.running:
+            try:
+                # Timeout only so close() is noticed; reports wake us immediately
+                if not poller.poll(self.IDLE_TIMEOUT_MS):
+                    continue
+                length = os.readv(self._fd, [buffer])
+            except OSError as e:
+                if self.running:
+                    print(f"Controller error: {e}")
+                break
+            if length <= 0:
+                continue
+            if self._capture_file:
+                self._capture_file.write(_RECORD_HEADER.pack(time.monotonic_ns(), length))
+                self._capture_file.write(report[:length])
+            self._handle_report(report, length)
+
+    def _replay_reports(self):
+        """Thread method that feeds a capture file through the parser"""
+        start_ns = time.monotonic_ns()
+        first_ns = None
+        for timestamp_ns, data in read_capture(self.replay):
+            if not self.running:
+                break
+            if self.realtime:
+                if first_ns is None:
+                    first_ns = timestamp_ns
+                delay = (timestamp_ns - first_ns) - (time.monotonic_ns() - start_ns)
+                if delay > 0:
+                    time.sleep(delay / 1e9)
+            self._handle_report(memoryview(data), len(data))
+        self.running = False
+
+    def read(self):
+        """Return RC control values [drive, steer, boost, stop]"""
+        # Take one snapshot so every value comes from the same frame
+        return self.states.state.rc_controls()
+
+    async def wait_for_change(self, timeout=None):
+        """Wait until the controller reports a change, then return read()"""
+        await self.channel.wait(timeout)
+        return self.read()
+
+    def close(self):
+        """Stop the reader and release the device"""
+        self.running = False
+        if self.controller and self.thread.is_alive():
+            self.thread.join(timeout=1.0)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._capture_file:
+            self._capture_file.close()
+            self._capture_file = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raw hidraw DualSense reader")
+    parser.add_argument("--device", help="hidraw device (default: auto-detect)")
+    parser.add_argument("--capture", help="Write raw reports to this file")
+    parser.add_argument("--seconds", type=float, default=0, help="Stop capturing after this many seconds")
+    parser.add_argument("--replay", help="Replay a capture file instead of reading a device")
+    parser.add_argument("--fast", action="store_true", help="Replay as fast as possible")
+    args = parser.parse_args()
+
+    if not args.replay and not sys.platform.startswith("linux"):
+        print("hidraw is only available on Linux")
+        sys.exit(1)
+
+    pad = HidrawDualSense(device=args.device, replay=args.replay,
+                          realtime=not args.fast, capture=args.capture)
+    if not pad.controller:
+        sys.exit(1)
+
+    start = time.monotonic()
+    try:
+        while pad.running:
+            state = pad.state
+            drive, steer, boost, stop = state.rc_controls()
+            print(f"\r#{state.seq:6d} | Drive: {drive:+.2f} | Steer: {steer:+.2f} | Boost: {boost:.2f} | Stop: {stop} | Reports: {pad.report_count}", end="")
+            if args.seconds and time.monotonic() - start >= args.seconds:
+                break
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pad.close()
+        print(f"\nReports read: {pad.report_count}, state changes: {pad.state.seq}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,867 @@
+# Hub emulator - runs the hub programs unmodified on the computer
+# robot_python_code.py, bare_minimum_3_4_3.py, pybricks_uart_receiver.py and
+# pybricks_ble_robot.py import modules that only exist on the brick (hub,
+# motor, bluetooth, runloop, micropython, pybricks.*, usys, uselect). The
+# emulator provides those to the program it runs, and nothing else sees
+# them:
+#   - motors with simple first-order dynamics (speed, position)
+#   - bluetooth.BLE (SPIKE) and stdin/stdout (Pybricks) connected to the
+#     loopback link in transport.py, or to a built-in virtual host
+#   - time.ticks_ms/sleep_ms and pybricks.tools wait/StopWatch on the
+#     emulator clock, which runs in real time, as fast as possible, or in
+#     turns with the host on a virtual_time.VirtualClock
+#   - display, light and sound calls recorded in HubEmulator.calls
+#
+# Run a hub program against a virtual host that drives it for 10 s of hub
+# time, as fast as the computer allows, and print the loop cost:
+#   python hub_emulator.py robot_python_code.py
+#   python hub_emulator.py pybricks_uart_receiver.py --seconds 60 --speed 1
+#
+# Or drive it from a host script over the loopback link, in real time:
+#   SPIKERC_TRANSPORT=loopback SPIKERC_HUB=robot_python_code.py python pygame_uart_example.py
+
+import argparse
+import builtins
+import heapq
+import math
+import os
+import struct
+import sys
+import threading
+import time
+import traceback
+import types
+from collections import Counter, deque
+
+from rc_protocol import SPIKE_FRAME, SPIKE_FRAME_VERSION, drive_frame
+from virtual_time import real_perf_counter
+
+# MicroPython bluetooth IRQ numbers (current numbering, with FLAG_INDICATE)
+_IRQ_CENTRAL_CONNECT = 1
+_IRQ_CENTRAL_DISCONNECT = 2
+_IRQ_GATTS_WRITE = 3
+_IRQ_MTU_EXCHANGED = 21
+# Older bluetooth module on SPIKE Prime: bit flags, no MTU exchange event
+_OLD_IRQ_CENTRAL_CONNECT = 1 << 0
+_OLD_IRQ_CENTRAL_DISCONNECT = 1 << 1
+_OLD_IRQ_GATTS_WRITE = 1 << 2
+
+_CONN_HANDLE = 1
+_DEFAULT_MTU = 23
+
+# ticks_ms() and ticks_us() wrap like on MicroPython
+_TICKS_MASK = (1 << 30) - 1
+_TICKS_HALF = 1 << 29
+
+
+class _Stop(BaseException):
+    """Raised inside the hub program to end it"""
+
+
+class Motor:
+    """A motor with first-order dynamics
+
+    Speed approaches power / 100 * MAX_SPEED with time constant TAU_MS, and
+    position is its exact integral, both brought up to date on every call.
+    """
+    MAX_SPEED = 1000    # deg/s at full power
+    TAU_MS = 60
+
+    def __init__(self, clock):
+        self._clock = clock
+        self._t = clock()
+        self.power = 0
+        self.speed = 0.0
+        self.position = 0.0
+
+    def _update(self):
+        now = self._clock()
+        dt = (now - self._t) / 1e6
+        self._t = now
+        if dt <= 0:
+            return
+        target = self.power / 100 * self.MAX_SPEED
+        tau = self.TAU_MS / 1000
+        decay = math.exp(-dt / tau)
+        self.position += target * dt + (self.speed - target) * tau * (1 - decay)
+        self.speed = target + (self.speed - target) * decay
+
+    def set_power(self, power):
+        self._update()
+        self.power = max(-100, min(100, power))
+
+    def angle(self):
+        self._update()
+        return int(self.position)
+
+    def velocity(self):
+        self._update()
+        return int(self.speed)
+
+
+class _MpBytes(bytes):
+    """bytes that, like MicroPython's, can be joined with a str"""
+    def __add__(self, other):
+        if isinstance(other, str):
+            other = other.encode()
+        return _MpBytes(bytes.__add__(self, other))
+
+
+class _Stdin:
+    """Pybricks stdin, fed by writes from the host"""
+    def __init__(self, emulator):
+        self.buffer = self
+        self._emulator = emulator
+        self._data = bytearray()
+        self._lock = threading.Lock()
+
+    def feed(self, data):
+        char = self._emulator.interrupt_char
+        if char >= 0 and char in data:
+            # Like the hub: the interrupt character never reaches the program,
+            # it raises KeyboardInterrupt there instead
+            data = bytes(data).replace(bytes((char,)), b"")
+            self._emulator.interrupt()
+        with self._lock:
+            self._data += data
+
+    def available(self):
+        return len(self._data)
+
+    def read(self, n=1):
+        # Blocks like the real stdin until n bytes have arrived
+        while len(self._data) < n:
+            self._emulator.sleep_us(1000)
+        with self._lock:
+            data = bytes(self._data[:n])
+            del self._data[:n]
+        return data
+
+
+class _Stdout:
+    """Pybricks stdout, sent to the host as notifications"""
+    def __init__(self, emulator):
+        self.buffer = self
+        self._emulator = emulator
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._emulator.output(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class _Recorder:
+    """Any attribute is a function that records its call"""
+    def __init__(self, emulator, name, **methods):
+        self._emulator = emulator
+        self._name = name
+        for method, fn in methods.items():
+            setattr(self, method, fn)
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        name = f"{self._name}.{method}"
+        return lambda *args, **kwargs: self._emulator.record(name, args, kwargs)
+
+
+class HubEmulator:
+    """Runs one hub program on a thread with emulated brick modules
+
+    The hub end of a transport.LoopbackClient link: connected(),
+    received() and disconnected() are called from the link, notifications
+    go back with link.notify(). Bluetooth IRQs and micropython.schedule()
+    callbacks run on the program's thread whenever it sleeps.
+
+    speed is how many times faster than real time the clock runs; 0 runs
+    as fast as possible, with time only moving while the program sleeps.
+    With a virtual_time.VirtualClock as clock the program shares the host
+    loop's virtual time instead and runs only while the loop waits.
+
+    indicate=False emulates the older bluetooth module on SPIKE Prime: no
+    FLAG_INDICATE, bit-flag IRQ numbers and no MTU exchange event, so the
+    program never learns the negotiated MTU. ble.config('mtu') returns the
+    configured value either way, like the firmware.
+    """
+    def __init__(self, path, speed=1.0, clock=None, indicate=True):
+        self.path = path
+        self.clock = clock
+        self.indicate = indicate
+        with open(path) as f:
+            self.source = f.read()
+        self.pybricks = is_pybricks(self.source)
+        self.speed = speed
+        self.calls = deque(maxlen=10000)    # (hub ms, name, args) of recorded calls
+        self.call_counts = Counter()
+        self.buttons = set()                 # Buttons held down, for hub.buttons.pressed()
+        self.broadcasts = {}                 # Pybricks channel -> (hub ms, data) for ble.observe
+        self.motors = {}
+        self.link = None
+        self.error = None
+        self._now_us = 0
+        self._real_start = real_perf_counter()
+        self._events = deque()
+        self._wake = threading.Event()
+        self._timers = []
+        self._timer_count = 0
+        self._scheduled = deque()
+        self._in_irq = False
+        self.interrupt_char = 3             # micropython.kbd_intr(), -1 when off
+        self._interrupted = False
+        self._stopping = False
+        self._stop_at = None
+        self._thread = None
+        # Loop cost: real time the program ran between sleeps
+        self.sleeps = 0
+        self.busy_total = 0.0
+        self.busy_max = 0.0
+        self._woke = None
+        # Bluetooth (SPIKE programs)
+        self._irq = None
+        self._values = {}
+        self._rx_handle = None
+        self._config = {"gap_name": "SPIKE", "mtu": _DEFAULT_MTU}
+        self._console = ""
+        self.stdin = _Stdin(self)
+        self.stdout = _Stdout(self)
+        self.modules = self._build_modules()
+        self._builtins = dict(vars(builtins))
+        self._builtins["__import__"] = self._import
+        self._builtins["print"] = self.print
+
+    # ----- Clock ----- #
+
+    def now_us(self):
+        if self.clock:
+            return round(self.clock.now * 1e6)
+        if self.speed:
+            return int((real_perf_counter() - self._real_start) * self.speed * 1e6)
+        return self._now_us
+
+    def now_ms(self):
+        return self.now_us() // 1000
+
+    def at(self, delay_ms, fn):
+        """Call fn on the program's thread after delay_ms of hub time"""
+        self._timer_count += 1
+        heapq.heappush(self._timers, (self.now_us() + int(delay_ms * 1000), self._timer_count, fn))
+
+    def sleep_us(self, us):
+        """Let hub time pass, delivering IRQs, timers and scheduled callbacks"""
+        if self._stopping and not self._in_irq and self.now_us() >= self._stop_at:
+            raise _Stop()
+        nested = self._in_irq
+        if self._interrupted and not nested:
+            self._interrupted = False
+            raise KeyboardInterrupt()
+        if not nested:
+            if self._woke is not None:
+                busy = real_perf_counter() - self._woke
+                self.sleeps += 1
+                self.busy_total += busy
+                if busy > self.busy_max:
+                    self.busy_max = busy
+        end = self.now_us() + max(0, int(us))
+        if self.clock:
+            while True:
+                now = self.now_us()
+                self._run_timers(now)
+                if not nested:
+                    self._deliver()
+                if now >= end:
+                    break
+                wake = min(end, self._timers[0][0]) if self._timers else end
+                self.clock.hub_wait(wake / 1e6, None if nested else self._has_irq_work)
+        elif self.speed:
+            real_end = real_perf_counter() + max(0, us) / 1e6 / self.speed
+            while True:
+                self._run_timers(self.now_us())
+                if not nested:
+                    self._deliver()
+                remaining = real_end - real_perf_counter()
+                if remaining <= 0:
+                    break
+                self._wake.wait(min(remaining, self._next_timer_s()))
+                self._wake.clear()
+        else:
+            while self._timers and self._timers[0][0] <= end:
+                self._now_us = max(self._now_us, self._timers[0][0])
+                self._run_timers(self._now_us)
+                if not nested:
+                    self._deliver()
+            self._now_us = end
+            if not nested:
+                self._deliver()
+        if not nested:
+            self._woke = real_perf_counter()
+
+    def _has_irq_work(self):
+        return bool(self._events) and self._irq is not None
+
+    def _next_timer_s(self):
+        if not self._timers:
+            return 0.05
+        return max(0, (self._timers[0][0] - self.now_us()) / 1e6 / self.speed)
+
+    def _run_timers(self, now):
+        while self._timers and self._timers[0][0] <= now:
+            _, _, fn = heapq.heappop(self._timers)
+            fn()
+
+    # ----- Events from the link ----- #
+
+    def connected(self, link):
+        self.link = link
+        if self.pybricks:
+            return
+        self._post(("connect",))
+        mtu = min(self._config["mtu"], getattr(link, "mtu_size", _DEFAULT_MTU))
+        if mtu > _DEFAULT_MTU:
+            self._post(("mtu", mtu))
+
+    def received(self, data):
+        if self.pybricks:
+            self.stdin.feed(data)
+            self._wake.set()
+        else:
+            self._post(("write", bytes(data)))
+
+    def disconnected(self):
+        self.link = None
+        if not self.pybricks:
+            self._post(("disconnect",))
+
+    def interrupt(self):
+        """Raise KeyboardInterrupt in the program at its next sleep"""
+        self._interrupted = True
+        self._wake.set()
+
+    def _post(self, event):
+        self._events.append(event)
+        self._wake.set()
+
+    def _deliver(self):
+        """Run bluetooth IRQs and scheduled callbacks on the program's thread"""
+        while self._irq and self._events:
+            event = self._events.popleft()
+            self._in_irq = True
+            try:
+                if event[0] == "connect":
+                    self._irq(_IRQ_CENTRAL_CONNECT if self.indicate else _OLD_IRQ_CENTRAL_CONNECT,
+                              (_CONN_HANDLE, 0, bytes(6)))
+                elif event[0] == "disconnect":
+                    self._irq(_IRQ_CENTRAL_DISCONNECT if self.indicate else _OLD_IRQ_CENTRAL_DISCONNECT,
+                              (_CONN_HANDLE, 0, bytes(6)))
+                elif event[0] == "mtu":
+                    if self.indicate:
+                        self._irq(_IRQ_MTU_EXCHANGED, (_CONN_HANDLE, event[1]))
+                elif self._rx_handle is not None:
+                    self._values[self._rx_handle] = event[1]
+                    self._irq(_IRQ_GATTS_WRITE if self.indicate else _OLD_IRQ_GATTS_WRITE,
+                              (_CONN_HANDLE, self._rx_handle))
+            finally:
+                self._in_irq = False
+            self._run_scheduled()
+        self._run_scheduled()
+
+    def _run_scheduled(self):
+        while self._scheduled:
+            fn, arg = self._scheduled.popleft()
+            fn(arg)
+
+    # ----- Output to the host ----- #
+
+    def notify(self, data):
+        """Send a notification, OSError when the link can't take it"""
+        if self.link is None:
+            raise OSError(107)  # ENOTCONN
+        mtu = min(self._config["mtu"], getattr(self.link, "mtu_size", _DEFAULT_MTU))
+        if len(data) > mtu - 3:
+            # Doesn't fit the link, which the hub can't see on SPIKE Prime
+            raise OSError(22)  # EINVAL
+        try:
+            self.link.notify(data)
+        except Exception as e:
+            raise OSError(12) from e  # ENOMEM, like a full notification queue
+
+    def output(self, data):
+        """Pybricks stdout: to the host while connected, else the console"""
+        if self.link is None:
+            self.console(data.decode(errors="replace"))
+            return
+        size = getattr(self.link, "mtu_size", _DEFAULT_MTU) - 3
+        for i in range(0, len(data), size):
+            while True:
+                try:
+                    self.notify(data[i:i + size])
+                    break
+                except OSError:
+                    if self.link is None:
+                        return
+                    # stdout blocks until there is room
+                    self.sleep_us(1000)
+
+    def console(self, text):
+        """Write program output to the terminal, one prefixed line at a time"""
+        self._console += text
+        *lines, self._console = self._console.split("\n")
+        for line in lines:
+            sys.__stdout__.write(f"[hub {self.now_ms() / 1000:8.3f}] {line}\n")
+
+    def print(self, *args, sep=" ", end="\n", file=None, flush=False):
+        text = sep.join(str(a) for a in args) + end
+        if file is not None and file is not sys.stdout:
+            file.write(text)
+        elif self.pybricks:
+            self.stdout.write(text)
+        else:
+            self.console(text)
+
+    def record(self, name, args=(), kwargs=None):
+        """Log a display/light/sound call"""
+        self.calls.append((self.now_ms(), name, args + tuple(kwargs.values()) if kwargs else args))
+        self.call_counts[name] += 1
+
+    # ----- Brick modules ----- #
+
+    def motor(self, port):
+        if port not in self.motors:
+            self.motors[port] = Motor(self.now_us)
+        return self.motors[port]
+
+    def _build_modules(self):
+        emulator = self
+        modules = {}
+
+        def module(name, **attrs):
+            m = types.ModuleType(name)
+            m.__dict__.update(attrs)
+            modules[name] = m
+            return m
+
+        # time, with the MicroPython ticks functions
+        module("time",
+               ticks_ms=lambda: self.now_ms() & _TICKS_MASK,
+               ticks_us=lambda: self.now_us() & _TICKS_MASK,
+               ticks_add=lambda ticks, delta: (ticks + delta) & _TICKS_MASK,
+               ticks_diff=lambda a, b: ((a - b + _TICKS_HALF) & _TICKS_MASK) - _TICKS_HALF,
+               sleep=lambda s: self.sleep_us(s * 1e6),
+               sleep_ms=lambda ms: self.sleep_us(ms * 1000),
+               sleep_us=self.sleep_us,
+               time=lambda: self.now_us() / 1e6,
+               time_ns=lambda: self.now_us() * 1000)
+        modules["utime"] = modules["time"]
+        module("struct", **{name: getattr(struct, name) for name in dir(struct) if not name.startswith("__")})
+        modules["struct"].pack = lambda fmt, *values: _MpBytes(struct.pack(fmt, *values))
+        modules["ustruct"] = modules["struct"]
+
+        def schedule(fn, arg):
+            if len(self._scheduled) >= 8:
+                raise RuntimeError("schedule queue full")
+            self._scheduled.append((fn, arg))
+        def kbd_intr(char):
+            self.interrupt_char = char
+        module("micropython", const=lambda x: x, schedule=schedule, kbd_intr=kbd_intr)
+
+        # bluetooth
+        class UUID:
+            def __init__(self, value):
+                self.value = value
+
+            def __eq__(self, other):
+                return isinstance(other, UUID) and self.value == other.value
+
+            def __hash__(self):
+                return hash(self.value)
+
+            def __bytes__(self):
+                if isinstance(self.value, int):
+                    return struct.pack("<H", self.value)
+                return bytes.fromhex(self.value.replace("-", ""))[::-1]
+
+            def __len__(self):
+                return 2 if isinstance(self.value, int) else 16
+
+            def __repr__(self):
+                return f"UUID({self.value!r})"
+
+        class BLE:
+            def active(self, *args):
+                return True
+
+            def config(self, *args, **kwargs):
+                if args:
+                    return emulator._config.get(args[0])
+                emulator._config.update(kwargs)
+
+            def irq(self, handler):
+                emulator._irq = handler
+
+            def gatts_register_services(self, services):
+                handles = []
+                handle = 16
+                for _, characteristics in services:
+                    service_handles = []
+                    for _, flags in characteristics:
+                        handle += 2
+                        service_handles.append(handle)
+                        emulator._values[handle] = b""
+                        if flags & (0x0004 | 0x0008) and emulator._rx_handle is None:
+                            emulator._rx_handle = handle
+                    handles.append(tuple(service_handles))
+                return tuple(handles)
+
+            def gatts_read(self, handle):
+                return emulator._values.get(handle, b"")
+
+            def gatts_write(self, handle, data, *args):
+                emulator._values[handle] = bytes(data)
+
+            def gatts_notify(self, conn_handle, handle, data=None):
+                emulator.notify(bytes(emulator._values[handle] if data is None else data))
+
+            def gap_advertise(self, interval_us, adv_data=None, *args, **kwargs):
+                emulator.record("ble.gap_advertise", (interval_us,))
+
+        module("bluetooth", BLE=BLE, UUID=UUID, FLAG_READ=0x0002, FLAG_WRITE_NO_RESPONSE=0x0004,
+               FLAG_WRITE=0x0008, FLAG_NOTIFY=0x0010)
+        if self.indicate:
+            modules["bluetooth"].FLAG_INDICATE = 0x0020
+
+        # SPIKE 3 hub, motor and runloop
+        port = types.SimpleNamespace(A=0, B=1, C=2, D=3, E=4, F=5)
+        module("hub", port=port,
+               light_matrix=_Recorder(self, "light_matrix"),
+               light=_Recorder(self, "light"),
+               sound=_Recorder(self, "sound"),
+               motion_sensor=types.SimpleNamespace(acceleration=lambda *a: (0, 0, 981),
+                                                   angular_velocity=lambda *a: (0, 0, 0),
+                                                   tilt_angles=lambda: (0, 0, 0)),
+               button=types.SimpleNamespace(LEFT=1, RIGHT=2, pressed=lambda b: b in self.buttons),
+               battery_voltage=lambda: 8300)
+        module("motor",
+               start=lambda p, power: self.motor(p).set_power(power),
+               run=lambda p, velocity: self.motor(p).set_power(velocity * 100 // Motor.MAX_SPEED),
+               stop=lambda p, *args: self.motor(p).set_power(0),
+               relative_position=lambda p: self.motor(p).angle(),
+               velocity=lambda p: self.motor(p).velocity())
+
+        async def sleep_ms(ms):
+            self.sleep_us(ms * 1000)
+
+        def run(*coroutines):
+            import asyncio
+            async def main():
+                await asyncio.gather(*coroutines)
+            asyncio.run(main())
+        module("runloop", run=run, sleep_ms=sleep_ms)
+
+        # Pybricks
+        def wait(ms):
+            self.sleep_us(ms * 1000)
+
+        class StopWatch:
+            def __init__(self):
+                self._start = emulator.now_ms()
+                self._paused = None
+
+            def time(self):
+                return (self._paused if self._paused is not None else emulator.now_ms()) - self._start
+
+            def pause(self):
+                if self._paused is None:
+                    self._paused = emulator.now_ms()
+
+            def resume(self):
+                if self._paused is not None:
+                    self._start += emulator.now_ms() - self._paused
+                    self._paused = None
+
+            def reset(self):
+                self._start = emulator.now_ms() if self._paused is None else self._paused
+
+        class PupMotor:
+            def __init__(self, port, *args, **kwargs):
+                self._motor = emulator.motor(port)
+
+            def dc(self, duty):
+                self._motor.set_power(duty)
+
+            def run(self, speed):
+                self._motor.set_power(speed * 100 // Motor.MAX_SPEED)
+
+            def stop(self):
+                self._motor.set_power(0)
+
+            brake = hold = stop
+
+            def angle(self):
+                return self._motor.angle()
+
+            def speed(self):
+                return self._motor.velocity()
+
+            def reset_angle(self, angle=0):
+                self._motor.angle()
+                self._motor.position = angle
+
+        def blocking(name, ms):
+            # Calls that hold the program on the real hub
+            def call(*args, **kwargs):
+                emulator.record(name, args, kwargs)
+                emulator.sleep_us(ms(*args, **kwargs) * 1000)
+            return call
+
+        class PrimeHub:
+            def __init__(self, *args, observe_channels=None, **kwargs):
+                self.display = _Recorder(emulator, "display",
+                                         text=blocking("display.text", lambda text, on=500, off=50: len(str(text)) * (on + off)))
+                self.light = _Recorder(emulator, "light")
+                self.speaker = _Recorder(emulator, "speaker",
+                                         beep=blocking("speaker.beep", lambda frequency=500, duration=100: duration))
+                self.imu = types.SimpleNamespace(acceleration=lambda *a: (0, 0, 981),
+                                                 angular_velocity=lambda *a: (0, 0, 0),
+                                                 heading=lambda: 0, tilt=lambda: (0, 0))
+                self.buttons = types.SimpleNamespace(pressed=lambda: set(emulator.buttons))
+                self.battery = types.SimpleNamespace(voltage=lambda: 8300, current=lambda: 150)
+                self.ble = types.SimpleNamespace(observe=self._observe,
+                                                 broadcast=lambda data: emulator.record("ble.broadcast", (data,)))
+
+            def _observe(self, channel):
+                # Broadcasts are heard for a second, like on the hub
+                received = emulator.broadcasts.get(channel)
+                if received and emulator.now_ms() - received[0] < 1000:
+                    return received[1]
+                return None
+
+        class _Names:
+            def __init__(self, *names):
+                for name in names:
+                    setattr(self, name, name)
+
+        module("pybricks")
+        module("pybricks.hubs", PrimeHub=PrimeHub, InventorHub=PrimeHub)
+        module("pybricks.pupdevices", Motor=PupMotor)
+        module("pybricks.parameters",
+               Port=_Names("A", "B", "C", "D", "E", "F"),
+               Color=_Names("RED", "ORANGE", "YELLOW", "GREEN", "CYAN", "BLUE", "VIOLET",
+                            "MAGENTA", "WHITE", "BLACK", "NONE"),
+               Direction=_Names("CLOCKWISE", "COUNTERCLOCKWISE"),
+               Button=_Names("LEFT", "RIGHT", "CENTER", "BLUETOOTH"),
+               Stop=_Names("COAST", "BRAKE", "HOLD"))
+        module("pybricks.tools", wait=wait, StopWatch=StopWatch)
+        for name in ("hubs", "pupdevices", "parameters", "tools"):
+            setattr(modules["pybricks"], name, modules["pybricks." + name])
+
+        class Poll:
+            def register(self, stream, *args):
+                pass
+
+            def poll(self, timeout=-1):
+                if not emulator.stdin.available() and timeout:
+                    emulator.sleep_us(max(0, timeout) * 1000)
+                return [(emulator.stdin, 1)] if emulator.stdin.available() else []
+
+        module("usys", stdin=self.stdin, stdout=self.stdout)
+        module("uselect", poll=Poll)
+        return modules
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name not in self.modules and "." not in name:
+            self._load_sibling(name)
+        if level == 0 and name in self.modules:
+            if fromlist or "." not in name:
+                return self.modules[name]
+            return self.modules[name.split(".")[0]]
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    def _load_sibling(self, name):
+        """Run a module from the program's folder with the brick modules
+
+        On the hub these are uploaded with the program, e.g.
+        pybricks_hub_tools.py; their own imports must see the emulated
+        modules too, not the computer's.
+        """
+        path = os.path.join(os.path.dirname(os.path.abspath(self.path)), name + ".py")
+        if not os.path.isfile(path):
+            return
+        module = types.ModuleType(name)
+        module.__file__ = path
+        module.__builtins__ = self._builtins
+        self.modules[name] = module
+        with open(path) as f:
+            exec(compile(f.read(), path, "exec"), module.__dict__)
+
+    # ----- Running the program ----- #
+
+    def start(self):
+        """Start the program on a daemon thread"""
+        self._thread = threading.Thread(target=self._run, name=f"hub {self.path}", daemon=True)
+        if self.clock:
+            self.clock.hub_attach()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        program = {"__name__": "__main__", "__file__": self.path, "__builtins__": self._builtins}
+        if self.clock:
+            self.clock.hub_first_turn()
+        self._woke = real_perf_counter()
+        try:
+            exec(compile(self.source, self.path, "exec"), program)
+        except _Stop:
+            pass
+        except (Exception, KeyboardInterrupt) as e:
+            self.error = e
+            traceback.print_exc()
+        finally:
+            if self.clock:
+                self.clock.hub_exit()
+        self.console("\n" if self._console else "")
+
+    def stop(self, after_ms=0, timeout=5.0):
+        """End the program at its next sleep after after_ms of hub time"""
+        self._stop_at = self.now_us() + after_ms * 1000
+        self._stopping = True
+        self._wake.set()
+        # With a shared clock the program only gets to its next sleep once the loop waits
+        if self._thread and not self.clock and threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Hub time, real time and what the program cost per loop pass"""
+        real = real_perf_counter() - self._real_start
+        hub = self.now_us() / 1e6
+        text = f"Hub time {hub:.1f} s in {real:.1f} s real ({hub / real if real else 0:.1f}x)"
+        if self.sleeps:
+            text += (f", {self.sleeps} sleeps, program time per pass "
+                     f"avg {self.busy_total / self.sleeps * 1e6:.0f} us, max {self.busy_max * 1e6:.0f} us")
+        return text
+
+    @classmethod
+    def factory(cls, path, speed=1.0, clock=None, indicate=True):
+        """hub_factory for transport.py: one emulated hub, started on first connect"""
+        emulator = None
+
+        def hub():
+            nonlocal emulator
+            if emulator is None:
+                emulator = cls(path, speed, clock, indicate).start()
+            return emulator
+        return hub
+
+
+def is_pybricks(source):
+    """Whether a hub program is written for Pybricks (imports pybricks.*)"""
+    return "from pybricks." in source or "import pybricks" in source
+
+
+def frame_kind(source):
+    """How a hub program expects its commands, see VirtualHost"""
+    if "ble.observe" in source:
+        return "broadcast"
+    if is_pybricks(source):
+        return "pybricks"
+    if "_FRAME_V1" in source:
+        return "spike"
+    return "legacy"
+
+
+class VirtualHost:
+    """Drives an emulated hub with the commands the host scripts send
+
+    Connects after the program has booted, sends a command every period_ms
+    of hub time sweeping drive and steering, then disconnects. kind is the
+    command format: "spike" (rc_protocol SPIKE frames), "legacy" (3-byte
+    bbB frames), "pybricks" (rc_protocol drive frames on stdin) or
+    "broadcast" (BLE broadcast on channel 1). Takes the place of the link,
+    so everything runs on the hub's clock.
+
+    The first pybricks frame is drive 3, steer 3: 0x03 is the interrupt
+    character, so a receiver that leaves it on stops right there.
+    """
+    def __init__(self, emulator, seconds=10, period_ms=20, mtu=247, kind=None):
+        self.emulator = emulator
+        self.seconds = seconds
+        self.period_ms = period_ms
+        self.mtu_size = mtu
+        self.kind = kind or frame_kind(emulator.source)
+        self.sent = 0
+        self.notifications = 0
+        self.notified_bytes = 0
+        self._seq = 0
+        self._start = None
+
+    def notify(self, data):
+        self.notifications += 1
+        self.notified_bytes += len(data)
+
+    def run(self, boot_ms=500):
+        emulator = self.emulator
+        emulator.at(boot_ms, self._connect)
+        emulator.start()
+        emulator._thread.join()
+
+    def _connect(self):
+        self._start = self.emulator.now_ms()
+        self.emulator.connected(self)
+        self._send()
+
+    def _send(self):
+        t = (self.emulator.now_ms() - self._start) / 1000
+        if t >= self.seconds:
+            self.emulator.disconnected()
+            self.emulator.stop(after_ms=500)
+            return
+        drive = int(80 * math.sin(2 * math.pi * t / 4))
+        steer = int(60 * math.sin(2 * math.pi * t / 3))
+        if self.kind == "broadcast":
+            self.emulator.broadcasts[1] = (self.emulator.now_ms(), (drive, steer, 0))
+        elif self.kind == "pybricks":
+            if not self.sent:
+                drive, steer = 3, 3
+            self.emulator.received(drive_frame(drive, steer))
+        elif self.kind == "legacy":
+            self.emulator.received(struct.pack("bbB", drive, steer, 0))
+        else:
+            self._seq = (self._seq + 1) & 0xFFFF
+            self.emulator.received(SPIKE_FRAME.pack(SPIKE_FRAME_VERSION, self._seq,
+                                                    self.emulator.now_ms() & 0xFFFF, drive, steer))
+        self.sent += 1
+        self.emulator.at(self.period_ms, self._send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a hub program on the computer")
+    parser.add_argument("program", help="Hub program, e.g. robot_python_code.py")
+    parser.add_argument("--seconds", type=float, default=10, help="Hub time to drive for")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="Times faster than real time, 0 for as fast as possible")
+    parser.add_argument("--period", type=int, default=20, help="Milliseconds between drive frames")
+    parser.add_argument("--mtu", type=int, default=247, help="MTU of the virtual connection")
+    parser.add_argument("--frames", choices=["spike", "legacy", "pybricks", "broadcast"],
+                        help="Command format (default: worked out from the program)")
+    parser.add_argument("--no-indicate", action="store_true",
+                        help="Older SPIKE Prime bluetooth module: no FLAG_INDICATE or MTU exchange event")
+    args = parser.parse_args()
+
+    emulator = HubEmulator(args.program, args.speed, indicate=not args.no_indicate)
+    host = VirtualHost(emulator, args.seconds, args.period, args.mtu, args.frames)
+    try:
+        host.run()
+    except KeyboardInterrupt:
+        emulator.stop()
+    print(f"Sent {host.sent} frames, received {host.notifications} notifications ({host.notified_bytes} bytes)")
+    for port, motor in sorted(emulator.motors.items(), key=lambda item: str(item[0])):
+        print(f"Motor {port}: {motor.angle()}°, {motor.velocity()}°/s")
+    print("Calls:", ", ".join(f"{name} {count}" for name, count in emulator.call_counts.most_common()))
+    print(emulator.stats())
+    return 1 if emulator.error else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# Batched IMU and encoder samples from the hubs
+# The hubs sample the accelerometer, gyro and both motor positions every
+# control loop pass and send them in delta-encoded batches (see
+# rc_protocol.py). This module turns batches back into rows of samples with
+# NumPy, one vectorized cumulative sum per batch, and saves them as .npy.
+#
+#   python -m spikerc drive --imu run.npy      # robot_python_code.py
+#   python -m spikerc pybricks --imu run.npy   # pybricks_uart_receiver.py
+#
+# Load a recording with numpy.load(); columns are listed in CHANNELS.
+
+from rc_protocol import SYNC, IMU_TYPE, IMU_CHANNELS, IMU_HEADER_SIZE, IMU_FIRST, IMU_MAX_BATCH, imu_batch_size
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHANNELS = ("hub_ms", "accel_x", "accel_y", "accel_z", "gyro_x", "gyro_y", "gyro_z",
+            "a_position", "b_position")
+
+# Channels that wrap at 16 bits on the hub and are unwrapped across batches
+_WRAPPING = [0, 7, 8]
+
+
+class ImuDecoder:
+    """Decodes IMU batches into an (n, 9) int64 array of samples
+
+    Within a batch the first sample is absolute and the rest are
+    differences, so one cumsum rebuilds it. The hub clock and motor
+    positions are unwrapped against the previous batch, so they keep
+    counting past 16 bits. Gaps in the batch sequence numbers are counted
+    in lost.
+    """
+    def __init__(self):
+        if np is None:
+            raise ImportError("NumPy is needed to decode IMU batches: pip install numpy")
+        self.batches = 0
+        self.lost = 0
+        self._seq = None
+        self._last = None       # Wrapping channels of the last sample, (unwrapped, as sent)
+        self._chunks = []
+
+    def decode(self, batch):
+        """Decode one batch (starting with the type byte), return its samples"""
+        seq, count = batch[1], batch[2]
+        if not 0 < count <= IMU_MAX_BATCH or len(batch) < imu_batch_size(count):
+            return None
+        if self._seq is not None:
+            self.lost += (seq - self._seq - 1) & 0xFF
+        self._seq = seq
+        self.batches += 1
+
+        samples = np.empty((count, IMU_CHANNELS), dtype=np.int64)
+        samples[0] = np.frombuffer(batch, dtype="<i2", count=IMU_CHANNELS, offset=IMU_HEADER_SIZE)
+        samples[1:] = np.frombuffer(batch, dtype="i1", count=(count - 1) * IMU_CHANNELS,
+                                    offset=IMU_HEADER_SIZE + IMU_FIRST.size).reshape(count - 1, IMU_CHANNELS)
+        np.cumsum(samples, axis=0, out=samples)
+
+        first = samples[0, _WRAPPING]
+        last_raw = samples[-1, _WRAPPING]
+        if self._last is None:
+            # Start the clock at zero, positions where the hub had them
+            offset = np.array([-first[0], 0, 0])
+        else:
+            # Wrapped step from the end of the previous batch to this one
+            last, previous_raw = self._last
+            step = (first - previous_raw + 0x8000) % 0x10000 - 0x8000
+            offset = last + step - first
+        samples[:, _WRAPPING] += offset
+        self._last = (samples[-1, _WRAPPING], last_raw)
+
+        self._chunks.append(samples)
+        return samples
+
+    def samples(self):
+        """All samples decoded so far"""
+        if not self._chunks:
+            return np.empty((0, IMU_CHANNELS), dtype=np.int64)
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+    def save(self, path):
+        """Write all samples to a .npy file, return the number of rows"""
+        samples = self.samples()
+        np.save(path, samples)
+        return len(samples)
+
+    def summary(self):
+        rows = len(self.samples())
+        return f"IMU batches: {self.batches}, lost: {self.lost}, samples: {rows}"
+
+
+class ImuStreamParser:
+    """Splits Pybricks stdout into IMU batches and ordinary text
+
+    pybricks_uart_receiver.py writes batches into the same stream as its
+    print() output, framed as SYNC, batch, checksum. feed() hands complete
+    batches to the decoder and returns the bytes that were not part of one.
+    """
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self._buffer = bytearray()
+        self._start = bytes([SYNC, IMU_TYPE])
+
+    def feed(self, data):
+        """Add received bytes, return the text bytes found in them"""
+        buffer = self._buffer
+        buffer += data
+        text = bytearray()
+        while True:
+            i = buffer.find(self._start)
+            if i < 0:
+                # Keep a trailing SYNC, it may start a batch in the next chunk
+                keep = 1 if buffer[-1:] == self._start[:1] else 0
+                text += buffer[:len(buffer) - keep]
+                del buffer[:len(buffer) - keep]
+                break
+            text += buffer[:i]
+            del buffer[:i]
+            if len(buffer) < 4:
+                break
+            # A count no hub sends means SYNC, IMU_TYPE turned up in text:
+            # don't wait for a batch that long, look for the next one
+            count = buffer[3]
+            size = imu_batch_size(count) + 2
+            if 0 < count <= IMU_MAX_BATCH and len(buffer) < size:
+                break
+            if 0 < count <= IMU_MAX_BATCH and sum(buffer[:size - 1]) & 0xFF == buffer[size - 1]:
+                self.decoder.decode(bytes(buffer[1:size - 1]))
+                del buffer[:size]
+            else:
+                # Not a batch after all
+                text += buffer[:1]
+                del buffer[:1]
+        return bytes(text)
@@ -0,0 +1,164 @@
+# Event-driven input engine for pygame controllers
+# Replaces the old "pump, read every axis, sleep(0.01)" polling threads.
+# The reader thread blocks on the pygame event queue and only wakes up when
+# the controller reports a change, then hands the change to an asyncio loop.
+
+import asyncio
+import threading
+
+
+class InputChannel:
+    """Latest-value channel from the input thread to an asyncio loop"""
+    def __init__(self):
+        self._loop = None
+        self._changed = None
+        self._value = None
+        self._seen = 0
+        self.version = 0
+
+    def bind(self, loop=None):
+        """Attach the channel to the asyncio loop that will wait on it"""
+        self._loop = loop or asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+
+    def publish(self, value):
+        """Store a new value and wake the waiting coroutine (any thread)"""
+        self._value = value
+        self.version += 1
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._changed.set)
+            except RuntimeError:
+                # Loop shut down between the check and the call
+                pass
+
+    def latest(self):
+        """Return the most recently published value without waiting"""
+        return self._value
+
+    async def wait(self, timeout=None):
+        """Wait for a value newer than the last one returned
+
+        Returns the latest value, or None if the timeout expired first.
+        Several publishes between two waits collapse into one wakeup.
+        """
+        if self._changed is None:
+            self.bind()
+        while self.version == self._seen:
+            self._changed.clear()
+            # Re-check after clearing so a publish in between is not lost
+            if self.version != self._seen:
+                break
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self._seen = self.version
+        return self._value
+
+
+class PygameInputEngine:
+    """Background reader that blocks on the pygame event queue
+
+    Keeps raw axis, button and hat arrays for one joystick and calls
+    on_change(axes, buttons, hats) from the reader thread whenever one of
+    them changes. Whatever on_change returns (usually a ControllerState
+    snapshot) is published on the channel. Nothing runs while the
+    controller is idle.
+    """
+    # Wake-up interval used only to notice close(), not to poll the device
+    IDLE_TIMEOUT_MS = 100
+
+    def __init__(self, joystick, on_change=None, channel=None):
+        import pygame
+        self._pygame = pygame
+
+        self.joystick = joystick
+        try:
+            self.instance_id = joystick.get_instance_id()
+        except AttributeError:
+            self.instance_id = joystick.get_id()
+
+        # Seed the arrays with the current state so the first read is valid
+        self.axes = [joystick.get_axis(i) for i in range(joystick.get_numaxes())]
+        self.buttons = [joystick.get_button(i) for i in range(joystick.get_numbuttons())]
+        self.hats = [joystick.get_hat(i) for i in range(joystick.get_numhats())]
+
+        self.on_change = on_change
+        self.channel = channel or InputChannel()
+        self.event_count = 0
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the reader thread"""
+        pygame = self._pygame
+        # Only joystick events are interesting, keep everything else out of the queue
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([
+            pygame.JOYAXISMOTION,
+            pygame.JOYBUTTONDOWN,
+            pygame.JOYBUTTONUP,
+            pygame.JOYHATMOTION,
+            pygame.QUIT,
+        ])
+        self._notify()
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        """Thread method that sleeps until the controller sends an event"""
+        pygame = self._pygame
+        while self.running:
+            try:
+                event = pygame.event.wait(self.IDLE_TIMEOUT_MS)
+                if event.type == pygame.NOEVENT:
+                    continue
+
+                changed = self._apply(event)
+                # Drain whatever queued up meanwhile so a burst costs one wakeup
+                for event in pygame.event.get():
+                    changed = self._apply(event) or changed
+
+                if changed:
+                    self._notify()
+            except Exception as e:
+                print(f"Controller error: {e}")
+
+    def _apply(self, event):
+        """Fold one pygame event into the state arrays, return True on change"""
+        pygame = self._pygame
+        if getattr(event, "instance_id", getattr(event, "joy", None)) != self.instance_id:
+            return False
+
+        self.event_count += 1
+        if event.type == pygame.JOYAXISMOTION:
+            if self.axes[event.axis] == event.value:
+                return False
+            self.axes[event.axis] = event.value
+        elif event.type == pygame.JOYBUTTONDOWN:
+            self.buttons[event.button] = 1
+        elif event.type == pygame.JOYBUTTONUP:
+            self.buttons[event.button] = 0
+        elif event.type == pygame.JOYHATMOTION:
+            self.hats[event.hat] = event.value
+        else:
+            return False
+        return True
+
+    def _notify(self):
+        value = None
+        if self.on_change:
+            value = self.on_change(self.axes, self.buttons, self.hats)
+        self.channel.publish(self.event_count if value is None else value)
+
+    def stop(self):
+        """Stop the reader thread"""
+        self.running = False
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=1.0)
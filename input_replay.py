@@ -0,0 +1,185 @@
+# Controller capture and replay
+# Records the controller states a script sees to a compact binary file and
+# plays them back through the same read()/state interface, so the host
+# scripts can be compared on identical input. Selected with environment
+# variables, the scripts themselves run unchanged:
+#
+#   SPIKERC_CAPTURE=drive.rci python pygame_uart_example.py      # record
+#   SPIKERC_REPLAY=drive.rci python uart_broadcaster.py          # real time
+#   SPIKERC_REPLAY=drive.rci SPIKERC_REPLAY_FAST=1 python ...    # no waiting
+#
+# The file is a 5-byte header followed by one 34-byte record per change:
+# capture time in ns since the start, the six axes as float32 and the
+# button bits (see controller_state.py). A replay ends with the stop button
+# held, so every script goes through its normal emergency stop path.
+
+import asyncio
+import bisect
+import os
+import struct
+import time
+
+from controller_state import ControllerState, BTN_R1
+
+MAGIC = b"SRCI\x01"
+RECORD = struct.Struct("<qffffffH")
+
+
+def state_from_controls(seq, timestamp_ns, drive, steer, boost, stop):
+    """ControllerState for controllers that only have read()"""
+    # read() inverts Y so up drives forward, store it the way a device reports it
+    return ControllerState(seq, timestamp_ns, 0.0, -drive, steer, 0.0, 0.0, boost,
+                           BTN_R1 if stop else 0)
+
+
+class CaptureController:
+    """Wraps a controller and writes every new state it reports to a file
+
+    Controllers with a state property (PS5Controller, the spikerc backends)
+    are captured from their ControllerState snapshots; the others
+    (XboxController, SimpleController) from their read() values. Everything
+    else is passed through to the wrapped controller.
+    """
+    def __init__(self, controller, path):
+        self._controller = controller
+        self._has_state = hasattr(type(controller), "state")
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._t0 = time.monotonic_ns()
+        self._last = None
+        self.path = path
+        self.records = 0
+
+    def __getattr__(self, name):
+        return getattr(self._controller, name)
+
+    def _capture(self, state, timestamp_ns):
+        self._file.write(RECORD.pack(max(0, timestamp_ns - self._t0), *state[2:]))
+        self.records += 1
+
+    @property
+    def state(self):
+        state = self._controller.state
+        if state.seq != self._last:
+            self._last = state.seq
+            self._capture(state, state.timestamp_ns)
+        return state
+
+    def read(self):
+        if self._has_state:
+            return self.state.rc_controls()
+        values = self._controller.read()
+        controls = tuple(values)
+        if controls != self._last:
+            self._last = controls
+            now = time.monotonic_ns()
+            self._capture(state_from_controls(0, now, *controls), now)
+        return values
+
+    async def wait_for_change(self, timeout=None):
+        await self._controller.wait_for_change(timeout)
+        return self.read()
+
+    def close(self):
+        # Repeat the last state at the end so replays last as long as the capture
+        if self._last is not None:
+            state = self._controller.state if self._has_state else state_from_controls(0, 0, *self._last)
+            self._capture(state, time.monotonic_ns())
+        self._file.close()
+        print(f"Captured {self.records} controller states to {self.path}")
+        self._controller.close()
+
+
+class ReplayController:
+    """Plays a capture back with the interface of the controller classes
+
+    In real time the state at any moment is the last record captured at or
+    before the same time since the first read. With realtime=False the
+    replay stays on a record until advance() or wait_for_change() moves it
+    on, however often state and read() are looked at. After the last record
+    the stop button is held.
+    """
+    def __init__(self, path, realtime=True):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a controller capture")
+        self.states = [ControllerState(i + 1, timestamp_ns, *values)
+                       for i, (timestamp_ns, *values) in enumerate(RECORD.iter_unpack(data[len(MAGIC):]))]
+        self._times = [state.timestamp_ns for state in self.states]
+        last = self.states[-1] if self.states else ControllerState(0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+        self._stopped = last._replace(seq=len(self.states) + 1, buttons=last.buttons | BTN_R1)
+        self.realtime = realtime
+        self.controller = path
+        self.controller_name = f"Replay of {path}"
+        self._start = None
+        self._next = 0
+        self._current = self.states[0] if self.states else self._stopped
+        print(f"Replaying {len(self.states)} controller states from {path}"
+              f"{'' if realtime else ' as fast as possible'}")
+
+    def _elapsed_ns(self):
+        if self._start is None:
+            self._start = time.monotonic_ns()
+        return time.monotonic_ns() - self._start
+
+    @property
+    def state(self):
+        if self.realtime:
+            i = bisect.bisect_right(self._times, self._elapsed_ns())
+            self._current = self._stopped if i >= len(self.states) else self.states[max(0, i - 1)]
+        return self._current
+
+    def advance(self):
+        """Move a replay with realtime=False on to its next record"""
+        self._next += 1
+        self._current = self._stopped if self._next >= len(self.states) else self.states[self._next]
+
+    def read(self):
+        return self.state.rc_controls()
+
+    async def wait_for_change(self, timeout=None):
+        """Sleep until the next recorded change, at most timeout seconds"""
+        if self.realtime:
+            i = bisect.bisect_right(self._times, self._elapsed_ns())
+            delay = (self._times[i] - self._elapsed_ns()) / 1e9 if i < len(self._times) else 0
+            if timeout is not None:
+                delay = min(delay, timeout)
+            await asyncio.sleep(max(0, delay))
+            return self.read()
+        self.advance()
+        await asyncio.sleep(0)
+        return self.read()
+
+    def close(self):
+        pass
+
+
+async def poll_interval(controller, seconds):
+    """Sleep between reads of a controller that is polled
+
+    A replay with realtime=False moves on to its next record instead, so
+    polling loops get through it as fast as the ones that wait for changes.
+    """
+    if isinstance(controller, ReplayController) and not controller.realtime:
+        controller.advance()
+        await asyncio.sleep(0)
+    else:
+        await asyncio.sleep(seconds)
+
+
+def open_input(factory):
+    """Create a script's controller, captured or replaced by a replay
+
+    factory is the controller class. SPIKERC_REPLAY=FILE replays FILE
+    instead of opening a controller (add SPIKERC_REPLAY_FAST=1 to skip the
+    waiting), SPIKERC_CAPTURE=FILE records the controller to FILE.
+    """
+    replay = os.environ.get("SPIKERC_REPLAY")
+    if replay:
+        return ReplayController(replay, realtime=not os.environ.get("SPIKERC_REPLAY_FAST"))
+    controller = factory()
+    capture = os.environ.get("SPIKERC_CAPTURE")
+    if capture and getattr(controller, "controller", True):
+        return CaptureController(controller, capture)
+    return controller
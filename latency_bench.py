@@ -0,0 +1,394 @@
+# End-to-end input-to-motor latency benchmark
+# Moves the left stick in steps and timestamps every stage each step goes
+# through on its way to the drive motor, for each host script:
+#
+#   read    - the script reads the new controller state
+#   map     - control_mapping has turned it into motor powers
+#   encode  - the frame bytes are built
+#   write   - write_gatt_char returned
+#   hub rx  - the hub received the frame (BLE write IRQ, or Pybricks stdin)
+#   motor   - motor.start / Motor.dc was called with the new power
+#   echo    - the hub reported the frame back (telemetry control sequence)
+#
+# All times are ms after the stick moved. The steps are a generated
+# capture replayed in real time (input_replay.py), and every script runs
+# unmodified in its own process on the loopback link (transport.py) with
+# the receiver program in the hub emulator (hub_emulator.py):
+#
+#   python latency_bench.py                                   # every variant
+#   python latency_bench.py pygame_uart_example spikerc-drive --link "interval=7.5"
+#   python latency_bench.py --virtual                         # virtual_time.py, fast and reproducible
+#   python latency_bench.py spikerc-drive --hardware          # real hub running robot_python_code.py
+#
+# --virtual only counts scheduling, link and hub loop delays, computing
+# time on the host is free there. --hardware drives a real hub over bleak,
+# where the hub stages are not visible and the echo stage is the first
+# telemetry frame that reports the step's frame as received. The steps run
+# the drive motor at up to 30% power, so put the robot on a stand.
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from control_mapping import default_mapping
+from input_replay import MAGIC, RECORD, state_from_controls
+from rc_protocol import (SPIKE_FRAME, SPIKE_FRAME_SIZE, SPIKE_FRAME_VERSION, MSG_DRIVE, decode_frames,
+                         TELEMETRY, TELEMETRY_SIZE, TELEMETRY_TYPE)
+
+# Variant name -> (script command line, hub program it talks to)
+VARIANTS = {
+    "pygame_uart_example": (["pygame_uart_example.py"], "robot_python_code.py"),
+    "spikerc-drive": (["spikerc.py", "drive"], "robot_python_code.py"),
+    "uart_broadcaster": (["uart_broadcaster.py"], "pybricks_uart_receiver.py"),
+    "windows_safe_broadcaster": (["windows_safe_broadcaster.py"], "pybricks_uart_receiver.py"),
+    "spikerc-pybricks": (["spikerc.py", "pybricks"], "pybricks_uart_receiver.py"),
+}
+
+STAGES = ["read", "map", "encode", "write", "hub rx", "motor", "echo"]
+
+# Both hub programs drive with the motor on port B
+DRIVE_PORTS = (1, "B")
+
+# Time to connect and finish the hub's connection animation before the first step
+SETTLE_MS = 1000
+
+
+def make_steps(path, steps=40, gap_ms=250, seed=1):
+    """Write a capture of stick steps, return [(ns after start, record seq, drive power)]
+
+    Each step moves the left stick to a level whose drive power differs
+    from the one before, so every stage can tell the steps apart by the
+    power it sees. Gaps are jittered so steps land at every phase of the
+    connection interval and the hub's control loop.
+    """
+    rng = random.Random(seed)
+    mapping = default_mapping()
+    records = [(0, 0.0)]     # (ns, stick level)
+    result = []
+    t = SETTLE_MS
+    power = 0
+    while len(result) < steps:
+        drive = round(rng.uniform(-1.0, 1.0), 2)
+        new_power = mapping.map(drive, 0.0, 0.0)[0]
+        if abs(new_power - power) < 5:
+            continue
+        power = new_power
+        records.append((round(t * 1e6), drive))
+        result.append((records[-1][0], len(records), power))
+        t += gap_ms + rng.uniform(0, gap_ms / 5)
+    # Hold the last step for a full gap before the replay ends with stop
+    records.append((round(t * 1e6), records[-1][1]))
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for ns, drive in records:
+            state = state_from_controls(0, 0, drive, 0.0, 0.0, False)
+            f.write(RECORD.pack(ns, *state[2:]))
+    return result
+
+
+def frame_power(data):
+    """Drive power a SPIKE or Pybricks frame carries, None for other writes"""
+    data = bytes(data)
+    if len(data) == SPIKE_FRAME_SIZE and data[0] == SPIKE_FRAME_VERSION:
+        return SPIKE_FRAME.unpack(data)[3]
+    if len(data) == 3:
+        return struct.unpack("bbB", data)[0]
+    power = None
+    for msg, drive, steer in decode_frames(data):
+        if msg == MSG_DRIVE:
+            power = drive
+    return power
+
+
+# ----- Child process: runs one script with probes at every stage ----- #
+
+class Probes:
+    """Timestamps stage events as (monotonic ns, tag)
+
+    The tag is the drive power the stage saw, or the replay record seq for
+    read. Times come from time.monotonic_ns() at each call, which is the
+    virtual clock when virtual_time.py is installed.
+    """
+    def __init__(self):
+        self.events = {stage: [] for stage in STAGES}
+        self.replay = None
+        self.seq_power = {}     # SPIKE frame seq -> drive power, for echoes
+        self._last_read = None
+
+    def stamp(self, stage, tag):
+        if tag is not None:
+            self.events[stage].append((time.monotonic_ns(), tag))
+
+    def install(self):
+        # transport first: with SPIKERC_VIRTUAL_TIME it installs the virtual clock
+        import transport
+        import input_replay
+        import control_mapping
+        import rc_protocol
+        probes = self
+
+        replay_state = input_replay.ReplayController.state.fget
+
+        def state(replay):
+            value = replay_state(replay)
+            probes.replay = replay
+            if value.seq != probes._last_read:
+                probes._last_read = value.seq
+                probes.stamp("read", value.seq)
+            return value
+        input_replay.ReplayController.state = property(state)
+
+        build_map = control_mapping.ControlMapping._build_map
+
+        def _build_map(mapping):
+            map = build_map(mapping)
+
+            def timed_map(drive, steer, boost):
+                result = map(drive, steer, boost)
+                probes.stamp("map", result[0])
+                return result
+            return timed_map
+        control_mapping.ControlMapping._build_map = _build_map
+
+        spike_encode = rc_protocol.SpikeFrameEncoder.encode
+
+        def encode(encoder, command):
+            frame = spike_encode(encoder, command)
+            power = max(-100, min(100, command[0]))
+            probes.seq_power[encoder.seq] = power
+            probes.stamp("encode", power)
+            return frame
+        rc_protocol.SpikeFrameEncoder.encode = encode
+
+        drive_frame = rc_protocol.drive_frame
+
+        def timed_drive_frame(drive, steer):
+            frame = drive_frame(drive, steer)
+            probes.stamp("encode", max(-100, min(100, drive)))
+            return frame
+        rc_protocol.drive_frame = timed_drive_frame
+
+        client = transport.BleakClient
+        write_gatt_char = client.write_gatt_char
+
+        async def timed_write(self, char, data, *args, **kwargs):
+            result = await write_gatt_char(self, char, data, *args, **kwargs)
+            probes.stamp("write", frame_power(data))
+            return result
+        client.write_gatt_char = timed_write
+
+        start_notify = client.start_notify
+
+        async def probed_start_notify(self, char, callback, **kwargs):
+            def echo(data):
+                if len(data) == TELEMETRY_SIZE and data[0] == TELEMETRY_TYPE:
+                    probes.stamp("echo", probes.seq_power.get(TELEMETRY.unpack(data)[-1]))
+
+            if asyncio.iscoroutinefunction(callback):
+                async def handler(sender, data):
+                    echo(data)
+                    await callback(sender, data)
+            else:
+                def handler(sender, data):
+                    echo(data)
+                    return callback(sender, data)
+            return await start_notify(self, char, handler, **kwargs)
+        client.start_notify = probed_start_notify
+
+        if "hub_emulator" in sys.modules:
+            import hub_emulator
+            emulator = hub_emulator.HubEmulator
+            received = emulator.received
+
+            def probed_received(hub, data):
+                probes.stamp("hub rx", frame_power(data))
+                received(hub, data)
+            emulator.received = probed_received
+
+            emulator_motor = emulator.motor
+
+            def motor(hub, port):
+                m = emulator_motor(hub, port)
+                m.port = port
+                return m
+            emulator.motor = motor
+
+            set_power = hub_emulator.Motor.set_power
+
+            def probed_set_power(m, power):
+                set_power(m, power)
+                if getattr(m, "port", None) in DRIVE_PORTS:
+                    probes.stamp("motor", m.power)
+            hub_emulator.Motor.set_power = probed_set_power
+
+    def save(self, path):
+        start = self.replay._start if self.replay else None
+        with open(path, "w") as f:
+            json.dump({"start": start, "events": self.events}, f)
+
+
+def run_child(variant, out):
+    """Run one variant's script in this process and save its stage events to out"""
+    import runpy
+
+    command = VARIANTS[variant][0]
+    probes = Probes()
+    probes.install()
+    atexit.register(probes.save, out)
+    sys.argv = list(command)
+    try:
+        runpy.run_path(command[0], run_name="__main__")
+    except SystemExit:
+        pass
+
+
+# ----- Parent process: runs the variants and prints the tables ----- #
+
+def match_steps(steps, start_ns, events):
+    """Latency in ms of each stage for each step, None where it never showed up
+
+    A stage reached step i at its first event tagged with the step's power
+    (record seq for read) at or after the step and before the next one, so
+    latencies longer than the gap between steps are counted as missed.
+    Steps start a microsecond early, the virtual clock rounds to whole ns.
+    """
+    latencies = {stage: [] for stage in STAGES}
+    times = [start_ns + ns - 1000 for ns, _, _ in steps] + [float("inf")]
+    for stage in STAGES:
+        stage_events = events.get(stage, [])
+        j = 0
+        for i, (_, seq, power) in enumerate(steps):
+            tag = seq if stage == "read" else power
+            while j < len(stage_events) and stage_events[j][0] < times[i]:
+                j += 1
+            found = None
+            k = j
+            while k < len(stage_events) and stage_events[k][0] < times[i + 1]:
+                if stage_events[k][1] == tag:
+                    found = max(0, stage_events[k][0] - times[i] - 1000) / 1e6
+                    break
+                k += 1
+            latencies[stage].append(found)
+    return latencies
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def print_table(title, latencies, steps):
+    print(f"\n{title}")
+    print(f"  {'stage':<8} {'n':>4} {'missed':>6} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}   ms after the stick moved")
+    for stage in STAGES:
+        values = sorted(v for v in latencies[stage] if v is not None)
+        missed = len(steps) - len(values)
+        if not values:
+            if missed < len(steps) or stage in ("read", "map", "encode", "write"):
+                print(f"  {stage:<8} {0:>4} {missed:>6}")
+            continue
+        print(f"  {stage:<8} {len(values):>4} {missed:>6} {percentile(values, 0.5):>7.1f} "
+              f"{percentile(values, 0.9):>7.1f} {percentile(values, 0.99):>7.1f} {values[-1]:>7.1f}")
+
+
+def run_variant(variant, capture, workdir, args):
+    """Run one variant in a child process, return its stage events or None"""
+    command, hub = VARIANTS[variant]
+    out = os.path.join(workdir, f"{variant}.json")
+    env = dict(os.environ)
+    for name in ("SPIKERC_REPLAY_FAST", "SPIKERC_CAPTURE", "SPIKERC_TRANSPORT", "SPIKERC_HUB", "SPIKERC_VIRTUAL_TIME"):
+        env.pop(name, None)
+    env["SPIKERC_REPLAY"] = capture
+    env["SPIKERC_STARTUP_LOG"] = os.devnull
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    if not args.hardware:
+        env["SPIKERC_TRANSPORT"] = "loopback"
+        env["SPIKERC_HUB"] = hub
+        if args.virtual:
+            env["SPIKERC_VIRTUAL_TIME"] = "1"
+    if args.link:
+        env["SPIKERC_LINK"] = args.link
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", variant, "--out", out],
+                                cwd=here, env=env, capture_output=True, text=True, errors="replace",
+                                timeout=args.timeout, input="\n" * 8)   # Default answer to any hub prompt
+    except subprocess.TimeoutExpired:
+        print(f"\n{variant}: did not finish within {args.timeout} s")
+        return None
+    try:
+        with open(out) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = None
+    if data is None or data["start"] is None:
+        print(f"\n{variant}: no results (exit code {result.returncode}), last output:")
+        lines = (result.stdout + result.stderr).replace("\r", "\n").strip().splitlines()
+        for line in lines[-10:]:
+            print(f"  {line}")
+        return None
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Input-to-motor latency of the host scripts")
+    parser.add_argument("variants", nargs="*", metavar="VARIANT",
+                        help=f"Scripts to measure (default: all of {', '.join(VARIANTS)})")
+    parser.add_argument("--steps", type=int, default=40, help="Stick steps per variant")
+    parser.add_argument("--gap", type=float, default=250, help="Milliseconds between steps")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the step levels and timing")
+    parser.add_argument("--link", metavar="SPEC", help="Loopback link model, as SPIKERC_LINK")
+    parser.add_argument("--virtual", action="store_true", help="Run on the virtual clock (virtual_time.py)")
+    parser.add_argument("--hardware", action="store_true", help="Drive a real hub over bleak instead")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to allow each variant")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.out)
+        return
+
+    unknown = [v for v in args.variants if v not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variant {', '.join(unknown)}, choose from {', '.join(VARIANTS)}")
+    variants = args.variants or list(VARIANTS)
+    if args.hardware and args.virtual:
+        parser.error("--virtual only works on the loopback link")
+    mode = "real hub" if args.hardware else "virtual time" if args.virtual else "loopback link, real time"
+
+    summary = []
+    with tempfile.TemporaryDirectory() as workdir:
+        capture = os.path.join(workdir, "steps.rci")
+        steps = make_steps(capture, args.steps, args.gap, args.seed)
+        print(f"{len(steps)} stick steps {args.gap:g} ms apart, {mode}")
+        for variant in variants:
+            started = time.perf_counter()
+            data = run_variant(variant, capture, workdir, args)
+            if data is None:
+                continue
+            latencies = match_steps(steps, data["start"], data["events"])
+            hub = "real hub" if args.hardware else VARIANTS[variant][1]
+            print_table(f"{variant} -> {hub} ({time.perf_counter() - started:.1f} s)", latencies, steps)
+            final = "echo" if args.hardware else "motor"
+            values = sorted(v for v in latencies[final] if v is not None)
+            if values:
+                summary.append((percentile(values, 0.5), percentile(values, 0.99), variant, final))
+
+    if len(summary) > 1:
+        print("\nFastest first:")
+        for p50, p99, variant, final in sorted(summary):
+            print(f"  {variant:<26} {final} p50 {p50:6.1f} ms, p99 {p99:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# Round trip times to the hub from ping echoes
+# The computer writes a ping frame carrying its monotonic clock (see
+# rc_protocol.py) and the hub sends it straight back on TX, so each echo
+# gives one round trip time with no clock synchronization. Times go into
+# an HDR-style histogram: log-linear buckets that keep every percentile
+# within 1.6% of the true value from microseconds to a minute, with a
+# fixed-size table and no sorting.
+#
+# PingMonitor pings in bursts (debug_uart_connection.py's ping command) or
+# in the background at a low rate while driving (python -m spikerc drive
+# --ping 2), shows a live status line and prints the distribution at exit.
+
+import asyncio
+import math
+import time
+
+from ble_sender import stream_response
+from rc_protocol import SYNC, PING_TYPE, PING_SIZE, decode_ping, ping_frame
+
+# A ping without an echo after this long counts as lost
+LOST_AFTER_NS = 2_000_000_000
+
+# Percentiles in the printed distribution
+DUMP_PERCENTILES = (0, 50, 75, 90, 95, 99, 99.9, 100)
+
+
+class RttHistogram:
+    """Log-linear histogram of round trip times in microseconds
+
+    Values below 2^sub_bits get one bucket each; above that every power of
+    two is split into 2^(sub_bits - 1) buckets, so a bucket is never wider
+    than 1/64 of its values with the default sub_bits=7. Values above
+    highest_us are counted in the last bucket. min, max and mean are exact.
+    """
+    def __init__(self, sub_bits=7, highest_us=60_000_000):
+        self.sub_bits = sub_bits
+        self._sub = 1 << sub_bits
+        self._half = self._sub >> 1
+        self.highest_us = highest_us
+        self.counts = [0] * (self._index(highest_us) + 1)
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def _index(self, value):
+        shift = value.bit_length() - self.sub_bits
+        if shift <= 0:
+            return value
+        return self._sub + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def _highest_in(self, index):
+        """Largest value that lands in bucket index"""
+        if index < self._sub:
+            return index
+        shift = (index - self._sub) // self._half + 1
+        top = (index - self._sub) % self._half + self._half
+        return ((top + 1) << shift) - 1
+
+    def record(self, us):
+        value = min(max(0, int(us)), self.highest_us)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total_us += value
+        if self.min_us is None or value < self.min_us:
+            self.min_us = value
+        if value > self.max_us:
+            self.max_us = value
+
+    def percentile(self, q):
+        """Value in us at or below which q percent of the samples fall"""
+        if not self.count:
+            return 0
+        if q <= 0:
+            return self.min_us
+        target = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self._highest_in(index), self.max_us)
+        return self.max_us
+
+    def mean(self):
+        return self.total_us / self.count if self.count else 0
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def table(self):
+        """Percentile distribution, one line per entry of DUMP_PERCENTILES"""
+        lines = [f"  {'ms':>9}  {'percentile':>10}  {'count':>7}"]
+        for q in DUMP_PERCENTILES:
+            value = self.percentile(q)
+            below = sum(self.counts[:self._index(value) + 1])
+            lines.append(f"  {value / 1000:>9.3f}  {q:>9.3f}%  {below:>7}")
+        return "\n".join(lines)
+
+
+class PingMonitor:
+    """Sends pings on one characteristic and times their echoes
+
+    Feed it what arrives on TX: echo() for hubs that notify each message on
+    its own (robot_python_code.py), feed() for the Pybricks stdout stream,
+    where an echo can be split over notifications and sit between printed
+    text; feed() returns the bytes that were not part of an echo. Pings are
+    written without response when the characteristic allows it.
+    """
+    def __init__(self, client, char, rate=2.0, response=None):
+        self.client = client
+        self.char = char
+        self.rate = rate
+        self.response = stream_response(client, char) if response is None else response
+        self.histogram = RttHistogram()
+        self.sent = 0
+        self.lost = 0
+        self.error = None
+        self._waiting = {}      # Send time (ns) of every ping without an echo yet
+        self._buffer = bytearray()
+        self._start = bytes([SYNC, PING_TYPE])
+        self._task = None
+
+    async def ping(self):
+        """Send one ping"""
+        now = time.monotonic_ns()
+        self._expire(now)
+        # Waiting before the write returns, an acknowledged write can complete after the echo
+        self._waiting[now] = True
+        try:
+            await self.client.write_gatt_char(self.char, ping_frame(now), response=self.response)
+        except BaseException:
+            # Cancelled or failed, it never went out
+            self._waiting.pop(now, None)
+            raise
+        self.sent += 1
+
+    def _expire(self, now):
+        for sent in [t for t in self._waiting if now - t > LOST_AFTER_NS]:
+            del self._waiting[sent]
+            self.lost += 1
+
+    def _echoed(self, sent):
+        # Echoes of pings that were already counted lost, or of pings from an
+        # earlier run, are not ours to time
+        if self._waiting.pop(sent, None):
+            self.histogram.record((time.monotonic_ns() - sent) // 1000)
+
+    def echo(self, data):
+        """Take a notification, True if it was a ping echo"""
+        sent = decode_ping(data)
+        if sent is None:
+            return False
+        self._echoed(sent)
+        return True
+
+    def feed(self, data):
+        """Add bytes from a stream, return the ones that were not an echo"""
+        buffer = self._buffer
+        buffer += data
+        text = bytearray()
+        while True:
+            i = buffer.find(self._start)
+            if i < 0:
+                # Keep a trailing SYNC, it may start an echo in the next chunk
+                keep = 1 if buffer[-1:] == self._start[:1] else 0
+                text += buffer[:len(buffer) - keep]
+                del buffer[:len(buffer) - keep]
+                break
+            text += buffer[:i]
+            del buffer[:i]
+            if len(buffer) < PING_SIZE:
+                break
+            sent = decode_ping(bytes(buffer[:PING_SIZE]))
+            if sent is None:
+                # Not an echo after all
+                text += buffer[:1]
+                del buffer[:1]
+            else:
+                self._echoed(sent)
+                del buffer[:PING_SIZE]
+        return bytes(text)
+
+    async def wait_for_echoes(self, timeout=1.0):
+        """Wait until every ping was echoed, at most timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while self._waiting and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def burst(self, count, interval=0.1, show=True):
+        """Send count pings interval seconds apart, showing the live status"""
+        for _ in range(count):
+            await self.ping()
+            await asyncio.sleep(interval)
+            if show:
+                print(f"\r{self.status()}", end="")
+        await self.wait_for_echoes()
+        if show:
+            print(f"\r{self.status()}")
+
+    def start(self):
+        """Ping rate times a second in the background until close()"""
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def _run(self):
+        try:
+            while True:
+                await self.ping()
+                await asyncio.sleep(1 / self.rate)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+            print(f"\nPing stopped: {e}")
+
+    async def close(self):
+        """Stop background pinging, giving the last pings time to come back"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.wait_for_echoes()
+
+    def status(self):
+        """Live view line"""
+        h = self.histogram
+        if not h.count:
+            return f"RTT -- ({self.sent} pings)"
+        return (f"RTT p50 {h.percentile(50) / 1000:.1f} p99 {h.percentile(99) / 1000:.1f} "
+                f"max {h.max_us / 1000:.1f} ms, {self.lost} lost")
+
+    def report(self):
+        """Totals and the RTT distribution"""
+        self._expire(time.monotonic_ns())
+        h = self.histogram
+        text = f"Pings: {self.sent} sent, {h.count} echoed, {self.lost} lost, {len(self._waiting)} outstanding"
+        if h.count:
+            text += f", mean RTT {h.mean() / 1000:.2f} ms\n{h.table()}"
+        return text
@@ -1,21 +1,25 @@
 # Pybricks BLE RC receiver code for LEGO SPIKE Prime
 # Uses Pybricks firmware (https://pybricks.com/)
 # Communicates using Pybricks BLE API
+# Needs pybricks_hub_tools.py in the same folder, it is uploaded with it
 
 from pybricks.hubs import PrimeHub
 from pybricks.pupdevices import Motor
 from pybricks.parameters import Port, Direction, Color
-from pybricks.tools import wait, StopWatch
+from pybricks_hub_tools import LoopTimer, StatusDisplay
 
 # Initialize the hub with BLE observation on channel 1
 hub = PrimeHub(observe_channels=[1])
+status = StatusDisplay(hub)
 
 # Initialize the motors
 drive_motor = Motor(Port.B)
 steering_motor = Motor(Port.A)
 
-# Create status display timer
-status_timer = StopWatch()
+# Fixed-period loop timer, also the clock for timeouts and the status message
+loop_timer = LoopTimer(20)
+last_status_time = 0
+button_held = False
 
 # Set up variables for motor control
 drive_power = 0
@@ -31,8 +35,7 @@ def stop_motors():
     steering_motor.stop()
 
 # Display startup message
-hub.display.text("RC Ready")
-hub.light.on(Color.BLUE)
+status.set("RC Ready", Color.BLUE)
 print("SPIKE Prime RC Car Ready!")
 print("Listening for controller on BLE channel 1")
 print("Connect using pygame_uart_example.py with BlueZ BLE")
@@ -47,8 +50,7 @@ while True:
         if not connected:
             # First connection - show status
             connected = True
-            hub.light.on(Color.GREEN)
-            hub.display.text("Connected")
+            status.set("Connected", Color.GREEN)
             print("Controller connected!")
             hub.speaker.beep(frequency=440, duration=100)
         
@@ -63,52 +65,46 @@ while True:
                 steering_motor.dc(steer_power)
                 
                 # Update connection time
-                last_receive_time = status_timer.time()
+                last_receive_time = loop_timer.now()
                 
                 # Print debug info but not too often
-                if status_timer.time() % 500 < 50:  # Print approximately every 500ms
+                if loop_timer.now() % 500 < 50:  # Print approximately every 500ms
                     print(f"Drive: {drive_power}, Steer: {steer_power}")
             except Exception as e:
                 print(f"Motor control error: {e}")
                 hub.light.blink(Color.RED, [500, 500])
     
     # Check for connection timeout (no data for 2 seconds)
-    elif connected and (status_timer.time() - last_receive_time) > 2000:
+    elif connected and (loop_timer.now() - last_receive_time) > 2000:
         connected = False
-        hub.light.on(Color.BLUE)
-        hub.display.text("Disconnected")
+        status.flash("Disconnected", Color.BLUE)
+        status.set("RC Ready", Color.BLUE)
         print("Controller disconnected - timeout")
         hub.speaker.beep(frequency=220, duration=100)
         stop_motors()
     
-    # Show status on display periodically
-    if status_timer.time() > 5000:
+    # Show status on display periodically, drawn over the next loop passes
+    if loop_timer.now() - last_status_time > 5000 and not status.flashing:
         if connected:
             # Show current values
-            hub.display.text(f"D:{drive_power}")
-            wait(1000)
-            hub.display.text(f"S:{steer_power}")
-            wait(1000)
-            hub.display.text("Connected")
+            status.flash(f"D:{drive_power} S:{steer_power}", Color.GREEN)
         else:
             # Show waiting message
-            hub.display.text("Waiting")
-            wait(1000)
-            hub.display.text("RC Ready")
-            
-        # Reset timer
-        status_timer.reset()
+            status.flash("Waiting", Color.BLUE)
+        last_status_time = loop_timer.now()
+        loop_timer.report()
     
-    # Check hub buttons for emergency stop
-    if hub.buttons.pressed():
+    # Check hub buttons for emergency stop, once per press
+    pressed = bool(hub.buttons.pressed())
+    if pressed and not button_held:
         print("Emergency stop!")
-        hub.light.on(Color.RED)
-        hub.display.text("STOP")
         stop_motors()
+        status.flash("STOP", Color.RED)
         hub.speaker.beep(frequency=880, duration=300)
-        wait(1000)
-        hub.light.on(Color.BLUE if not connected else Color.GREEN)
-        hub.display.text("RC Ready" if not connected else "Connected")
+    button_held = pressed
+    
+    # Draw at most one character of the status message
+    status.tick()
     
-    # Small delay to save power
-    wait(20)
\ No newline at end of file
+    # Sleep until the next 20 ms deadline
+    loop_timer.sleep()
\ No newline at end of file
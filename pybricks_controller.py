@@ -6,11 +6,15 @@ import pygame
 import asyncio
 import struct
 import time
-import threading
 import sys
 import math
 import argparse
 
+from input_engine import PygameInputEngine
+from controller_state import StatePublisher
+from controller_profiles import resolve_profile
+from control_mapping import default_mapping
+
 # BlueZ BLE library for Linux
 try:
     from bleak import BleakScanner, BleakClient
@@ -48,76 +52,25 @@ class PS5Controller:
         print(f"Number of buttons: {self.controller.get_numbuttons()}")
         print(f"Number of hats: {self.controller.get_numhats()}")
         
-        # Initialize state values
-        self.left_stick_x = 0.0
-        self.left_stick_y = 0.0
-        self.right_stick_x = 0.0
-        self.right_stick_y = 0.0
-        self.left_trigger = 0.0
-        self.right_trigger = 0.0
-        
-        self.cross = 0  # A/Cross
-        self.circle = 0  # B/Circle
-        self.square = 0  # X/Square
-        self.triangle = 0  # Y/Triangle
+        # Resolve axis/button indices once for this controller model
+        self.profile = resolve_profile(self.controller, 0)
         
-        self.left_bumper = 0
-        self.right_bumper = 0
+        # Latest immutable snapshot, swapped in whole by the input thread
+        self.states = StatePublisher()
         
-        # Thread for controller updates
-        self.running = True
-        self.thread = threading.Thread(target=self._controller_update)
-        self.thread.daemon = True
-        self.thread.start()
+        # Event-driven reader, only wakes up when the controller changes
+        self.engine = PygameInputEngine(self.controller, on_change=self._controller_update)
+        self.engine.start()
     
-    def _controller_update(self):
-        """Thread method that updates controller values"""
-        while self.running:
-            # Process events to get controller updates
-            pygame.event.pump()
-            
-            if self.controller:
-                # Map axes based on controller name
-                # DualSense PS5 controller mappings may vary by platform
-                
-                # Common mapping for left stick
-                self.left_stick_x = self.controller.get_axis(0)
-                self.left_stick_y = self.controller.get_axis(1)
-                
-                # For PS5 DualSense on Windows, right stick is usually axes 2 and 3
-                if "dualsense" in self.controller_name.lower() or "dual sense" in self.controller_name.lower():
-                    self.right_stick_x = self.controller.get_axis(2)
-                    self.right_stick_y = self.controller.get_axis(3)
-                    
-                    # PS5 triggers are usually axes 4 and 5 on Windows
-                    if self.controller.get_numaxes() > 5:
-                        self.left_trigger = (self.controller.get_axis(4) + 1) / 2.0  # Convert from -1..1 to 0..1
-                        self.right_trigger = (self.controller.get_axis(5) + 1) / 2.0
-                else:
-                    # Generic mapping for other controllers
-                    self.right_stick_x = self.controller.get_axis(3) if self.controller.get_numaxes() > 3 else 0
-                    self.right_stick_y = self.controller.get_axis(4) if self.controller.get_numaxes() > 4 else 0
-                    
-                    # Triggers
-                    if self.controller.get_numaxes() > 5:
-                        self.left_trigger = (self.controller.get_axis(2) + 1) / 2.0
-                        self.right_trigger = (self.controller.get_axis(5) + 1) / 2.0
-                
-                # Handle button mappings
-                if self.controller.get_numbuttons() > 0:
-                    # Common button mapping for PlayStation controllers
-                    self.cross = self.controller.get_button(0)     # A/Cross
-                    self.circle = self.controller.get_button(1)    # B/Circle
-                    self.square = self.controller.get_button(2)    # X/Square
-                    self.triangle = self.controller.get_button(3)  # Y/Triangle
-                    
-                    # Bumpers
-                    if self.controller.get_numbuttons() > 5:
-                        self.left_bumper = self.controller.get_button(4)
-                        self.right_bumper = self.controller.get_button(5)
-            
-            # Sleep to reduce CPU usage
-            time.sleep(0.01)
+    @property
+    def state(self):
+        """Most recent ControllerState snapshot"""
+        return self.states.state
+    
+    def _controller_update(self, axes, buttons, hats):
+        """Engine callback that publishes a new snapshot after each change"""
+        # Plain indexed reads through the resolved profile
+        return self.profile.snapshot(self.states, axes, buttons, hats)
     
     def read(self):
         """Return RC control values formatted for SPIKE Prime"""
@@ -127,19 +80,17 @@ class PS5Controller:
         # - Right trigger (rt): Speed multiplier
         # - Right bumper (rb): Emergency stop
         
-        # Invert Y axis so pushing up drives forward
-        y = -self.left_stick_y
-        rx = self.right_stick_x
-        rt = self.right_trigger
-        rb = self.right_bumper
-        
-        return (y, rx, rt, rb)
+        # Take one snapshot so every value comes from the same frame
+        return tuple(self.states.state.rc_controls())
+    
+    async def wait_for_change(self, timeout=None):
+        """Wait until the controller reports a change, then return read()"""
+        await self.engine.channel.wait(timeout)
+        return self.read()
     
     def close(self):
         """Clean up resources"""
-        self.running = False
-        if self.thread.is_alive():
-            self.thread.join(timeout=1.0)
+        self.engine.stop()
         if self.controller:
             self.controller.quit()
         pygame.joystick.quit()
@@ -231,16 +182,12 @@ class PybricksBroadcaster:
         
         self.connected = False
     
-    async def broadcast_control(self, drive, steer, unused=0):
-        """Broadcast control data to the Pybricks hub"""
+    async def broadcast_control(self, drive_value, steer_value, unused=0):
+        """Broadcast control data (integers -100 to 100) to the Pybricks hub"""
         if not self.client or not self.client.is_connected:
             return False
         
         try:
-            # Convert values to integers in range -100 to 100
-            drive_value = max(-100, min(100, int(drive * 100)))
-            steer_value = max(-100, min(100, int(steer * 100)))
-            
             # Pack data for broadcasting
             # In a real implementation, we would need to use the Pybricks BLE service UUID
             # and characteristic for broadcasting data on a specific channel
@@ -288,7 +235,7 @@ async def main():
         print("- Right trigger: Speed boost")
         print("- Right bumper: Emergency stop/disconnect")
         
-        deadband = 0.1  # Deadband to ignore small stick movements
+        mapping = default_mapping()  # Deadband, trigger boost and steering limit
         
         while True:
             # Get controller values
@@ -299,24 +246,15 @@ async def main():
                 print("\nEmergency stop - Disconnecting...")
                 break
             
-            # Apply deadband
-            if abs(l_stick_ver) < deadband:
-                l_stick_ver = 0
-            if abs(r_stick_hor) < deadband:
-                r_stick_hor = 0
-            
-            # Set power multiplier based on right trigger
-            power_multiplier = 0.3 + (r_trigger * 0.7)  # 30% to 100%
-            
-            # Calculate final drive values
-            drive_power = l_stick_ver * power_multiplier
-            steer_power = r_stick_hor * 0.7  # Limit steering power to 70%
+            # Deadband, 30-100% trigger boost and 70% steering limit in one call
+            drive_power, steer_power, _ = mapping.map(l_stick_ver, r_stick_hor, r_trigger)
             
             # Broadcast control values to the Pybricks hub
             await broadcaster.broadcast_control(drive_power, steer_power)
             
             # Wait a short time
-            await asyncio.sleep(0.05)  # 50Hz update rate
+            # Sleep until the controller changes instead of polling
+            await joy.wait_for_change(timeout=0.05)
     
     except asyncio.CancelledError:
         # This is expected on disconnect
@@ -1,11 +1,13 @@
 # Debug version of UART Receiver for Pybricks SPIKE Prime
 # This script adds verbose debugging to help troubleshoot connection issues
 # Upload to SPIKE Prime with Pybricks firmware
+# Needs pybricks_hub_tools.py in the same folder, it is uploaded with it
 
 from pybricks.hubs import PrimeHub
 from pybricks.pupdevices import Motor
 from pybricks.parameters import Port, Color
 from pybricks.tools import wait
+from pybricks_hub_tools import LoopTimer
 
 # Initialize the hub
 hub = PrimeHub()
@@ -95,7 +97,9 @@ def test():
     return "OK: Test successful"
 
 # Main loop
-counter = 0
+loop_timer = LoopTimer(20)
+last_status_time = 0
+last_idle_time = 0
 print("READY - Waiting for commands...")  # Signal that we're ready
 
 while True:
@@ -106,9 +110,11 @@ while True:
         print(f"Total commands received: {command_count}")
         stop()
     
-    # Update counter and show status occasionally
-    counter += 1
-    if counter % 50 == 0:  # Every ~1 second
+    # Show status once a second
+    now = loop_timer.now()
+    if now - last_status_time >= 1000:
+        last_status_time = now
+        loop_timer.report()
         # Get motor statuses
         try:
             drive_status = drive_motor.dc()
@@ -117,12 +123,13 @@ while True:
             if drive_status != 0 or steer_status != 0:
                 print(f"Running: D:{drive_status} S:{steer_status}")
             else:
-                # Only print this occasionally to avoid spamming
-                if counter % 250 == 0:
+                # Only print this every 5 seconds to avoid spamming
+                if now - last_idle_time >= 5000:
+                    last_idle_time = now
                     print("Idle - Waiting for commands...")
                     print(f"Total commands received: {command_count}")
         except Exception as e:
             print(f"Error reading motor status: {e}")
     
-    # Small delay
-    wait(20)
\ No newline at end of file
+    # Sleep until the next 20 ms deadline
+    loop_timer.sleep()
\ No newline at end of file
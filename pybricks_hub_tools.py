@@ -0,0 +1,116 @@
+# Hub-side helpers shared by the Pybricks receiver programs
+# pybricks_uart_receiver.py, pybricks_ble_robot.py and
+# pybricks_debug_receiver.py import this module. Pybricks Code and
+# pybricksdev upload it together with the program, as long as it sits in the
+# same folder.
+#
+# LoopTimer     - runs a control loop on absolute deadlines
+# StatusDisplay - status text and light that never block the loop
+
+from pybricks.tools import wait, StopWatch
+
+class LoopTimer:
+    """Runs the control loop at a fixed period on absolute deadlines
+
+    sleep() waits until the next deadline instead of a fixed time, so the
+    period doesn't stretch by however long the loop body took. A pass that
+    misses its deadline is counted as an overrun and the schedule skips the
+    missed slots rather than catching up with a burst of short passes.
+    """
+    def __init__(self, period_ms=20):
+        self.period_ms = period_ms
+        self.watch = StopWatch()
+        self.deadline = period_ms
+        self.passes = 0
+        self.overruns = 0
+        self.worst_ms = 0       # Latest a pass has finished after its deadline
+        self._reported = 0
+
+    def now(self):
+        """Milliseconds since the loop started"""
+        return self.watch.time()
+
+    def sleep(self):
+        """Wait for the end of the current period"""
+        self.passes += 1
+        late = self.watch.time() - self.deadline
+        if late > 0:
+            self.overruns += 1
+            if late > self.worst_ms:
+                self.worst_ms = late
+            self.deadline += (late // self.period_ms + 1) * self.period_ms
+        else:
+            wait(-late)
+            self.deadline += self.period_ms
+
+    def report(self):
+        """Print the overrun count if it went up since the last report"""
+        if self.overruns != self._reported:
+            self._reported = self.overruns
+            print(f"Loop: {self.overruns} of {self.passes} passes overran {self.period_ms} ms, worst {self.worst_ms} ms late")
+
+class StatusDisplay:
+    """Status text and light that never block the control loop
+
+    set() and flash() only record what to show. tick(), called once per loop
+    pass, makes at most one display call: it shows the next character with
+    display.char, or blanks the display between characters. A message is
+    spread over many passes instead of display.text() holding the loop until
+    it has scrolled by. Nothing is redrawn while the state stays the same.
+    """
+    def __init__(self, hub, char_ms=400, gap_ms=50):
+        self.hub = hub
+        self.char_ms = char_ms
+        self.gap_ms = gap_ms
+        self.watch = StopWatch()
+        self.text = None        # State shown until set() changes it
+        self.color = None
+        self.flashing = False   # A flash() message is being shown
+        self._message = None    # Text being rendered, None when done
+        self._index = 0
+        self._showing = False   # A character is on the display
+        self._due = 0           # Watch time of the next display call
+        self._light = None
+
+    def set(self, text, color):
+        """Show text in color from now on"""
+        if text == self.text and color == self.color:
+            return
+        self.text = text
+        self.color = color
+        if not self.flashing:
+            self._start(text, color)
+
+    def flash(self, text, color):
+        """Show text once, then go back to the set() state"""
+        self.flashing = True
+        self._start(text, color)
+
+    def _start(self, text, color):
+        if color != self._light:
+            self.hub.light.on(color)
+            self._light = color
+        self._message = text
+        self._index = 0
+        self._showing = False
+        self._due = self.watch.time()
+
+    def tick(self):
+        """Advance the current message by one step if it is due"""
+        if self._message is None or self.watch.time() < self._due:
+            return
+        if self._showing:
+            # Blank briefly so repeated letters are visible
+            self.hub.display.off()
+            self._showing = False
+            self._index += 1
+            self._due += self.gap_ms
+        elif self._index < len(self._message):
+            self.hub.display.char(self._message[self._index])
+            self._showing = True
+            self._due += self.char_ms
+        else:
+            self._message = None
+            if self.flashing:
+                self.flashing = False
+                self._start(self.text, self.color)
@@ -1,15 +1,44 @@
 # UART Receiver for Pybricks SPIKE Prime
 # Receives commands over BLE UART and controls motors
 # Upload to SPIKE Prime with Pybricks firmware
+# Needs pybricks_hub_tools.py in the same folder, it is uploaded with it
+#
+# Commands arrive on stdin as fixed 5-byte binary frames (see rc_protocol.py
+# on the computer) and are decoded with ustruct.unpack_from - nothing is
+# passed to the REPL compiler:
+#   SYNC 0xA5 | type (1 = drive, 2 = stop, 3 = IMU on/off) | drive int8 | steer int8 | checksum (sum of bytes 0-3)
+#
+# The interrupt character is turned off while the program runs, so a 0x03
+# byte in a frame is data rather than KeyboardInterrupt.
+#
+# A ping (type 0x12, 11 bytes with the computer's clock in it) is written
+# back to stdout unchanged as soon as the control loop reads it.
+#
+# After an IMU on frame, batches of IMU and motor samples are written to
+# stdout between the print() lines: SYNC | batch | checksum (see rc_protocol.py).
 
 from pybricks.hubs import PrimeHub
 from pybricks.pupdevices import Motor
 from pybricks.parameters import Port, Color
-from pybricks.tools import wait
+from pybricks_hub_tools import LoopTimer, StatusDisplay
+
+import micropython
+import ustruct
+from usys import stdin, stdout
+from uselect import poll
+
+# Binary frame format, must match rc_protocol.py
+SYNC = 0xA5
+MSG_DRIVE = 0x01
+MSG_STOP = 0x02
+MSG_IMU = 0x03
+FRAME_SIZE = 5
+PING_TYPE = 0x12
+PING_SIZE = 11
 
 # Initialize the hub
 hub = PrimeHub()
-hub.light.on(Color.GREEN)
+status = StatusDisplay(hub)
 
 # Initialize the motors
 drive_motor = Motor(Port.B)
@@ -19,15 +48,99 @@ steering_motor = Motor(Port.A)
 drive_power = 0
 steer_power = 0
 last_command_time = 0
-counter = 0
+
+# Control loop period and how long without commands before stopping.
+# 10 ms so IMU samples are taken at 100 Hz.
+LOOP_MS = 10
+COMMAND_TIMEOUT_MS = 3000
+loop_timer = LoopTimer(LOOP_MS)
+last_report_time = 0
 
 # Show ready message
-hub.display.text("Ready")
+status.set("Ready", Color.GREEN)
 print("SPIKE Prime RC Car ready")
-print("Commands:")
-print("- rc(drive,steer): Set motor powers (-100 to 100)")
-print("- stop(): Stop all motors")
-print("- exit(): Exit program")
+print("Listening for binary drive/stop frames on stdin")
+
+# IMU streaming: accelerometer (cm/s^2), gyro (deg/s) and motor angles
+# sampled every loop pass into a ring buffer, written to stdout several
+# samples at a time: the first in full, the rest as int8 differences. A
+# sample whose differences don't fit starts the next batch.
+IMU_TYPE = 0x11
+IMU_CHANNELS = 9
+IMU_SAMPLE = "<9h"
+IMU_SAMPLE_SIZE = 18
+IMU_HEADER = 3
+IMU_RING = 100          # Samples kept while stdout is busy (1 s)
+IMU_BATCH = 12          # Samples per batch at most
+IMU_MAX_AGE_MS = 100    # Send a partial batch once its oldest sample is this old
+
+imu_streaming = False
+imu_ring = bytearray(IMU_RING * IMU_SAMPLE_SIZE)
+imu_head = 0            # Ring slot for the next sample
+imu_count = 0           # Samples waiting to be sent
+imu_dropped = 0         # Samples overwritten before they could be sent
+imu_seq = 0
+# SYNC, batch, checksum
+imu_frame = bytearray(1 + IMU_HEADER + IMU_SAMPLE_SIZE + (IMU_BATCH - 1) * IMU_CHANNELS + 1)
+
+def wrap16(n):
+    return ((int(n) + 0x8000) & 0xFFFF) - 0x8000
+
+def imu_sample():
+    global imu_head, imu_count, imu_dropped
+    accel = hub.imu.acceleration()
+    gyro = hub.imu.angular_velocity()
+    ustruct.pack_into(IMU_SAMPLE, imu_ring, imu_head * IMU_SAMPLE_SIZE,
+                      wrap16(loop_timer.now()), wrap16(accel[0] / 10), wrap16(accel[1] / 10),
+                      wrap16(accel[2] / 10), wrap16(gyro[0]), wrap16(gyro[1]), wrap16(gyro[2]),
+                      wrap16(steering_motor.angle()), wrap16(drive_motor.angle()))
+    imu_head = (imu_head + 1) % IMU_RING
+    if imu_count < IMU_RING:
+        imu_count += 1
+    else:
+        # Overwrote the oldest sample
+        imu_dropped += 1
+
+def imu_send():
+    global imu_count, imu_seq
+    tail = (imu_head - imu_count) % IMU_RING
+    start = 1 + IMU_HEADER
+    prev = ustruct.unpack_from(IMU_SAMPLE, imu_ring, tail * IMU_SAMPLE_SIZE)
+    imu_frame[start:start + IMU_SAMPLE_SIZE] = imu_ring[tail * IMU_SAMPLE_SIZE:(tail + 1) * IMU_SAMPLE_SIZE]
+    size = start + IMU_SAMPLE_SIZE
+    n = 1
+    while n < imu_count and n < IMU_BATCH:
+        cur = ustruct.unpack_from(IMU_SAMPLE, imu_ring, ((tail + n) % IMU_RING) * IMU_SAMPLE_SIZE)
+        for ch in range(IMU_CHANNELS):
+            delta = ((cur[ch] - prev[ch] + 0x8000) & 0xFFFF) - 0x8000
+            if delta < -128 or delta > 127:
+                break
+            imu_frame[size + ch] = delta & 0xFF
+        else:
+            prev = cur
+            size += IMU_CHANNELS
+            n += 1
+            continue
+        # Too big a change for int8, this sample starts the next batch
+        break
+    imu_seq = (imu_seq + 1) & 0xFF
+    imu_frame[0] = SYNC
+    imu_frame[1] = IMU_TYPE
+    imu_frame[2] = imu_seq
+    imu_frame[3] = n
+    imu_frame[size] = sum(imu_frame[:size]) & 0xFF
+    stdout.buffer.write(memoryview(imu_frame)[:size + 1])
+    imu_count -= n
+
+def imu_update():
+    imu_sample()
+    if imu_count >= IMU_BATCH:
+        imu_send()
+        return
+    tail = (imu_head - imu_count) % IMU_RING
+    oldest = ustruct.unpack_from("<H", imu_ring, tail * IMU_SAMPLE_SIZE)[0]
+    if ((loop_timer.now() - oldest) & 0xFFFF) >= IMU_MAX_AGE_MS:
+        imu_send()
 
 # Function to stop motors safely
 def stop():
@@ -36,12 +149,10 @@ def stop():
     steering_motor.stop()
     drive_power = 0
     steer_power = 0
-    hub.light.on(Color.RED)
-    hub.display.text("STOP")
+    # Shown over the next loop passes, then back to Ready
+    status.flash("STOP", Color.RED)
+    status.set("Ready", Color.GREEN)
     print("Motors stopped")
-    wait(500)
-    hub.light.on(Color.GREEN)
-    hub.display.text("Ready")
     return "OK"
 
 # Function to control motors
@@ -56,45 +167,130 @@ def rc(drive, steer):
     drive_motor.dc(drive_power)
     steering_motor.dc(steer_power)
     
-    # Update status
-    hub.light.on(Color.BLUE)
-    hub.display.text("Run")
+    # Update status, only redrawn when it changes
+    status.set("Run", Color.BLUE)
     
     # Reset command time
-    last_command_time = counter
+    last_command_time = loop_timer.now()
     
     return f"D:{drive_power} S:{steer_power}"
 
-# Function to exit program
-def exit():
-    global running
-    stop()
-    hub.display.text("Bye!")
-    print("Program exiting")
-    running = False
-    return "BYE"
+# Input from the computer, polled without blocking
+keyboard = poll()
+keyboard.register(stdin)
+
+# Frame being assembled, kept across loop passes so a frame cut off at the
+# end of the input is finished when the rest arrives instead of waiting
+rx = bytearray(PING_SIZE)
+rx_len = 0
+
+def rx_drop(n):
+    """Remove the first n bytes of the frame being assembled"""
+    global rx_len
+    rx[:rx_len - n] = rx[n:rx_len]
+    rx_len -= n
+
+def read_frame():
+    """Return (type, drive, steer) for the next valid frame, or None
+
+    Only reads bytes poll() says are waiting, so the loop never stalls on a
+    cut-off frame or a stray sync byte. A ping is written straight back.
+    """
+    global rx_len
+    while True:
+        if rx_len >= 2:
+            size = PING_SIZE if rx[1] == PING_TYPE else FRAME_SIZE
+            if rx_len >= size:
+                if sum(rx[:size - 1]) & 0xFF == rx[size - 1]:
+                    if size == PING_SIZE:
+                        stdout.buffer.write(rx)
+                        rx_drop(size)
+                        continue
+                    command = ustruct.unpack_from("<Bbb", rx, 1)
+                    rx_drop(size)
+                    return command
+                # Bad frame, maybe a cut-off one: resynchronize on a sync byte inside it
+                shift = 1
+                while shift < rx_len and rx[shift] != SYNC:
+                    shift += 1
+                rx_drop(shift)
+                continue
+        if not keyboard.poll(0):
+            return None
+        byte = stdin.buffer.read(1)[0]
+        # Skip anything until a sync byte, so a lost byte costs one frame
+        if rx_len or byte == SYNC:
+            rx[rx_len] = byte
+            rx_len += 1
+
+def set_imu_streaming(on):
+    global imu_streaming, imu_count, imu_dropped
+    if imu_streaming and not on and imu_dropped:
+        print(f"IMU samples dropped: {imu_dropped}")
+    imu_streaming = on
+    imu_count = 0
+    imu_dropped = 0
+    print("IMU streaming", "on" if on else "off")
+
+def handle_frames():
+    """Apply every frame that arrived since the last loop"""
+    latest = None
+    command = read_frame()
+    while command:
+        if command[0] == MSG_STOP:
+            # Stop right away, and drop drive frames queued before it
+            stop()
+            latest = None
+        elif command[0] == MSG_DRIVE:
+            latest = command
+        elif command[0] == MSG_IMU:
+            set_imu_streaming(command[1] == 1)
+        command = read_frame()
+    # Only the newest drive command matters
+    if latest:
+        rc(latest[1], latest[2])
 
 # Main loop
-running = True
+button_held = False
+# Frames are binary, so a 0x03 byte in one must not raise KeyboardInterrupt
+micropython.kbd_intr(-1)
 print("ready")  # Signal to computer that we're ready
 
-while running:
-    # Check for timeout (no commands for ~3 seconds)
-    if counter - last_command_time > 60:  # ~3 seconds at 20ms per loop
-        if drive_power != 0 or steer_power != 0:
-            print("Command timeout - stopping motors")
+try:
+    while True:
+        handle_frames()
+    
+        # Check for timeout (no commands for 3 seconds)
+        now = loop_timer.now()
+        if now - last_command_time > COMMAND_TIMEOUT_MS:
+            if drive_power != 0 or steer_power != 0:
+                print("Command timeout - stopping motors")
+                stop()
+    
+        # Check hub buttons for emergency stop, once per press
+        pressed = bool(hub.buttons.pressed())
+        if pressed and not button_held:
+            print("Emergency stop triggered by button")
             stop()
+        button_held = pressed
+    
+        # Display current values and loop overruns once a second
+        if now - last_report_time >= 1000:
+            last_report_time = now
+            if drive_power != 0 or steer_power != 0:
+                print(f"Current: D:{drive_power} S:{steer_power}")
+            loop_timer.report()
     
-    # Check hub buttons for emergency stop
-    if hub.buttons.pressed():
-        print("Emergency stop triggered by button")
-        stop()
+        if imu_streaming:
+            imu_update()
     
-    # Update counter and display current values occasionally
-    counter += 1
-    if counter % 50 == 0:  # Every ~1 second
-        if drive_power != 0 or steer_power != 0:
-            print(f"Current: D:{drive_power} S:{steer_power}")
+        # Draw at most one character of the status message
+        status.tick()
     
-    # Small delay to prevent CPU overload
-    wait(20)
\ No newline at end of file
+        # Sleep until the next 10 ms deadline
+        loop_timer.sleep()
+finally:
+    # Give the interrupt character back to the REPL
+    micropython.kbd_intr(3)
+    drive_motor.stop()
+    steering_motor.stop()
@@ -1,13 +1,20 @@
 import asyncio
 import sys
-import struct
 import time
 import pygame
-import threading
 import math
 
-from bleak import BleakClient, BleakScanner
-from bleak.backends.characteristic import BleakGATTCharacteristic
+# bleak, or the loopback link with SPIKERC_TRANSPORT=loopback
+from transport import BleakClient, BleakScanner
+
+from input_engine import PygameInputEngine
+from controller_state import StatePublisher
+from controller_profiles import resolve_profile
+from control_mapping import default_mapping
+from ble_sender import FrameSender
+from rc_protocol import SpikeFrameEncoder
+from input_replay import open_input
+from telemetry import TelemetryMonitor
 
 # SPIKE Prime UART service UUIDs
 UART_SERVICE_UUID = "6E400001-B5A3-F393-E0A9-E50E24DCCA9E"
@@ -38,76 +45,25 @@ class PS5Controller:
         print(f"Number of buttons: {self.controller.get_numbuttons()}")
         print(f"Number of hats: {self.controller.get_numhats()}")
         
-        # Initialize state values
-        self.left_stick_x = 0.0
-        self.left_stick_y = 0.0
-        self.right_stick_x = 0.0
-        self.right_stick_y = 0.0
-        self.left_trigger = 0.0
-        self.right_trigger = 0.0
-        
-        self.cross = 0  # A/Cross
-        self.circle = 0  # B/Circle
-        self.square = 0  # X/Square
-        self.triangle = 0  # Y/Triangle
+        # Resolve axis/button indices once for this controller model
+        self.profile = resolve_profile(self.controller, 0)
         
-        self.left_bumper = 0
-        self.right_bumper = 0
+        # Latest immutable snapshot, swapped in whole by the input thread
+        self.states = StatePublisher()
         
-        # Thread for controller updates
-        self.running = True
-        self.thread = threading.Thread(target=self._controller_update)
-        self.thread.daemon = True
-        self.thread.start()
+        # Event-driven reader, only wakes up when the controller changes
+        self.engine = PygameInputEngine(self.controller, on_change=self._controller_update)
+        self.engine.start()
     
-    def _controller_update(self):
-        """Thread method that updates controller values"""
-        while self.running:
-            # Process events to get controller updates
-            pygame.event.pump()
-            
-            if self.controller:
-                # Map axes based on controller name
-                # DualSense PS5 controller mappings may vary by platform
-                
-                # Common mapping for left stick
-                self.left_stick_x = self.controller.get_axis(0)
-                self.left_stick_y = self.controller.get_axis(1)
-                
-                # For PS5 DualSense on Windows, right stick is usually axes 2 and 3
-                if "dualsense" in self.controller_name.lower() or "dual sense" in self.controller_name.lower():
-                    self.right_stick_x = self.controller.get_axis(2)
-                    self.right_stick_y = self.controller.get_axis(3)
-                    
-                    # PS5 triggers are usually axes 4 and 5 on Windows
-                    if self.controller.get_numaxes() > 5:
-                        self.left_trigger = (self.controller.get_axis(4) + 1) / 2.0  # Convert from -1..1 to 0..1
-                        self.right_trigger = (self.controller.get_axis(5) + 1) / 2.0
-                else:
-                    # Generic mapping for other controllers
-                    self.right_stick_x = self.controller.get_axis(3) if self.controller.get_numaxes() > 3 else 0
-                    self.right_stick_y = self.controller.get_axis(4) if self.controller.get_numaxes() > 4 else 0
-                    
-                    # Triggers
-                    if self.controller.get_numaxes() > 5:
-                        self.left_trigger = (self.controller.get_axis(2) + 1) / 2.0
-                        self.right_trigger = (self.controller.get_axis(5) + 1) / 2.0
-                
-                # Handle button mappings
-                if self.controller.get_numbuttons() > 0:
-                    # Common button mapping for PlayStation controllers
-                    self.cross = self.controller.get_button(0)     # A/Cross
-                    self.circle = self.controller.get_button(1)    # B/Circle
-                    self.square = self.controller.get_button(2)    # X/Square
-                    self.triangle = self.controller.get_button(3)  # Y/Triangle
-                    
-                    # Bumpers
-                    if self.controller.get_numbuttons() > 5:
-                        self.left_bumper = self.controller.get_button(4)
-                        self.right_bumper = self.controller.get_button(5)
-            
-            # Sleep to reduce CPU usage
-            time.sleep(0.01)
+    @property
+    def state(self):
+        """Most recent ControllerState snapshot"""
+        return self.states.state
+    
+    def _controller_update(self, axes, buttons, hats):
+        """Engine callback that publishes a new snapshot after each change"""
+        # Plain indexed reads through the resolved profile
+        return self.profile.snapshot(self.states, axes, buttons, hats)
     
     def read(self):
         """Return RC control values formatted for SPIKE Prime"""
@@ -117,19 +73,17 @@ class PS5Controller:
         # - Right trigger (rt): Speed multiplier
         # - Right bumper (rb): Emergency stop
         
-        # Invert Y axis so pushing up drives forward
-        y = -self.left_stick_y
-        rx = self.right_stick_x
-        rt = self.right_trigger
-        rb = self.right_bumper
-        
-        return [y, rx, rt, rb]
+        # Take one snapshot so every value comes from the same frame
+        return self.states.state.rc_controls()
+    
+    async def wait_for_change(self, timeout=None):
+        """Wait until the controller reports a change, then return read()"""
+        await self.engine.channel.wait(timeout)
+        return self.read()
     
     def close(self):
         """Clean up resources"""
-        self.running = False
-        if self.thread.is_alive():
-            self.thread.join(timeout=1.0)
+        self.engine.stop()
         if self.controller:
             self.controller.quit()
         pygame.joystick.quit()
@@ -175,18 +129,23 @@ async def uart_terminal():
         for task in asyncio.all_tasks():
             task.cancel()
 
-    def handle_rx(_: BleakGATTCharacteristic, data: bytearray):
-        print("Data received:", data)
+    # Decodes the hub's telemetry notifications, shown after the control values
+    telemetry = TelemetryMonitor()
 
     async with BleakClient(device, disconnected_callback=handle_disconnect) as client:
-        await client.start_notify(UART_TX_CHAR_UUID, handle_rx)
+        await client.start_notify(UART_TX_CHAR_UUID, telemetry.handle_rx)
 
         print("Connected to SPIKE Prime. Setting up controller...")
         rx_char = UART_RX_CHAR_UUID
+        
+        # Writes happen on their own task; the loop below only samples the pad
+        # Frames are numbered and timestamped as they are written, see rc_protocol.py
+        sender = FrameSender(client, rx_char, encode=SpikeFrameEncoder().encode).start()
 
         try:
             # Initialize controller
-            joy = PS5Controller()
+            # SPIKERC_CAPTURE / SPIKERC_REPLAY record or replay the pad, see input_replay.py
+            joy = open_input(PS5Controller)
             if not joy.controller:
                 print("No controller detected. Exiting...")
                 sys.exit(1)
@@ -199,60 +158,52 @@ async def uart_terminal():
             print("- Right bumper: Emergency stop/disconnect")
             
             # Control loop
-            deadband = 0.1  # Deadband to ignore small stick movements
+            mapping = default_mapping()  # Deadband, trigger boost and steering limit
+            keepalive = 0.5  # Resend the current state this often when nothing moves
+            
+            last_seq = -1
+            controller_state = None
             
             while True:
+                # Nothing moved since the last frame - just resend it as a keepalive
+                state = joy.state
+                if state.seq == last_seq and controller_state is not None:
+                    sender.submit(controller_state)
+                    await joy.wait_for_change(timeout=keepalive)
+                    continue
+                last_seq = state.seq
+                
                 # Get controller values
-                l_stick_ver, r_stick_hor, r_trigger, disconnect = joy.read()
+                l_stick_ver, r_stick_hor, r_trigger, disconnect = state.rc_controls()
                 
                 if disconnect:
                     print("\nEmergency stop - Disconnecting...")
                     break
                 else:
-                    # Apply deadband to remove jitter when sticks are near center
-                    if deadband >= abs(l_stick_ver) >= 0:
-                        l_stick_ver = 0
-                    if deadband >= abs(r_stick_hor) >= 0:
-                        r_stick_hor = 0
-                    
-                    # Set power multiplier based on right trigger
-                    # Base power is 30% when trigger is not pressed
-                    # Full trigger press gives 100% power
-                    if r_trigger < 0.1:  # Almost not pressed
-                        power_multiplier = 30  # Base power 30%
-                    else:
-                        # Scale from 30% to 100% based on trigger position
-                        power_multiplier = 30 + (r_trigger * 70)
-                    
-                    # Calculate drive power from left stick vertical position
-                    drive_power = l_stick_ver * (power_multiplier / 100)
-                    
-                    # Calculate steering power from right stick horizontal
-                    # The steering motor usually needs less power, so we scale it to 70%
-                    # This prevents damaging the steering mechanism
-                    steering_power = r_stick_hor * 0.7
-                    
-                    # Scale values to SPIKE motor power range (-100 to 100)
-                    drive_motor_power = int(drive_power * 100)
-                    steering_motor_power = int(steering_power * 100)
+                    # Deadband, 30-100% trigger boost and the 70% steering limit
+                    # in one shared mapping, already in SPIKE motor power range
+                    drive_motor_power, steering_motor_power, power_multiplier = mapping.map(
+                        l_stick_ver, r_stick_hor, r_trigger)
                     
                     # Display the current control values
-                    print(f"\rDrive: {drive_motor_power:4d} | Steer: {steering_motor_power:4d} | Power: {power_multiplier:3.0f}% | Stop: {disconnect}", end="")
+                    print(f"\rDrive: {drive_motor_power:4d} | Steer: {steering_motor_power:4d} | Power: {power_multiplier:3d}% | {telemetry.status()}", end="")
+                    
+                    # Drive motor (B), steering motor (A)
+                    controller_state = (drive_motor_power, steering_motor_power)
                     
-                    # Pack data to send to SPIKE Prime
-                    controller_state = struct.pack("bbB",
-                                               drive_motor_power,    # Drive motor (B)
-                                               steering_motor_power, # Steering motor (A)
-                                               0)                    # Unused parameter
+                    # Hand the command to the sender, replacing any command still waiting
+                    sender.submit(controller_state)
                     
-                    # Send data to SPIKE Prime
-                    await client.write_gatt_char(rx_char, controller_state)
-                    await asyncio.sleep(0.02)  # 50Hz update rate
+                    # Sleep until the controller changes instead of polling
+                    await joy.wait_for_change(timeout=keepalive)
                     
         except Exception as e:
             print(f"\nController error: {e}")
         finally:
             # Clean up
+            await sender.close()
+            print(f"\n{sender.stats()}")
+            telemetry.close()
             if 'joy' in locals():
                 joy.close()
             pygame.quit()
@@ -0,0 +1,185 @@
+# Binary RC frames sent from the computer to the hub
+#
+# Pybricks UART path (pybricks_uart_receiver.py)
+# Replaces the "rc(drive,steer)\n" REPL text the host used to send. Every frame
+# is 5 bytes (instead of ~12) and the hub decodes it with one
+# ustruct.unpack_from, without handing anything to the MicroPython compiler.
+#
+#   byte 0  SYNC (0xA5)      lets the hub resynchronize after garbage
+#   byte 1  message type     MSG_DRIVE, MSG_STOP or MSG_IMU
+#   byte 2  drive power      int8, -100..100 (MSG_IMU: 1 starts IMU streaming, 0 stops it)
+#   byte 3  steer power      int8, -100..100
+#   byte 4  checksum         sum of bytes 0-3, modulo 256
+#
+# SPIKE app 3.x path (robot_python_code.py)
+# Each BLE write is one frame, so no sync byte is needed. The original
+# 3-byte "bbB" frame is still accepted by the hub; version 1 adds:
+#
+#   byte 0    version (1)
+#   byte 1-2  sequence number    uint16, wraps, +1 per frame written
+#   byte 3-4  send time          uint16, host milliseconds, wraps
+#   byte 5    drive power        int8, -100..100
+#   byte 6    steer power        int8, -100..100
+#
+# Telemetry (hub -> computer, robot_python_code.py)
+# Notified on the TX characteristic at a fixed rate, one frame per
+# notification, 18 bytes so it fits the default 20-byte ATT payload:
+#
+#   byte 0      type (0x10)
+#   byte 1      telemetry sequence number   uint8, wraps
+#   byte 2-3    hub time                    uint16, ms, wraps
+#   byte 4-5    motor A position            int16, degrees, wraps
+#   byte 6-7    motor A speed               int16, degrees/s
+#   byte 8-9    motor B position            int16, degrees, wraps
+#   byte 10-11  motor B speed               int16, degrees/s
+#   byte 12-13  battery voltage             uint16, mV
+#   byte 14-15  control loop overruns       uint16
+#   byte 16-17  last control sequence number received  uint16
+#
+# IMU batches (hub -> computer, both paths)
+# Accelerometer, gyro and motor positions, sampled every control loop pass
+# (10 ms) and sent several samples at a time:
+#
+#   byte 0      type (0x11)
+#   byte 1      batch sequence number       uint8, wraps
+#   byte 2      sample count n
+#   byte 3-20   first sample, 9 x int16: hub ms (wraps), accel x/y/z,
+#               gyro x/y/z, motor A position, motor B position (wraps)
+#   then n-1 samples as 9 x int8, each the difference from the sample
+#               before it (mod 2^16)
+#
+# A sample whose differences don't fit in int8 starts the next batch.
+# robot_python_code.py sends one batch per notification, as many samples
+# as the negotiated MTU allows, with values in the hub's own units.
+# pybricks_uart_receiver.py writes them to stdout between SYNC (0xA5) and
+# a checksum byte (sum of SYNC and the batch, modulo 256), in cm/s^2 and
+# deg/s, and only after the computer sends MSG_IMU with 1.
+#
+# Ping (computer -> hub -> computer, both paths)
+# Sent with the computer's monotonic clock and echoed back unchanged as
+# soon as the hub reads it, so the round trip time is the echo's arrival
+# time minus the time in it. robot_python_code.py notifies it straight
+# from the write IRQ; pybricks_uart_receiver.py reads it from stdin in its
+# control loop and writes it to stdout between its print() lines.
+#
+#   byte 0     SYNC (0xA5)
+#   byte 1     type (0x12)
+#   byte 2-9   send time     uint64, host time.monotonic_ns()
+#   byte 10    checksum      sum of bytes 0-9, modulo 256
+#
+# The hub decoders and encoders contain copies of these constants; keep
+# them in sync.
+
+import struct
+import time
+
+SYNC = 0xA5
+MSG_DRIVE = 0x01
+MSG_STOP = 0x02
+MSG_IMU = 0x03
+
+FRAME = struct.Struct("<BBbbB")
+FRAME_SIZE = FRAME.size
+
+
+def _checksum(msg, drive, steer):
+    # A sum rather than XOR, so a cut-off frame followed by a new SYNC
+    # doesn't cancel out and pass
+    return (SYNC + msg + (drive & 0xFF) + (steer & 0xFF)) & 0xFF
+
+
+def drive_frame(drive, steer):
+    """Encode motor powers (-100..100) as a MSG_DRIVE frame"""
+    drive = max(-100, min(100, drive))
+    steer = max(-100, min(100, steer))
+    return FRAME.pack(SYNC, MSG_DRIVE, drive, steer, _checksum(MSG_DRIVE, drive, steer))
+
+
+STOP_FRAME = FRAME.pack(SYNC, MSG_STOP, 0, 0, _checksum(MSG_STOP, 0, 0))
+
+
+def imu_frame(on):
+    """Encode a MSG_IMU frame that starts (on=True) or stops IMU streaming"""
+    flag = 1 if on else 0
+    return FRAME.pack(SYNC, MSG_IMU, flag, 0, _checksum(MSG_IMU, flag, 0))
+
+
+def decode_frames(data):
+    """Yield (msg, drive, steer) for every valid frame in data
+
+    Bytes that are not part of a frame with a correct checksum are skipped,
+    the same way the hub decoder resynchronizes on SYNC.
+    """
+    i = 0
+    end = len(data) - FRAME_SIZE
+    while i <= end:
+        if data[i] != SYNC:
+            i += 1
+            continue
+        sync, msg, drive, steer, check = FRAME.unpack_from(data, i)
+        if check != _checksum(msg, drive, steer):
+            i += 1
+            continue
+        yield msg, drive, steer
+        i += FRAME_SIZE
+
+
+SPIKE_FRAME_VERSION = 1
+SPIKE_FRAME = struct.Struct("<BHHbb")
+SPIKE_FRAME_SIZE = SPIKE_FRAME.size
+
+
+class SpikeFrameEncoder:
+    """Numbers and timestamps frames for robot_python_code.py
+
+    Call encode() right before the write, so the sequence number counts
+    frames that actually went on air and the timestamp is the send time.
+    """
+    def __init__(self):
+        self.seq = 0
+
+    def encode(self, command):
+        """Encode a (drive, steer) tuple of powers -100..100"""
+        drive, steer = command
+        self.seq = (self.seq + 1) & 0xFFFF
+        return SPIKE_FRAME.pack(SPIKE_FRAME_VERSION, self.seq, time.monotonic_ns() // 1000000 & 0xFFFF,
+                                max(-100, min(100, drive)), max(-100, min(100, steer)))
+
+
+TELEMETRY_TYPE = 0x10
+TELEMETRY = struct.Struct("<BBHhhhhHHH")
+TELEMETRY_SIZE = TELEMETRY.size
+
+
+IMU_TYPE = 0x11
+IMU_CHANNELS = 9
+IMU_HEADER_SIZE = 3
+IMU_FIRST = struct.Struct("<9h")
+# Most samples either hub puts in one batch: robot_python_code.py fits 25
+# in its 244-byte notification, pybricks_uart_receiver.py sends up to 12
+IMU_MAX_BATCH = 25
+
+
+def imu_batch_size(count):
+    """Bytes in an IMU batch of count samples"""
+    return IMU_HEADER_SIZE + IMU_FIRST.size + (count - 1) * IMU_CHANNELS
+
+
+PING_TYPE = 0x12
+PING = struct.Struct("<BBQB")
+PING_SIZE = PING.size
+
+
+def ping_frame(timestamp_ns):
+    """Encode a ping carrying timestamp_ns"""
+    head = struct.pack("<BBQ", SYNC, PING_TYPE, timestamp_ns & 0xFFFFFFFFFFFFFFFF)
+    return head + bytes([sum(head) & 0xFF])
+
+
+def decode_ping(data):
+    """Send time of a ping echo, None if data is not one"""
+    if len(data) != PING_SIZE or data[0] != SYNC or data[1] != PING_TYPE:
+        return None
+    if sum(data[:PING_SIZE - 1]) & 0xFF != data[PING_SIZE - 1]:
+        return None
+    return PING.unpack(data)[2]
@@ -21,7 +21,8 @@ import struct
 import time
 import hub
 import runloop
-from hub import port, light_matrix
+from hub import port
+import micropython
 from micropython import const
 
 # In SPIKE 3.4.3, the PrimeHub class from the spike module is gone
@@ -37,6 +38,117 @@ except ImportError:
     def sleep_ms(ms):
         time.sleep(ms/1000)
 
+# ===== Hub API probing ===== #
+# Firmware versions differ in how motors, sound and the display are driven.
+# Work out once at boot which variant this hub has and bind it, so the IRQ
+# path and control loop call plain functions instead of falling through
+# try/except chains (raising is slow in MicroPython).
+try:
+    import motor
+except ImportError:
+    motor = None
+
+def _no_op(*args):
+    pass
+
+if motor is not None and hasattr(motor, 'start'):
+    # SPIKE 3.4.3: motor module with port constants
+    motor_start = motor.start
+    motor_stop = motor.stop
+elif hasattr(port.A, 'start'):
+    # Older firmware with port objects
+    motor_start = lambda motor_port, power: motor_port.start(power)
+    motor_stop = lambda motor_port: motor_port.stop()
+elif hasattr(port.A, 'pwm'):
+    motor_start = lambda motor_port, power: motor_port.pwm(power)
+    motor_stop = lambda motor_port: motor_port.pwm(0)
+else:
+    print("No motor API found, motors disabled")
+    motor_start = motor_stop = _no_op
+
+if hasattr(hub, 'sound') and hasattr(hub.sound, 'beep'):
+    beep = hub.sound.beep
+else:
+    try:
+        import sound
+        beep = sound.beep
+    except ImportError:
+        beep = _no_op
+
+if hasattr(hub, 'light_matrix'):
+    show_image = hub.light_matrix.show
+elif hasattr(hub, 'display'):
+    show_image = hub.display.show
+else:
+    show_image = _no_op
+
+def _zero(*args):
+    return 0
+
+# Sensors for telemetry
+if motor is not None and hasattr(motor, 'relative_position'):
+    motor_position = motor.relative_position
+    motor_speed = motor.velocity
+elif hasattr(port.A, 'motor'):
+    # Older firmware: motor.get() is (speed, relative position, absolute position, pwm)
+    motor_position = lambda motor_port: motor_port.motor.get()[1]
+    motor_speed = lambda motor_port: motor_port.motor.get()[0]
+else:
+    motor_position = motor_speed = _zero
+
+if hasattr(hub, 'motion_sensor'):
+    imu_acceleration = hub.motion_sensor.acceleration
+    imu_angular_velocity = hub.motion_sensor.angular_velocity
+elif hasattr(hub, 'motion'):
+    # Older firmware
+    imu_acceleration = hub.motion.accelerometer
+    imu_angular_velocity = hub.motion.gyroscope
+else:
+    imu_acceleration = imu_angular_velocity = lambda: (0, 0, 0)
+
+if hasattr(hub, 'battery_voltage'):
+    battery_mv = hub.battery_voltage
+elif hasattr(hub, 'battery') and hasattr(hub.battery, 'voltage'):
+    battery_mv = hub.battery.voltage
+else:
+    battery_mv = _zero
+
+# The SPIKE App runs a program as one file, so this can't import
+# pybricks_hub_tools.py like the Pybricks receivers do. This is its LoopTimer
+# on time.ticks_ms instead of a Pybricks StopWatch; keep the two in step.
+#
+# Runs the control loop at a fixed period on absolute ticks_ms deadlines,
+# so the period doesn't stretch by however long the loop body took. A pass
+# that misses its deadline is counted as an overrun and the missed slots
+# are skipped rather than caught up with a burst of short passes.
+class LoopTimer:
+    def __init__(self, period_ms=20):
+        self.period_ms = period_ms
+        self.deadline = time.ticks_add(time.ticks_ms(), period_ms)
+        self.passes = 0
+        self.overruns = 0
+        self.worst_ms = 0       # Latest a pass has finished after its deadline
+        self._reported = 0
+
+    def sleep(self):
+        self.passes += 1
+        late = time.ticks_diff(time.ticks_ms(), self.deadline)
+        if late > 0:
+            self.overruns += 1
+            if late > self.worst_ms:
+                self.worst_ms = late
+            self.deadline = time.ticks_add(self.deadline, (late // self.period_ms + 1) * self.period_ms)
+        else:
+            sleep_ms(-late)
+            self.deadline = time.ticks_add(self.deadline, self.period_ms)
+
+    # Print the overrun count if it went up since the last report
+    def report(self):
+        if self.overruns != self._reported:
+            self._reported = self.overruns
+            print("Loop:", self.overruns, "of", self.passes, "passes overran", self.period_ms,
+                  "ms, worst", self.worst_ms, "ms late")
+
 # Connection animation patterns for light matrix
 _CONNECT_IMAGES = [
     '03579:00000:00000:00000:00000',
@@ -63,9 +175,20 @@ if 'FLAG_INDICATE' in dir(bluetooth):
     # We're on MINDSTORMS Robot Inventor
     # New version of bluetooth
     _IRQ_GATTS_WRITE = 3
+    _IRQ_MTU_EXCHANGED = 21
 else:
     # We're probably on SPIKE Prime
     _IRQ_GATTS_WRITE = 1<<2
+    # No MTU exchange event. ble.config('mtu') is only what we asked for,
+    # not what the computer agreed to, so notifications stay at the default
+    # size unless _ASSUMED_MTU says otherwise
+    _IRQ_MTU_EXCHANGED = None
+
+_DEFAULT_MTU = const(23)
+# MTU to use on a connection without an MTU exchange event (SPIKE Prime).
+# Only raise it if every computer you connect from negotiates at least this
+# much; larger notifications fail on a smaller link. 0 keeps the default.
+_ASSUMED_MTU = const(0)
 
 _FLAG_READ = const(0x0002)
 _FLAG_WRITE_NO_RESPONSE = const(0x0004)
@@ -177,6 +300,12 @@ class BLESimplePeripheral:
             ble = bluetooth.BLE()
         self._ble = ble
         self._ble.active(True)
+        try:
+            # Ask for larger notifications, for batched IMU samples
+            self._ble.config(mtu=247)
+        except:
+            pass
+        self.mtu = _DEFAULT_MTU
         self._ble.irq(self._irq)
         ((self._handle_tx, self._handle_rx),) = self._ble.gatts_register_services((_UART_SERVICE,))
         self._connections = set()
@@ -193,6 +322,9 @@ class BLESimplePeripheral:
             print("New connection", conn_handle)
             self._connections.add(conn_handle)
             self._connected=True
+            self.mtu = _DEFAULT_MTU
+            if _IRQ_MTU_EXCHANGED is None and _ASSUMED_MTU:
+                self.mtu = _ASSUMED_MTU
             self._update_animation()
             sleep_ms(300)
             #t = Timer(mode=Timer.ONE_SHOT, period=2000, callback=lambda x:self.send(repr(self._logo)))
@@ -210,6 +342,9 @@ class BLESimplePeripheral:
             value = self._ble.gatts_read(value_handle)
             if value_handle == self._handle_rx and self._write_callback:
                 self._write_callback(value)
+        elif event == _IRQ_MTU_EXCHANGED:
+            conn_handle, mtu = data
+            self.mtu = mtu
 
     def send(self, data):
         for conn_handle in self._connections:
@@ -227,29 +362,12 @@ class BLESimplePeripheral:
 
     def _update_animation(self):
         if not self._connected:
-            # Use hub.light_matrix for v3.4.3
-            try:
-                # For v3.4.3 we need to implement our own animation
-                # This will display the first pattern, let other code run the rest
-                hub.light_matrix.show(self._CONNECT_ANIMATION[0])
-                # Note: In a full implementation, we would need a timer or loop to cycle through patterns
-            except:
-                # Fallback in case light_matrix is not available
-                try:
-                    import hub
-                    hub.display.show(self._CONNECT_ANIMATION[0])
-                except:
-                    pass
+            # For v3.4.3 we need to implement our own animation
+            # This will display the first pattern, let other code run the rest
+            show_image(self._CONNECT_ANIMATION[0])
         else:
             # When connected, show the logo
-            try:
-                hub.light_matrix.show(self._logo)
-            except:
-                try:
-                    import hub
-                    hub.display.show(self._logo)
-                except:
-                    pass
+            show_image(self._logo)
 
 
 # ===== End of library ===== #
@@ -258,20 +376,345 @@ class BLESimplePeripheral:
 
 
 # Imports for program
-from hub import port, sound
+from hub import port
 from time import sleep_ms
 
 # Intialize
 receiver = BLESimplePeripheral(logo="00000:09990:00900:00900:00000") # T for tank
 l_stick_ver, r_stick_hor, turret = [0]*3
 
+# Versioned control frame (see rc_protocol.py on the computer):
+# version, uint16 sequence number, uint16 send time in host ms, drive, steer
+_FRAME_V1 = const(1)
+_FRAME_V1_FORMAT = "<BHHbb"
+_FRAME_V1_SIZE = const(7)
+# Ping (see rc_protocol.py): SYNC, type, host ns, checksum, notified back
+# unchanged straight from the write IRQ so the computer can time the link
+_PING_SYNC = const(0xA5)
+_PING_TYPE = const(0x12)
+_PING_SIZE = const(11)
+# Drop frames that arrived this much later than the fastest frame seen
+_STALE_MS = const(150)
+# Let the delay baseline follow clock drift by 1 ms every this many frames
+_BASELINE_DRIFT_FRAMES = const(64)
+
+last_seq = -1          # -1 until the first frame of a connection
+delay_baseline = -1    # Smallest (hub time - send time) seen, mod 2^16
+frames_received = 0
+frames_lost = 0        # Gaps in the sequence numbers
+frames_out_of_order = 0
+frames_stale = 0
+frames_malformed = 0   # Writes that were no known frame, e.g. cut off
+
+def reset_frame_stats():
+    global last_seq, delay_baseline, frames_received, frames_lost, frames_out_of_order, frames_stale
+    global frames_malformed
+    last_seq = -1
+    delay_baseline = -1
+    frames_received = 0
+    frames_lost = 0
+    frames_out_of_order = 0
+    frames_stale = 0
+    frames_malformed = 0
+
+def print_frame_stats():
+    if frames_received:
+        sent = frames_received + frames_lost
+        print("Frames: received", frames_received, "lost", frames_lost,
+              "(" + str(frames_lost * 100 // sent) + "%) out of order", frames_out_of_order,
+              "stale", frames_stale)
+    if frames_malformed:
+        print("Malformed writes dropped:", frames_malformed)
+
+# Apply each command from the BLE write IRQ via micropython.schedule instead
+# of waiting for the next pass of the control loop. Set to False to go back
+# to applying commands from the loop and compare the delays it prints.
+_APPLY_FROM_IRQ = True
+# Stop the motors if no frame arrives for this long while connected
+# (the computer resends the current command at least every 500 ms)
+_WATCHDOG_MS = const(1000)
+
+last_rx_ms = 0         # time.ticks_ms() of the last frame
+rx_us = -1             # time.ticks_us() of the newest command not yet applied
+apply_pending = False  # An apply_scheduled() call is already queued
+apply_count = 0
+apply_total_us = 0
+apply_max_us = 0
+
+def reset_apply_stats():
+    global apply_count, apply_total_us, apply_max_us
+    apply_count = 0
+    apply_total_us = 0
+    apply_max_us = 0
+
+def print_apply_stats():
+    if apply_count:
+        print("Write to motor delay (us): avg", apply_total_us // apply_count, "max", apply_max_us,
+              "over", apply_count, "commands,", "IRQ path" if _APPLY_FROM_IRQ else "loop path")
+
+# Last power sent to each motor, None while stopped. The motor API is only
+# called when a value changes, not on every command or loop pass.
+applied_steering = None
+applied_drive = None
+
+def start_motor(motor_port, power):
+    try:
+        motor_start(motor_port, power)
+        return True
+    except Exception:
+        # Motor unplugged or bad port (OSError, RuntimeError or ValueError
+        # depending on firmware), the next command tries again
+        return False
+
+def set_motors(steering_power, drive_power):
+    global applied_steering, applied_drive
+    # Steering motor (A) - controls left/right
+    if steering_power != applied_steering and start_motor(port.A, steering_power):
+        applied_steering = steering_power
+    # Drive motor (B) - controls forward/backward
+    if drive_power != applied_drive and start_motor(port.B, drive_power):
+        applied_drive = drive_power
+
+def stop_motors():
+    global applied_steering, applied_drive
+    for motor_port in (port.A, port.B):
+        try:
+            motor_stop(motor_port)
+        except Exception:
+            pass
+    applied_steering = None
+    applied_drive = None
+
+def apply_command():
+    global rx_us, apply_count, apply_total_us, apply_max_us
+    # Right stick horizontal controls steering (A), left stick vertical drive (B)
+    set_motors(r_stick_hor, l_stick_ver)
+    if rx_us >= 0:
+        delay = time.ticks_diff(time.ticks_us(), rx_us)
+        rx_us = -1
+        apply_count += 1
+        apply_total_us += delay
+        if delay > apply_max_us:
+            apply_max_us = delay
+
+def apply_scheduled(_):
+    global apply_pending
+    apply_pending = False
+    # A disconnect may have been handled between the write and this call
+    if receiver.is_connected():
+        apply_command()
+
+# Runs in the IRQ handler, so don't touch the motors here: queue
+# apply_scheduled() to run as soon as the IRQ returns
+def request_apply():
+    global rx_us, last_rx_ms, apply_pending
+    last_rx_ms = time.ticks_ms()
+    if rx_us < 0:
+        rx_us = time.ticks_us()
+    if not _APPLY_FROM_IRQ or apply_pending:
+        # The queued call reads the newest values when it runs
+        return
+    try:
+        micropython.schedule(apply_scheduled, None)
+        apply_pending = True
+    except RuntimeError:
+        # Schedule queue full, the control loop picks it up instead
+        pass
+
 # Remote control data callback function
 def on_rx(control):
     global l_stick_ver, r_stick_hor, turret
-    l_stick_ver, r_stick_hor, turret = struct.unpack("bbB", control)
+    global last_seq, delay_baseline, frames_received, frames_lost, frames_out_of_order, frames_stale
+    global frames_malformed
+    if len(control) == _PING_SIZE and control[0] == _PING_SYNC and control[1] == _PING_TYPE:
+        try:
+            receiver.send(control)
+        except OSError:
+            # Notification queue full, the computer counts the ping as lost
+            pass
+        return
+    if len(control) == 3:
+        # Original unnumbered 3-byte frame
+        l_stick_ver, r_stick_hor, turret = struct.unpack("bbB", control)
+        request_apply()
+        return
+    if len(control) != _FRAME_V1_SIZE or control[0] != _FRAME_V1:
+        # Cut off, or meant for another receiver (e.g. a Pybricks frame):
+        # unpacking it would raise in the IRQ
+        frames_malformed += 1
+        return
+
+    _, seq, sent_ms, drive, steer = struct.unpack(_FRAME_V1_FORMAT, control)
+    frames_received += 1
+
+    # Sequence numbers wrap at 2^16; anything not ahead of the last one is
+    # a duplicate or arrived out of order, and a newer command already ran
+    if last_seq >= 0:
+        ahead = (seq - last_seq) & 0xFFFF
+        if ahead == 0 or ahead >= 0x8000:
+            frames_out_of_order += 1
+            return
+        frames_lost += ahead - 1
+    last_seq = seq
+
+    # The clocks aren't synchronized, so compare each frame's delay with
+    # the fastest one seen; a frame much slower than that is stale
+    delay = (time.ticks_ms() - sent_ms) & 0xFFFF
+    if delay_baseline < 0:
+        delay_baseline = delay
+    late = (delay - delay_baseline) & 0xFFFF
+    if late >= 0x8000:
+        # Faster than anything before, new baseline
+        delay_baseline = delay
+        late = 0
+    elif late and frames_received % _BASELINE_DRIFT_FRAMES == 0:
+        delay_baseline = (delay_baseline + 1) & 0xFFFF
+    if late > _STALE_MS:
+        frames_stale += 1
+        return
+
+    l_stick_ver, r_stick_hor, turret = drive, steer, 0
+    request_apply()
 
 receiver.on_write(on_rx)
 
+# Telemetry frame (see rc_protocol.py on the computer), notified on the TX
+# characteristic instead of printed: type, uint8 sequence number, uint16
+# hub ms, A position, A speed, B position, B speed, battery mV, loop
+# overruns, last control sequence number
+_TELEMETRY_TYPE = const(0x10)
+_TELEMETRY_FORMAT = "<BBHhhhhHHH"
+# Milliseconds between telemetry frames while connected, 0 turns it off
+_TELEMETRY_MS = const(100)
+
+telemetry_frame = bytearray(struct.calcsize(_TELEMETRY_FORMAT))
+telemetry_seq = 0
+next_telemetry_ms = 0
+
+# Positions wrap to int16 on the air, the computer unwraps them
+def wrap16(n):
+    return ((n + 0x8000) & 0xFFFF) - 0x8000
+
+def send_telemetry():
+    global telemetry_seq
+    try:
+        a_pos, a_speed = motor_position(port.A), motor_speed(port.A)
+    except Exception:
+        a_pos, a_speed = 0, 0
+    try:
+        b_pos, b_speed = motor_position(port.B), motor_speed(port.B)
+    except Exception:
+        b_pos, b_speed = 0, 0
+    telemetry_seq = (telemetry_seq + 1) & 0xFF
+    struct.pack_into(_TELEMETRY_FORMAT, telemetry_frame, 0, _TELEMETRY_TYPE, telemetry_seq,
+                     time.ticks_ms() & 0xFFFF, wrap16(a_pos), wrap16(a_speed),
+                     wrap16(b_pos), wrap16(b_speed), battery_mv() & 0xFFFF,
+                     loop_timer.overruns & 0xFFFF, last_seq & 0xFFFF)
+    try:
+        receiver.send(telemetry_frame)
+    except OSError:
+        # Notification queue full, the next frame will be newer anyway
+        pass
+
+# IMU streaming (see rc_protocol.py on the computer): accelerometer, gyro
+# and motor positions are sampled every loop pass into a ring buffer and
+# sent several samples per notification, the first in full and the rest as
+# int8 differences. A sample whose differences don't fit starts the next
+# batch. Streaming needs an MTU of at least 33 (two samples).
+_IMU_STREAM = True
+_IMU_TYPE = const(0x11)
+_IMU_CHANNELS = const(9)
+_IMU_SAMPLE = "<9h"
+_IMU_SAMPLE_SIZE = const(18)
+_IMU_HEADER = const(3)
+_IMU_RING = const(100)          # Samples kept while the link is busy (1 s)
+_IMU_MAX_AGE_MS = const(100)    # Send a partial batch once its oldest sample is this old
+
+imu_ring = bytearray(_IMU_RING * _IMU_SAMPLE_SIZE)
+imu_head = 0        # Ring slot for the next sample
+imu_count = 0       # Samples waiting to be sent
+imu_dropped = 0     # Samples overwritten before they could be sent
+imu_seq = 0
+imu_frame = bytearray(244)
+imu_batch_max = 0   # Samples per notification at the current MTU, 0 = off
+imu_mtu = 0         # MTU imu_batch_max was worked out for
+
+def imu_sample():
+    global imu_head, imu_count, imu_dropped
+    accel = imu_acceleration()
+    gyro = imu_angular_velocity()
+    try:
+        a_pos = motor_position(port.A)
+    except Exception:
+        a_pos = 0
+    try:
+        b_pos = motor_position(port.B)
+    except Exception:
+        b_pos = 0
+    struct.pack_into(_IMU_SAMPLE, imu_ring, imu_head * _IMU_SAMPLE_SIZE,
+                     wrap16(time.ticks_ms()), wrap16(accel[0]), wrap16(accel[1]), wrap16(accel[2]),
+                     wrap16(gyro[0]), wrap16(gyro[1]), wrap16(gyro[2]), wrap16(a_pos), wrap16(b_pos))
+    imu_head = (imu_head + 1) % _IMU_RING
+    if imu_count < _IMU_RING:
+        imu_count += 1
+    else:
+        # Overwrote the oldest sample
+        imu_dropped += 1
+
+def imu_due():
+    if imu_count >= imu_batch_max:
+        return True
+    tail = (imu_head - imu_count) % _IMU_RING
+    oldest = struct.unpack_from("<H", imu_ring, tail * _IMU_SAMPLE_SIZE)[0]
+    return ((time.ticks_ms() - oldest) & 0xFFFF) >= _IMU_MAX_AGE_MS
+
+def imu_send():
+    global imu_count, imu_seq
+    tail = (imu_head - imu_count) % _IMU_RING
+    prev = struct.unpack_from(_IMU_SAMPLE, imu_ring, tail * _IMU_SAMPLE_SIZE)
+    imu_frame[_IMU_HEADER:_IMU_HEADER + _IMU_SAMPLE_SIZE] = imu_ring[tail * _IMU_SAMPLE_SIZE:(tail + 1) * _IMU_SAMPLE_SIZE]
+    size = _IMU_HEADER + _IMU_SAMPLE_SIZE
+    n = 1
+    while n < imu_count and n < imu_batch_max:
+        cur = struct.unpack_from(_IMU_SAMPLE, imu_ring, ((tail + n) % _IMU_RING) * _IMU_SAMPLE_SIZE)
+        for ch in range(_IMU_CHANNELS):
+            delta = ((cur[ch] - prev[ch] + 0x8000) & 0xFFFF) - 0x8000
+            if delta < -128 or delta > 127:
+                break
+            imu_frame[size + ch] = delta & 0xFF
+        else:
+            prev = cur
+            size += _IMU_CHANNELS
+            n += 1
+            continue
+        # Too big a change for int8, this sample starts the next batch
+        break
+    imu_frame[0] = _IMU_TYPE
+    imu_frame[1] = (imu_seq + 1) & 0xFF
+    imu_frame[2] = n
+    try:
+        receiver.send(memoryview(imu_frame)[:size])
+    except OSError:
+        # Notification queue full, keep the samples for the next pass
+        return
+    imu_seq = (imu_seq + 1) & 0xFF
+    imu_count -= n
+
+def imu_update():
+    global imu_batch_max, imu_mtu, imu_count
+    if receiver.mtu != imu_mtu:
+        imu_mtu = receiver.mtu
+        imu_batch_max = 0
+        payload = min(imu_mtu - 3, len(imu_frame))
+        if payload >= _IMU_HEADER + _IMU_SAMPLE_SIZE + _IMU_CHANNELS:
+            imu_batch_max = min(255, (payload - _IMU_HEADER - _IMU_SAMPLE_SIZE) // _IMU_CHANNELS + 1)
+        print("IMU streaming:", imu_batch_max, "samples per notification at MTU", imu_mtu)
+        imu_count = 0
+    if imu_batch_max:
+        imu_sample()
+        if imu_due():
+            imu_send()
+
 # Motor helper functions
 def clamp_int(n, floor=-100, ceiling=100):
     return max(min(int(n),ceiling),floor)
@@ -287,7 +730,7 @@ def track_target(motor, target=0, gain=1.5):
 # - Motor A: Steering pinion (left-right)
 # - Motor B: Drive motor (forward-backward)
 # In SPIKE 3.4.3, we use the motor module with port constants
-import motor
+# (bound once at boot by the API probing at the top of this file)
 
 # We don't need to create motor objects in SPIKE 3.4.3
 # We'll directly use motor.run() or motor.start() with the port constants
@@ -297,97 +740,60 @@ import motor
 # We can use hub directly
 did_connect = False
 did_disconnect = False
+# 10 ms so IMU samples are taken at 100 Hz
+loop_timer = LoopTimer(10)
 # Control loop
 while True:
     if receiver.is_connected():
         if not did_connect:
-            # Play connection sounds using SPIKE 3.4.3 approach
-            try:
-                # In SPIKE 3.4.3, we use the sound module with await
-                # But we're in a normal function, not an async one, so we need a workaround
-                # We'll use a single beep for simplicity
-                hub.sound.beep(440, 100)  # 440Hz for 100ms
-            except:
-                # Fallback methods if the above doesn't work
-                try:
-                    import sound
-                    sound.beep(440, 100)
-                except:
-                    pass  # No sound if neither method works
+            # Play connection sound, a single beep for simplicity
+            beep(440, 100)  # 440Hz for 100ms
             
             did_connect = True
             did_disconnect = False
-
-        # RC Car control with left/right sticks
-        # Left stick vertical (l_stick_ver) controls drive motor (B) - forward/backward
-        # Right stick horizontal (r_stick_hor) controls steering motor (A) - left/right
-        
-        # Convert stick values to appropriate motor powers
-        # For steering, we may need to limit the range to protect the steering mechanism
-        steering_power = r_stick_hor  # Use right stick horizontal for steering
-        drive_power = l_stick_ver     # Use left stick vertical for drive
-        
-        # Apply motor controls using SPIKE 3.4.3 motor API
-        try:
-            # In SPIKE 3.4.3, we use motor.start() with the port constant
-            # Note: We can't use await in this non-async function context
-            
-            # Steering motor (A) - controls left/right
-            motor.start(port.A, steering_power)
-            
-            # Drive motor (B) - controls forward/backward
-            motor.start(port.B, drive_power)
-        except:
-            # Fallback method if the above doesn't work
-            try:
-                # Try using direct port control if available
-                port.A.start(steering_power)
-                port.B.start(drive_power)
-            except:
-                # Last resort - try the old API as well
-                try:
-                    port.A.pwm(steering_power)
-                    port.B.pwm(drive_power)
-                except:
-                    # If all else fails, we can't control the motors
-                    pass
+            last_rx_ms = time.ticks_ms()
+
+        # Motor commands are applied from on_rx as they arrive; this loop
+        # only covers commands the IRQ path couldn't schedule and the watchdog
+        if not _APPLY_FROM_IRQ or (rx_us >= 0 and not apply_pending):
+            apply_command()
+        # Checked on both paths, after any pending command went out
+        if time.ticks_diff(time.ticks_ms(), last_rx_ms) > _WATCHDOG_MS and (l_stick_ver or r_stick_hor):
+            # The computer went quiet without disconnecting, don't keep driving
+            print("No commands for", _WATCHDOG_MS, "ms, stopping motors")
+            l_stick_ver, r_stick_hor, turret = [0]*3
+            set_motors(0, 0)
+
+        if _TELEMETRY_MS and time.ticks_diff(time.ticks_ms(), next_telemetry_ms) >= 0:
+            next_telemetry_ms = time.ticks_add(time.ticks_ms(), _TELEMETRY_MS)
+            send_telemetry()
+
+        if _IMU_STREAM:
+            imu_update()
 
     else:
         if not did_disconnect:
-            # Play disconnection sound using SPIKE 3.4.3 approach
-            try:
-                # In SPIKE 3.4.3, we use the sound module with await
-                # But we're in a normal function, not an async one, so we need a workaround
-                # We'll use a lower pitch beep for disconnection
-                hub.sound.beep(220, 100)  # 220Hz for 100ms
-            except:
-                # Fallback methods if the above doesn't work
-                try:
-                    import sound
-                    sound.beep(220, 100)
-                except:
-                    pass  # No sound if neither method works
-                
+            # Lower pitch beep for disconnection
+            beep(220, 100)  # 220Hz for 100ms
+            
             did_disconnect = True
             did_connect = False
+            print_frame_stats()
+            reset_frame_stats()
+            print_apply_stats()
+            reset_apply_stats()
+            loop_timer.report()
+            if imu_dropped:
+                print("IMU samples dropped:", imu_dropped)
+            imu_count = imu_dropped = imu_mtu = 0
+            rx_us = -1
+            
+            # Don't carry the last command into the next connection
+            l_stick_ver, r_stick_hor, turret = [0]*3
 
-        # Turn off motors when no remote is connected using SPIKE 3.4.3 approach
-        try:
-            # In SPIKE 3.4.3, we use motor.stop() with the port constant
-            motor.stop(port.A)  # Stop steering motor
-            motor.stop(port.B)  # Stop drive motor
-        except:
-            # Fallback methods if the above doesn't work
-            try:
-                port.A.stop()
-                port.B.stop()
-            except:
-                try:
-                    # Last resort - try setting power to 0
-                    motor.start(port.A, 0)
-                    motor.start(port.B, 0)
-                except:
-                    pass  # At this point, we've tried all known methods to stop motors
-
-    # Limit control loop speed for bluetooth messages to have time to arrive
-    sleep_ms(20)
+            # Turn off motors once when the remote goes away, not every pass
+            stop_motors()
+
+    # Only the watchdog and connection changes run here, commands don't wait for this.
+    # Sleep until the next 10 ms deadline
+    loop_timer.sleep()
@@ -0,0 +1,181 @@
+# Session recorder
+# Records a driving session as fixed-width columns: one raw file per column
+# plus a small index.json with the column types and row counts. Appending is
+# just a list append on the caller's side; a background thread writes the
+# rows out every half second, so the control loop never waits on the disk.
+# Recording only needs the standard library. Opening a session maps the
+# column files with NumPy, so even hours of driving open instantly.
+#
+#   python -m spikerc drive --session runs/today     # record
+#   python session_recorder.py runs/today            # summary
+#
+#   from session_recorder import open_session
+#   s = open_session("runs/today")
+#   s["writes"]["finished"] - s["writes"]["started"]  # write times, seconds
+
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Streams and their columns, as array typecodes. Times are seconds since
+# the session started (time.perf_counter), index.json has the wall clock
+# start time.
+STREAMS = {
+    # Controller state each time the control loop read a new one
+    "controller": (("t", "d"), ("drive", "f"), ("steer", "f"), ("boost", "f"), ("stop", "B")),
+    # Frames written to the hub: when the write started and completed
+    "writes": (("started", "d"), ("finished", "d"), ("seq", "H"), ("drive", "b"), ("steer", "b")),
+    # Hub telemetry (see telemetry.py), t is when the notification arrived
+    "telemetry": (("t", "d"), ("hub_ms", "q"), ("a_position", "q"), ("a_speed", "h"),
+                  ("b_position", "q"), ("b_speed", "h"), ("battery_mv", "H"),
+                  ("overruns", "H"), ("control_seq", "H")),
+}
+
+_DTYPES = {"b": "i1", "B": "u1", "h": "i2", "H": "u2", "i": "i4", "I": "u4",
+           "q": "i8", "Q": "u8", "f": "f4", "d": "f8"}
+
+
+class SessionRecorder:
+    """Appends rows to the streams in STREAMS and flushes them in the background
+
+    record() only appends to an in-memory list. A flush thread writes the
+    pending rows to the column files every flush_interval seconds and then
+    updates index.json, so the index never counts rows that aren't on disk.
+    """
+    def __init__(self, path, flush_interval=0.5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.error = None
+        self._t0 = time.perf_counter()
+        self._started = time.time()
+        os.makedirs(path, exist_ok=True)
+        self._rows = {name: 0 for name in STREAMS}
+        self._pending = {name: [] for name in STREAMS}
+        self._files = {name: [open(os.path.join(path, f"{name}.{column}.bin"), "wb")
+                              for column, _ in columns]
+                       for name, columns in STREAMS.items()}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._write_index()
+        self._thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self._thread.start()
+
+    def now(self):
+        """Seconds since the session started, the time base for all streams"""
+        return time.perf_counter() - self._t0
+
+    def record(self, stream, *values):
+        """Append one row to stream, values in the order of its columns"""
+        with self._lock:
+            self._pending[stream].append(values)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write pending rows to disk and update the index"""
+        if self.error is not None:
+            return
+        with self._lock:
+            pending = self._pending
+            self._pending = {name: [] for name in STREAMS}
+        try:
+            for name, rows in pending.items():
+                if not rows:
+                    continue
+                for i, (column, typecode) in enumerate(STREAMS[name]):
+                    f = self._files[name][i]
+                    array(typecode, [row[i] for row in rows]).tofile(f)
+                    f.flush()
+                self._rows[name] += len(rows)
+            self._write_index()
+        except Exception as e:
+            # Keep driving, just stop recording
+            self.error = e
+            print(f"\nSession recording stopped: {e}")
+
+    def _write_index(self):
+        order = "<" if sys.byteorder == "little" else ">"
+        index = {
+            "version": 1,
+            "started": self._started,
+            "streams": {
+                name: {
+                    "rows": self._rows[name],
+                    "columns": {column: order + _DTYPES[typecode] for column, typecode in columns},
+                }
+                for name, columns in STREAMS.items()
+            },
+        }
+        tmp = os.path.join(self.path, "index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, "index.json"))
+
+    def close(self):
+        """Flush the last rows and close the files"""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        for files in self._files.values():
+            for f in files:
+                f.close()
+
+    def summary(self):
+        rows = ", ".join(f"{name}: {count}" for name, count in self._rows.items())
+        return f"Session {self.path} - {rows} rows"
+
+
+def open_session(path):
+    """Map a recorded session as {stream: {column: numpy array}}
+
+    Columns are read-only memory maps, so nothing is read until it is used.
+    """
+    if np is None:
+        raise ImportError("NumPy is needed to open a session: pip install numpy")
+    with open(os.path.join(path, "index.json")) as f:
+        index = json.load(f)
+    session = {}
+    for name, stream in index["streams"].items():
+        rows = stream["rows"]
+        session[name] = {}
+        for column, dtype in stream["columns"].items():
+            if rows:
+                session[name][column] = np.memmap(os.path.join(path, f"{name}.{column}.bin"),
+                                                  dtype=dtype, mode="r", shape=(rows,))
+            else:
+                session[name][column] = np.empty(0, dtype=dtype)
+    return session
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python session_recorder.py SESSION_DIR")
+        return
+    path = sys.argv[1]
+    session = open_session(path)
+    with open(os.path.join(path, "index.json")) as f:
+        started = json.load(f)["started"]
+    print(f"Session {path}, started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}")
+    for name, columns in session.items():
+        times = columns.get("t", columns.get("started"))
+        rows = len(times)
+        span = f", {times[-1] - times[0]:.1f} s" if rows > 1 else ""
+        print(f"  {name:<11} {rows:8d} rows{span}")
+    writes = session["writes"]
+    if len(writes["started"]):
+        ms = (writes["finished"] - writes["started"]) * 1000
+        print(f"  write time  p50 {np.percentile(ms, 50):.2f} ms, p95 {np.percentile(ms, 95):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,20 @@ _CONNECT_IMAGES = [
     '35790:00000:00000:00000:00000',
 ]
 
+# Pick the motor API this firmware has once at startup: the 3.4.3 motor
+# module, or motor objects on the ports for older firmware
+try:
+    import motor
+except ImportError:
+    motor = None
+
+if motor is not None and hasattr(motor, 'start'):
+    motor_run = motor.start
+    motor_stop = motor.stop
+else:
+    motor_run = lambda motor_port, power: motor_port.motor.run(power)
+    motor_stop = lambda motor_port: motor_port.motor.stop()
+
 # Simple helper function for sleep_ms
 def sleep_ms(ms):
     time.sleep(ms/1000)
@@ -87,8 +101,8 @@ def ble_irq(event, data):
         hub.light_matrix.show('00000:00000:09990:00000:00000')  # Show disconnected symbol
         hub.sound.beep(220, 100)  # Disconnection beep
         # Stop motors when disconnected
-        hub.port.A.motor.stop()
-        hub.port.B.motor.stop()
+        motor_stop(hub.port.A)
+        motor_stop(hub.port.B)
         # Restart advertising
         advertise()
         
@@ -126,10 +140,10 @@ while True:
         # Apply motor controls with proper error handling
         try:
             # Steering motor (A)
-            hub.port.A.motor.run(r_stick_hor)
+            motor_run(hub.port.A, r_stick_hor)
             
             # Drive motor (B)
-            hub.port.B.motor.run(l_stick_ver)
+            motor_run(hub.port.B, l_stick_ver)
         except Exception as e:
             print("Motor error:", e)
     
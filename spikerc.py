@@ -0,0 +1,471 @@
+# spikerc launcher - one fast-starting entry point for the host scripts
+#   python -m spikerc drive              # SPIKE Prime app 3.x hub (robot_python_code.py)
+#   python -m spikerc pybricks           # Pybricks hub (pybricks_uart_receiver.py)
+#   python -m spikerc test               # just show controller values
+#   python -m spikerc drive --session runs/today   # record the session (session_recorder.py)
+#   python -m spikerc drive --ping 2     # watch the link round trip time (ping_monitor.py)
+#
+# Heavy modules (pygame, bleak) are only imported once a subcommand needs
+# them, pygame only brings up the subsystems joystick events need, and the
+# controller is opened on a worker thread while the hub scan runs. Every run
+# reports the time from launch to the first motor command and appends it to
+# ~/.spikerc/startup_times.jsonl so slow startups stand out.
+
+import time
+
+# Everything is measured from here, before any other import
+_T0 = time.perf_counter()
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# SPIKE Prime / Pybricks UART service UUIDs (Nordic UART Service)
+UART_SERVICE_UUID = "6E400001-B5A3-F393-E0A9-E50E24DCCA9E"
+UART_RX_CHAR_UUID = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"
+UART_TX_CHAR_UUID = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"
+
+DEFAULT_STARTUP_LOG = os.path.join(os.path.expanduser("~"), ".spikerc", "startup_times.jsonl")
+
+
+def elapsed_ms():
+    """Milliseconds since the launcher started"""
+    return (time.perf_counter() - _T0) * 1000
+
+
+class StartupTimer:
+    """Records named milestones relative to launcher start"""
+    def __init__(self, command):
+        self.command = command
+        self.marks = {}
+
+    def mark(self, name):
+        if name not in self.marks:
+            self.marks[name] = elapsed_ms()
+
+    def report(self, final):
+        """Print the milestones and compare against earlier runs"""
+        if final not in self.marks:
+            return
+        total = self.marks[final]
+        steps = ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.marks.items() if name != final)
+        print(f"\nTime to {final}: {total:.0f} ms ({steps})")
+
+        path = os.environ.get("SPIKERC_STARTUP_LOG", DEFAULT_STARTUP_LOG)
+        previous = []
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("command") == self.command and final in entry.get("marks", {}):
+                        previous.append(entry["marks"][final])
+        except OSError:
+            pass
+        if previous:
+            previous = sorted(previous[-20:])
+            median = previous[len(previous) // 2]
+            print(f"Median of the last {len(previous)} runs: {median:.0f} ms ({total - median:+.0f} ms)")
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "command": self.command,
+                                    "marks": {k: round(v, 1) for k, v in self.marks.items()}}) + "\n")
+        except OSError as e:
+            print(f"Could not write startup log {path}: {e}")
+
+
+def init_pygame_input(pygame):
+    """Initialize only the pygame subsystems joystick events need
+
+    pygame.init() also starts audio, fonts and so on. The event queue (which
+    the input engine blocks on) lives in the video subsystem, so display is
+    needed too; no window is ever opened. On a headless machine fall back
+    to SDL's dummy video driver.
+    """
+    try:
+        pygame.display.init()
+    except pygame.error:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        pygame.display.init()
+    pygame.joystick.init()
+
+
+class PygameController:
+    """PS5Controller without the module-level pygame.init()"""
+    def __init__(self):
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        import pygame
+        from input_engine import PygameInputEngine
+        from controller_state import StatePublisher
+        from controller_profiles import resolve_profile
+
+        self._pygame = pygame
+        init_pygame_input(pygame)
+
+        if pygame.joystick.get_count() == 0:
+            print("No controllers found. Please connect a controller and try again.")
+            self.controller = None
+            return
+
+        self.controller = pygame.joystick.Joystick(0)
+        self.controller.init()
+        self.controller_name = self.controller.get_name()
+        print(f"Controller connected: {self.controller_name}")
+
+        self.profile = resolve_profile(self.controller, 0)
+        self.states = StatePublisher()
+        self.engine = PygameInputEngine(self.controller, on_change=self._controller_update)
+        self.engine.start()
+
+    @property
+    def state(self):
+        """Most recent ControllerState snapshot"""
+        return self.states.state
+
+    def _controller_update(self, axes, buttons, hats):
+        """Engine callback that publishes a new snapshot after each change"""
+        return self.profile.snapshot(self.states, axes, buttons, hats)
+
+    def read(self):
+        """Return RC control values [drive, steer, boost, stop]"""
+        return self.states.state.rc_controls()
+
+    async def wait_for_change(self, timeout=None):
+        """Wait until the controller reports a change, then return read()"""
+        await self.engine.channel.wait(timeout)
+        return self.read()
+
+    def close(self):
+        """Clean up resources"""
+        if self.controller:
+            self.engine.stop()
+            self.controller.quit()
+        self._pygame.quit()
+
+
+def open_controller(backend):
+    """Open the controller for a backend, return None if there is none
+
+    SPIKERC_CAPTURE / SPIKERC_REPLAY record or replay it, see input_replay.py.
+    """
+    from input_replay import open_input
+    if backend == "evdev":
+        from evdev_controller import EvdevController as factory
+    elif backend == "hidraw":
+        from hidraw_controller import HidrawDualSense as factory
+    else:
+        factory = PygameController
+    controller = open_input(factory)
+    if not controller.controller:
+        return None
+    return controller
+
+
+async def open_controller_async(backend):
+    """Open the controller without holding up the event loop"""
+    # SDL on macOS has to be initialized on the main thread
+    if backend == "pygame" and sys.platform == "darwin":
+        return open_controller(backend)
+    return await asyncio.to_thread(open_controller, backend)
+
+
+async def find_spike(address):
+    """Find a SPIKE Prime hub running robot_python_code.py"""
+    from transport import BleakScanner
+
+    print("Scanning for SPIKE Prime devices...")
+    device = None
+    try:
+        if address:
+            device = await BleakScanner.find_device_by_address(address)
+        if device is None:
+            device = await BleakScanner.find_device_by_filter(
+                lambda d, ad: bool(d.name) and ("SPIKE" in d.name.upper() or "LEGO" in d.name.upper()))
+    except Exception as e:
+        print(f"Error during device scanning: {e}")
+    if device:
+        print(f"Found SPIKE Prime device: {device.name} ({device.address})")
+    return device
+
+
+async def find_pybricks(hub_name):
+    """Find a Pybricks hub by name, or anything that looks like a hub"""
+    from transport import BleakScanner
+
+    print(f"Scanning for {hub_name}...")
+    device = None
+    try:
+        device = await BleakScanner.find_device_by_filter(
+            lambda d, ad: bool(d.name) and (d.name == hub_name or any(
+                x in d.name.upper() for x in ["PYBRICKS", "SPIKE", "HUB", "LEGO"])))
+    except Exception as e:
+        print(f"Error scanning for hub: {e}")
+    if device:
+        print(f"Found hub: {device.name} ({device.address})")
+    return device
+
+
+async def start_session(timer, backend, scan):
+    """Open the controller and find the hub at the same time"""
+    controller_task = asyncio.create_task(open_controller_async(backend))
+    device = await scan
+    timer.mark("scan")
+    controller = await controller_task
+    timer.mark("controller")
+    if device is None:
+        print("No hub found. Make sure the hub is powered on and running the robot code.")
+    if controller is None:
+        print("No controller detected.")
+    if device is None and controller is not None:
+        controller.close()
+        controller = None
+    return device, controller
+
+
+def open_recorder(path):
+    """Start a session_recorder.SessionRecorder for --session, None without one"""
+    if not path:
+        return None
+    from session_recorder import SessionRecorder
+    return SessionRecorder(path)
+
+
+def close_recorder(session):
+    if session:
+        session.close()
+        print(session.summary())
+
+
+def start_pings(client, rate):
+    """Background ping_monitor.PingMonitor for --ping, None without one"""
+    if not rate:
+        return None
+    from ping_monitor import PingMonitor
+    return PingMonitor(client, UART_RX_CHAR_UUID, rate).start()
+
+
+async def close_pings(pings):
+    if pings:
+        await pings.close()
+        print(pings.report())
+
+
+async def run_drive(args, timer):
+    """SPIKE Prime app 3.x: binary frames to robot_python_code.py"""
+    from control_mapping import default_mapping
+    from rc_protocol import SpikeFrameEncoder
+
+    device, joy = await start_session(timer, args.backend, find_spike(args.address))
+    if device is None or joy is None:
+        return 1
+
+    from transport import BleakClient
+    from ble_sender import stream_response
+    from telemetry import TelemetryMonitor
+
+    session = open_recorder(args.session)
+    telemetry = TelemetryMonitor(args.record, args.imu, session)
+    pings = None
+
+    def handle_rx(sender, data):
+        if not (pings and pings.echo(data)):
+            telemetry.handle_rx(sender, data)
+
+    try:
+        async with BleakClient(device) as client:
+            await client.start_notify(UART_TX_CHAR_UUID, handle_rx)
+            timer.mark("connect")
+            # Unacknowledged writes for control frames, acknowledged for stop
+            stream = stream_response(client, UART_RX_CHAR_UUID)
+            pings = start_pings(client, args.ping)
+            print("Connected. Left stick drives, right stick steers, R2 boosts, R1 stops.")
+
+            mapping = default_mapping()
+            encoder = SpikeFrameEncoder()
+            keepalive = 0.5
+            last_seq = -1
+            command = None
+            while client.is_connected:
+                state = joy.state
+                if state.seq != last_seq or command is None:
+                    last_seq = state.seq
+                    drive, steer, boost, stop = state.rc_controls()
+                    if session:
+                        session.record("controller", session.now(), drive, steer, boost, stop)
+                    if stop:
+                        print("\nEmergency stop - Disconnecting...")
+                        await client.write_gatt_char(UART_RX_CHAR_UUID, encoder.encode((0, 0)), response=True)
+                        break
+                    drive_power, steer_power, power = mapping.map(drive, steer, boost)
+                    command = (drive_power, steer_power)
+                print(f"\rDrive: {drive_power:4d} | Steer: {steer_power:4d} | Power: {power:3d}% | {telemetry.status()}"
+                      f"{' | ' + pings.status() if pings else ''}", end="")
+
+                # Keepalives are re-encoded too, so every write gets a fresh seq and timestamp
+                frame = encoder.encode(command)
+                started = session.now() if session else 0
+                await client.write_gatt_char(UART_RX_CHAR_UUID, frame, response=stream)
+                if session:
+                    session.record("writes", started, session.now(), encoder.seq, drive_power, steer_power)
+                if "first motor command" not in timer.marks:
+                    timer.mark("first motor command")
+                    timer.report("first motor command")
+                await joy.wait_for_change(timeout=keepalive)
+            await close_pings(pings)
+    finally:
+        print()
+        telemetry.close()
+        joy.close()
+        close_recorder(session)
+    return 0
+
+
+async def run_pybricks(args, timer):
+    """Pybricks firmware: binary rc_protocol frames to pybricks_uart_receiver.py"""
+    device, joy = await start_session(timer, args.backend, find_pybricks(args.hub))
+    if device is None or joy is None:
+        return 1
+
+    from control_mapping import default_mapping
+    from rc_protocol import drive_frame, imu_frame, STOP_FRAME
+    from transport import BleakClient
+    from ble_sender import stream_response
+
+    session = open_recorder(args.session)
+    writes = 0
+    pings = None
+
+    # IMU batches share stdout with the hub's print() output
+    imu = parser = None
+    if args.imu:
+        from imu_stream import ImuDecoder, ImuStreamParser
+        imu = ImuDecoder()
+        parser = ImuStreamParser(imu)
+
+    def handle_rx(_, data):
+        if parser:
+            data = parser.feed(data)
+        if pings:
+            # Echoes come back on stdout between the printed lines
+            data = pings.feed(data)
+        message = data.decode("utf-8", errors="replace").strip()
+        if message:
+            print(f"\nHub says: {message}")
+
+    try:
+        async with BleakClient(device) as client:
+            await client.start_notify(UART_TX_CHAR_UUID, handle_rx)
+            timer.mark("connect")
+            # Unacknowledged writes for control frames, acknowledged for stop
+            stream = stream_response(client, UART_RX_CHAR_UUID)
+            if imu:
+                await client.write_gatt_char(UART_RX_CHAR_UUID, imu_frame(True), response=True)
+            pings = start_pings(client, args.ping)
+            print("Connected. Left stick drives, right stick steers, R2 boosts, R1 stops.")
+
+            mapping = default_mapping()
+            update_rate = 0.05
+            keepalive = 1.0
+            last_command_time = 0
+            while client.is_connected:
+                remaining = update_rate - (time.perf_counter() - last_command_time)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+
+                drive, steer, boost, stop = joy.read()
+                if session:
+                    session.record("controller", session.now(), drive, steer, boost, stop)
+                if stop:
+                    print("\nEmergency stop - stopping motors...")
+                    await client.write_gatt_char(UART_RX_CHAR_UUID, STOP_FRAME, response=True)
+                    break
+                drive_power, steer_power, power = mapping.map(drive, steer, boost)
+                started = session.now() if session else 0
+                await client.write_gatt_char(UART_RX_CHAR_UUID, drive_frame(drive_power, steer_power), response=stream)
+                last_command_time = time.perf_counter()
+                if session:
+                    # Pybricks frames carry no sequence number, count writes instead
+                    writes = (writes + 1) & 0xFFFF
+                    session.record("writes", started, session.now(), writes, drive_power, steer_power)
+                if "first motor command" not in timer.marks:
+                    timer.mark("first motor command")
+                    timer.report("first motor command")
+                print(f"\rDrive: {drive_power:4d} | Steer: {steer_power:4d} | Power: {power:3d}%"
+                      f"{' | ' + pings.status() if pings else ''}", end="")
+
+                await joy.wait_for_change(timeout=keepalive)
+            await close_pings(pings)
+    finally:
+        joy.close()
+        if imu:
+            print(f"\n{imu.summary()}")
+            print(f"Saved {imu.save(args.imu)} IMU samples to {args.imu}")
+        close_recorder(session)
+    return 0
+
+
+async def run_test(args, timer):
+    """Show controller values without connecting to a hub"""
+    joy = await open_controller_async(args.backend)
+    timer.mark("controller")
+    if joy is None:
+        return 1
+    timer.report("controller")
+    try:
+        while True:
+            state = joy.state
+            drive, steer, boost, stop = state.rc_controls()
+            print(f"\r#{state.seq:6d} | Drive: {drive:+.2f} | Steer: {steer:+.2f} | Boost: {boost:.2f} | Stop: {stop}   ", end="")
+            await joy.wait_for_change(timeout=1.0)
+    finally:
+        joy.close()
+
+
+COMMANDS = {
+    "drive": run_drive,
+    "pybricks": run_pybricks,
+    "test": run_test,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="spikerc", description="SPIKE Prime remote control launcher")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--backend", choices=["pygame", "evdev", "hidraw"], default="pygame",
+                        help="Controller backend (evdev and hidraw are Linux only)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    drive = commands.add_parser("drive", parents=[common], help="Drive a hub running robot_python_code.py")
+    drive.add_argument("--address", help="Hub Bluetooth address (default: scan by name)")
+    drive.add_argument("--record", metavar="FILE", help="Write hub telemetry to a CSV file")
+    drive.add_argument("--imu", metavar="FILE", help="Save the hub's IMU samples to a .npy file (needs NumPy)")
+    drive.add_argument("--session", metavar="DIR", help="Record controller, writes and telemetry to a session directory")
+    drive.add_argument("--ping", type=float, default=0, metavar="HZ",
+                       help="Ping the hub this many times a second and show the round trip time")
+
+    pybricks = commands.add_parser("pybricks", parents=[common], help="Drive a Pybricks hub running pybricks_uart_receiver.py")
+    pybricks.add_argument("--hub", default="Pybricks Hub", help="Name of the hub to connect to")
+    pybricks.add_argument("--imu", metavar="FILE", help="Stream the hub's IMU samples to a .npy file (needs NumPy)")
+    pybricks.add_argument("--session", metavar="DIR", help="Record controller and writes to a session directory")
+    pybricks.add_argument("--ping", type=float, default=0, metavar="HZ",
+                          help="Ping the hub this many times a second and show the round trip time")
+
+    commands.add_parser("test", parents=[common], help="Show controller values")
+
+    args = parser.parse_args(argv)
+    timer = StartupTimer(args.command)
+    try:
+        return asyncio.run(COMMANDS[args.command](args, timer))
+    except KeyboardInterrupt:
+        print("\nExiting...")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# Telemetry from robot_python_code.py
+# The hub notifies a small binary frame on the UART TX characteristic at a
+# fixed rate (see rc_protocol.py for the layout): motor position and speed
+# for ports A and B, battery voltage, control loop overruns and the last
+# control sequence number it received. This module decodes those frames
+# for the host scripts, shows them as a one-line status and records them.
+#
+# Watch a hub without driving it:
+#   python telemetry.py
+#   python telemetry.py --address E0:FF:F1:4F:05:C8 --record run.csv
+#   python telemetry.py --imu imu.npy
+
+import argparse
+import asyncio
+import csv
+import time
+from collections import namedtuple
+
+from rc_protocol import TELEMETRY, TELEMETRY_SIZE, TELEMETRY_TYPE, IMU_TYPE
+
+UART_TX_CHAR_UUID = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"
+
+Telemetry = namedtuple("Telemetry", [
+    "host_time",      # time.time() when the frame arrived
+    "hub_ms",         # hub clock, unwrapped, ms since the first frame
+    "a_position",     # degrees, unwrapped
+    "a_speed",        # degrees/s
+    "b_position",
+    "b_speed",
+    "battery_mv",
+    "overruns",
+    "control_seq",    # last control frame the hub accepted
+])
+
+
+def _unwrap(previous, raw, bits):
+    """Extend a wrapping counter to a full int given the previous full value"""
+    span = 1 << bits
+    delta = (raw - previous) % span
+    if delta >= span // 2:
+        delta -= span
+    return previous + delta
+
+
+class TelemetryDecoder:
+    """Turns telemetry notifications into Telemetry tuples
+
+    The hub sends positions and its clock as wrapping 16-bit values to keep
+    each frame within one default-size notification; the decoder unwraps
+    them. Gaps in the 8-bit telemetry sequence number are counted in lost.
+    """
+    def __init__(self):
+        self.received = 0
+        self.lost = 0
+        self.latest = None
+        self._seq = None
+        self._raw = None    # Previous wrapped hub time and positions
+
+    def decode(self, data):
+        """Return a Telemetry for a telemetry frame, None for anything else"""
+        if len(data) != TELEMETRY_SIZE or data[0] != TELEMETRY_TYPE:
+            return None
+        _, seq, hub_ms, a_pos, a_speed, b_pos, b_speed, battery, overruns, control_seq = TELEMETRY.unpack(data)
+
+        if self._seq is not None:
+            self.lost += (seq - self._seq - 1) & 0xFF
+        self._seq = seq
+        self.received += 1
+
+        if self.latest is None:
+            hub_time, a_full, b_full = 0, a_pos, b_pos
+        else:
+            last_ms, last_a, last_b = self._raw
+            hub_time = self.latest.hub_ms + ((hub_ms - last_ms) & 0xFFFF)
+            a_full = _unwrap(self.latest.a_position, a_pos, 16)
+            b_full = _unwrap(self.latest.b_position, b_pos, 16)
+        self._raw = (hub_ms, a_pos, b_pos)
+
+        self.latest = Telemetry(time.time(), hub_time, a_full, a_speed, b_full, b_speed,
+                                battery, overruns, control_seq)
+        return self.latest
+
+
+def format_status(t):
+    """One-line summary of a Telemetry for the live view"""
+    if t is None:
+        return "no telemetry"
+    return (f"A {t.a_position:6d}° {t.a_speed:5d}°/s | B {t.b_position:7d}° {t.b_speed:5d}°/s | "
+            f"{t.battery_mv / 1000:.2f} V | overruns {t.overruns} | seq {t.control_seq}")
+
+
+class TelemetryRecorder:
+    """Writes every decoded frame as a CSV row"""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(Telemetry._fields)
+        self.rows = 0
+
+    def write(self, t):
+        self._writer.writerow(t)
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+class TelemetryMonitor:
+    """Notification handler tying a decoder to an optional recorder
+
+    Pass handle_rx to start_notify on the TX characteristic. IMU batches go
+    to imu_stream.ImuDecoder and are saved to imu_path on close() when one
+    is given, otherwise they are ignored. Other notifications are printed
+    like before. Frames also go to the telemetry stream of a
+    session_recorder.SessionRecorder when one is passed as session.
+    """
+    def __init__(self, record=None, imu_path=None, session=None):
+        self.decoder = TelemetryDecoder()
+        self.recorder = TelemetryRecorder(record) if record else None
+        self.session = session
+        self.imu_path = imu_path
+        self.imu = None
+        if imu_path:
+            from imu_stream import ImuDecoder
+            self.imu = ImuDecoder()
+
+    @property
+    def latest(self):
+        return self.decoder.latest
+
+    def handle_rx(self, _, data):
+        if data and data[0] == IMU_TYPE:
+            if self.imu:
+                self.imu.decode(data)
+            return
+        t = self.decoder.decode(data)
+        if t is None:
+            print("\nData received:", data)
+            return
+        if self.recorder:
+            self.recorder.write(t)
+        if self.session:
+            self.session.record("telemetry", self.session.now(), *t[1:])
+
+    def status(self):
+        """Live view line for the newest frame"""
+        return format_status(self.decoder.latest)
+
+    def close(self):
+        """Close the recorder and print the totals"""
+        print(f"Telemetry frames: {self.decoder.received}, lost: {self.decoder.lost}")
+        if self.recorder:
+            self.recorder.close()
+            print(f"Recorded {self.recorder.rows} rows to {self.recorder.path}")
+        if self.imu:
+            print(self.imu.summary())
+            rows = self.imu.save(self.imu_path)
+            print(f"Saved {rows} IMU samples to {self.imu_path}")
+
+
+async def watch(address=None, record=None, imu_path=None, interval=0.2):
+    """Connect to a hub and show its telemetry until interrupted"""
+    from bleak import BleakClient, BleakScanner
+
+    if address:
+        device = await BleakScanner.find_device_by_address(address)
+    else:
+        device = await BleakScanner.find_device_by_filter(
+            lambda d, ad: bool(d.name) and ("SPIKE" in d.name.upper() or "LEGO" in d.name.upper()))
+    if device is None:
+        print("No SPIKE Prime found. Make sure it is powered on and running robot_python_code.py")
+        return
+
+    monitor = TelemetryMonitor(record, imu_path)
+    try:
+        async with BleakClient(device) as client:
+            await client.start_notify(UART_TX_CHAR_UUID, monitor.handle_rx)
+            print(f"Connected to {device.name} ({device.address}), Ctrl+C to stop")
+            while client.is_connected:
+                print(f"\r{monitor.status()}   ", end="")
+                await asyncio.sleep(interval)
+    finally:
+        print()
+        monitor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show telemetry from robot_python_code.py")
+    parser.add_argument("--address", help="Hub Bluetooth address")
+    parser.add_argument("--record", metavar="FILE", help="Also write every frame to a CSV file")
+    parser.add_argument("--imu", metavar="FILE", help="Save the IMU samples to a .npy file (needs NumPy)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(watch(args.address, args.record, args.imu))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
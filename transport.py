@@ -0,0 +1,365 @@
+# BLE transport selection with an in-process loopback link
+# The host scripts import BleakClient and BleakScanner from here instead of
+# from bleak. Normally those are bleak's own classes talking to the Nordic
+# UART Service on a real hub. With SPIKERC_TRANSPORT=loopback they are
+# stand-ins that connect to a hub inside the same process over an emulated
+# link, so the control loops can be profiled and benchmarked without one:
+#
+#   SPIKERC_TRANSPORT=loopback python pygame_uart_example.py
+#   SPIKERC_TRANSPORT=loopback SPIKERC_LINK="interval=30,loss=0.02" python uart_broadcaster.py
+#   SPIKERC_TRANSPORT=loopback SPIKERC_HUB=robot_python_code.py python pygame_uart_example.py
+#   SPIKERC_VIRTUAL_TIME=1 SPIKERC_HUB=robot_python_code.py python pygame_uart_example.py
+#
+# The link model (LinkModel) delivers packets only at connection events,
+# at most packets_per_event in each direction, drops a fraction of them and
+# refuses writes larger than the MTU allows. Acknowledged writes complete
+# one connection event after delivery and are retried when lost, like the
+# link layer does. Link statistics are printed when the client disconnects.
+
+import asyncio
+import os
+import random
+from collections import deque
+
+UART_SERVICE_UUID = "6e400001-b5a3-f393-e0a9-e50e24dcca9e"
+UART_RX_CHAR_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"
+UART_TX_CHAR_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+
+
+class LoopbackError(Exception):
+    """Raised where bleak would raise BleakError"""
+
+
+class LinkModel:
+    """Timing and loss parameters of the emulated link
+
+    interval_ms       - connection interval, packets move only at its events
+    mtu               - ATT MTU, writes and notifications carry mtu - 3 bytes
+    latency_ms        - host stack time for each write call before it is queued
+    loss              - fraction of packets lost on air
+    packets_per_event - packets per direction in one connection event
+    buffer            - unacknowledged writes the controller queues before
+                        write_gatt_char has to wait
+    """
+    def __init__(self, interval_ms=15.0, mtu=23, latency_ms=0.1, loss=0.0,
+                 packets_per_event=4, buffer=8, seed=0):
+        self.interval_ms = interval_ms
+        self.mtu = mtu
+        self.latency_ms = latency_ms
+        self.loss = loss
+        self.packets_per_event = packets_per_event
+        self.buffer = buffer
+        self.seed = seed
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Build a model from "interval=30,mtu=247,loss=0.01" style text"""
+        kwargs = {}
+        for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+            key, _, value = item.partition("=")
+            key = {"interval": "interval_ms", "latency": "latency_ms", "packets": "packets_per_event"}.get(key, key)
+            kwargs[key] = float(value) if "." in value or key.endswith("_ms") or key == "loss" else int(value)
+        return cls(**kwargs)
+
+    def __str__(self):
+        return (f"interval {self.interval_ms:g} ms, MTU {self.mtu}, loss {self.loss:.0%}, "
+                f"{self.packets_per_event} packets/event")
+
+
+class LoopbackHub:
+    """The hub end of the loopback link
+
+    Counts what arrives and answers the "test" message the Pybricks scripts
+    send with "ready", so they don't wait for a timeout. Subclasses override
+    connected(), received() and disconnected(); link.notify(data) sends a
+    notification back to the host.
+    """
+    def __init__(self):
+        self.link = None
+        self.frames = 0
+
+    def connected(self, link):
+        self.link = link
+
+    def received(self, data):
+        self.frames += 1
+        if data == b"test\n":
+            self.link.notify(b"ready\n")
+
+    def disconnected(self):
+        self.link = None
+
+
+# Called on every connect to create the hub end of the link
+hub_factory = LoopbackHub
+
+
+class LoopbackDevice:
+    """What the loopback scanner finds, shaped like bleak's BLEDevice"""
+    def __init__(self, name="LEGO Hub (loopback)", address="00:00:00:00:00:01"):
+        self.name = name
+        self.address = address
+        self.details = None
+
+    def __repr__(self):
+        return f"LoopbackDevice({self.address}, {self.name})"
+
+
+class _AdvertisementData:
+    def __init__(self, device):
+        self.local_name = device.name
+        self.service_uuids = [UART_SERVICE_UUID]
+        self.rssi = -40
+
+
+DEVICE = LoopbackDevice()
+
+
+class LoopbackScanner:
+    """Finds the one loopback device straight away"""
+    @staticmethod
+    async def discover(timeout=5.0, **kwargs):
+        return [DEVICE]
+
+    @staticmethod
+    async def find_device_by_address(address, timeout=10.0, **kwargs):
+        return DEVICE if address.upper() == DEVICE.address else None
+
+    @staticmethod
+    async def find_device_by_name(name, timeout=10.0, **kwargs):
+        return DEVICE if name == DEVICE.name else None
+
+    @staticmethod
+    async def find_device_by_filter(filterfunc, timeout=10.0, **kwargs):
+        return DEVICE if filterfunc(DEVICE, _AdvertisementData(DEVICE)) else None
+
+
+class _Characteristic:
+    def __init__(self, uuid, properties):
+        self.uuid = uuid
+        self.properties = properties
+        self.description = "Nordic UART"
+
+    def __repr__(self):
+        return f"{self.uuid} ({', '.join(self.properties)})"
+
+
+class _Service:
+    def __init__(self, uuid, characteristics):
+        self.uuid = uuid
+        self.characteristics = characteristics
+
+    def get_characteristic(self, uuid):
+        uuid = str(uuid).lower()
+        return next((c for c in self.characteristics if c.uuid == uuid), None)
+
+
+class _Services:
+    def __init__(self, services):
+        self.services = {s.uuid: s for s in services}
+
+    def __iter__(self):
+        return iter(self.services.values())
+
+    def get_service(self, uuid):
+        return self.services.get(str(uuid).lower())
+
+    def get_characteristic(self, uuid):
+        for service in self:
+            characteristic = service.get_characteristic(uuid)
+            if characteristic:
+                return characteristic
+        return None
+
+
+class LoopbackClient:
+    """BleakClient stand-in connected to hub_factory() over a LinkModel
+
+    Supports what the host scripts use: connect/disconnect (also as async
+    context manager), is_connected, mtu_size, services, start_notify,
+    stop_notify and write_gatt_char.
+    """
+    def __init__(self, device, disconnected_callback=None, timeout=10.0, link=None, **kwargs):
+        self.address = getattr(device, "address", device)
+        self.model = link or LinkModel.from_spec(os.environ.get("SPIKERC_LINK"))
+        self.mtu_size = self.model.mtu
+        self._disconnected_callback = disconnected_callback
+        self._rx = _Characteristic(UART_RX_CHAR_UUID, ["write-without-response", "write"])
+        self._tx = _Characteristic(UART_TX_CHAR_UUID, ["notify"])
+        self.services = _Services([_Service(UART_SERVICE_UUID, [self._rx, self._tx])])
+        self._random = random.Random(self.model.seed)
+        self._notify = None
+        self._task = None
+        self.hub = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.delivered = 0
+        self.lost = 0
+        self.notified = 0
+        self.latencies = []     # Write call to delivery at the hub, seconds
+        self._started = None
+
+    @property
+    def is_connected(self):
+        return self._task is not None and not self._task.done()
+
+    async def connect(self, **kwargs):
+        loop = asyncio.get_running_loop()
+        self._to_hub = deque()          # [data, queued at, ack future or None]
+        self._to_host = deque()
+        self._acks = []
+        self._space = asyncio.Event()
+        self._reset_stats()
+        self._started = loop.time()
+        self.hub = hub_factory()
+        self._task = asyncio.create_task(self._run())
+        self.hub.connected(self)
+        print(f"Loopback link: {self.model}")
+        return True
+
+    async def disconnect(self):
+        if self._task is None:
+            return True
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        for _, _, ack in self._to_hub:
+            if ack and not ack.done():
+                ack.set_exception(LoopbackError("Disconnected"))
+        self._space.set()
+        self.hub.disconnected()
+        print(self.stats())
+        if self._disconnected_callback:
+            self._disconnected_callback(self)
+        return True
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    def _characteristic(self, char):
+        uuid = getattr(char, "uuid", char)
+        characteristic = self.services.get_characteristic(uuid)
+        if characteristic is None:
+            raise LoopbackError(f"Characteristic {uuid} was not found")
+        return characteristic
+
+    async def start_notify(self, char, callback, **kwargs):
+        self._characteristic(char)
+        self._notify = callback
+
+    async def stop_notify(self, char):
+        self._notify = None
+
+    async def write_gatt_char(self, char, data, response=None):
+        if not self.is_connected:
+            raise LoopbackError("Not connected")
+        self._characteristic(char)
+        if len(data) > self.mtu_size - 3:
+            raise LoopbackError(f"{len(data)} byte write does not fit MTU {self.mtu_size}")
+        loop = asyncio.get_running_loop()
+        queued = loop.time()
+        await asyncio.sleep(self.model.latency_ms / 1000)
+        if response:
+            ack = loop.create_future()
+            self._to_hub.append([bytes(data), queued, ack])
+            await ack
+            return
+        while len(self._to_hub) >= self.model.buffer:
+            self._space.clear()
+            await self._space.wait()
+            if not self.is_connected:
+                raise LoopbackError("Disconnected")
+        self._to_hub.append([bytes(data), queued, None])
+
+    def notify(self, data):
+        """Hub side: queue a notification for the host"""
+        if len(data) > self.mtu_size - 3:
+            raise LoopbackError(f"{len(data)} byte notification does not fit MTU {self.mtu_size}")
+        if len(self._to_host) >= self.model.buffer:
+            raise LoopbackError("Notification queue full")
+        self._to_host.append(bytes(data))
+
+    def _lost(self):
+        return self.model.loss and self._random.random() < self.model.loss
+
+    async def _run(self):
+        """Connection events: move queued packets each interval"""
+        loop = asyncio.get_running_loop()
+        interval = self.model.interval_ms / 1000
+        event = loop.time()
+        while True:
+            event += interval
+            await asyncio.sleep(max(0, event - loop.time()))
+            now = loop.time()
+
+            # Responses to acknowledged writes delivered at the previous event
+            for ack in self._acks:
+                if not ack.done():
+                    ack.set_result(None)
+            self._acks = []
+
+            for _ in range(min(self.model.packets_per_event, len(self._to_hub))):
+                packet = self._to_hub[0]
+                data, queued, ack = packet
+                if self._lost():
+                    self.lost += 1
+                    if ack:
+                        # Retransmitted at the next event
+                        break
+                    self._to_hub.popleft()
+                    continue
+                self._to_hub.popleft()
+                self.delivered += 1
+                self.latencies.append(now - queued)
+                self.hub.received(data)
+                if ack:
+                    self._acks.append(ack)
+            self._space.set()
+
+            for _ in range(min(self.model.packets_per_event, len(self._to_host))):
+                data = self._to_host.popleft()
+                if self._lost():
+                    self.lost += 1
+                    continue
+                self.notified += 1
+                if self._notify:
+                    self._notify(self._tx, bytearray(data))
+
+    def stats(self):
+        """Summary of what went over the link"""
+        elapsed = asyncio.get_running_loop().time() - self._started
+        text = (f"Loopback link: {self.delivered} writes delivered in {elapsed:.1f} s "
+                f"({self.delivered / elapsed if elapsed else 0:.1f}/s), {self.notified} notifications, "
+                f"{self.lost} lost")
+        if self.latencies:
+            ms = sorted(t * 1000 for t in self.latencies)
+            text += (f", write to hub p50 {ms[len(ms) // 2]:.1f} ms, "
+                     f"p95 {ms[int(len(ms) * 0.95)]:.1f} ms, max {ms[-1]:.1f} ms")
+        return text
+
+
+# SPIKERC_VIRTUAL_TIME=1 runs the host loop, the link and the emulated hub
+# on one simulated clock (virtual_time.py); that only works on the loopback link
+clock = None
+if os.environ.get("SPIKERC_VIRTUAL_TIME"):
+    import virtual_time
+    clock = virtual_time.install()
+
+# SPIKERC_HUB=robot_python_code.py runs that hub program at the other end
+# of the link (hub_emulator.py) instead of LoopbackHub
+if os.environ.get("SPIKERC_HUB"):
+    from hub_emulator import HubEmulator
+    hub_factory = HubEmulator.factory(os.environ["SPIKERC_HUB"], clock=clock)
+
+if clock or os.environ.get("SPIKERC_TRANSPORT", "bleak") == "loopback":
+    BleakClient, BleakScanner = LoopbackClient, LoopbackScanner
+else:
+    from bleak import BleakClient, BleakScanner
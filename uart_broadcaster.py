@@ -8,7 +8,16 @@ import sys
 import os
 import time
 import argparse
-from bleak import BleakScanner, BleakClient
+# bleak, or the loopback link with SPIKERC_TRANSPORT=loopback
+from transport import BleakScanner, BleakClient
+
+from input_engine import PygameInputEngine
+from controller_state import StatePublisher
+from controller_profiles import resolve_profile
+from control_mapping import default_mapping
+from ble_sender import stream_response
+from rc_protocol import drive_frame, STOP_FRAME
+from input_replay import open_input
 
 # Nordic UART Service UUIDs
 UART_SERVICE_UUID = "6e400001-b5a3-f393-e0a9-e50e24dcca9e"
@@ -36,34 +45,48 @@ class PS5Controller:
         print(f"Controller connected: {self.controller_name}")
         print(f"Number of axes: {self.controller.get_numaxes()}")
         print(f"Number of buttons: {self.controller.get_numbuttons()}")
+        
+        # Resolve axis/button indices once for this controller model
+        self.profile = resolve_profile(self.controller, 0)
+        
+        # Latest immutable snapshot, swapped in whole by the input thread
+        self.states = StatePublisher()
+        
+        # Event-driven reader, only wakes up when the controller changes
+        self.engine = PygameInputEngine(self.controller, on_change=self._controller_update)
+        self.engine.start()
+    
+    @property
+    def state(self):
+        """Most recent ControllerState snapshot"""
+        return self.states.state
+    
+    def _controller_update(self, axes, buttons, hats):
+        """Engine callback that publishes a new snapshot after each change"""
+        # Plain indexed reads through the resolved profile
+        return self.profile.snapshot(self.states, axes, buttons, hats)
     
     def update(self):
-        """Update controller states"""
-        pygame.event.pump()
+        """Update controller states (kept for compatibility, the engine does this)"""
+        pass
     
     def read(self):
         """Read control values for RC car"""
         if not self.controller:
             return 0, 0, 0, 0
         
-        # Read stick values - invert Y so up is positive
-        left_y = -self.controller.get_axis(1)
-        
-        # Handle different controller types
-        if "dualsense" in self.controller_name.lower():
-            right_x = self.controller.get_axis(2)  # PS5 controller
-            right_trigger = (self.controller.get_axis(5) + 1) / 2.0  # 0 to 1
-        else:
-            right_x = self.controller.get_axis(3)  # Generic/Xbox controller
-            right_trigger = (self.controller.get_axis(5) + 1) / 2.0  # 0 to 1
-        
-        # Read bumper for emergency stop
-        right_bumper = 1 if self.controller.get_button(5) else 0
-        
-        return left_y, right_x, right_trigger, right_bumper
+        # Take one snapshot so every value comes from the same frame
+        return tuple(self.states.state.rc_controls())
+    
+    async def wait_for_change(self, timeout=None):
+        """Wait until the controller reports a change, then return read()"""
+        await self.engine.channel.wait(timeout)
+        return self.read()
     
     def close(self):
         """Clean up pygame resources"""
+        if self.controller:
+            self.engine.stop()
         pygame.joystick.quit()
         pygame.quit()
 
@@ -75,6 +98,7 @@ class PybricksUARTClient:
         self.device = None
         self.rx_char = None
         self.tx_char = None
+        self.stream_response = True
         self.connected = False
         self.ready = asyncio.Event()
         self.status_message = "Not connected"
@@ -154,6 +178,9 @@ class PybricksUARTClient:
                             self.tx_char = char.uuid
             
             if self.rx_char and self.tx_char:
+                # Stream drive frames without response when the hub allows it
+                self.stream_response = stream_response(self.client, self.rx_char)
+                
                 # Subscribe to notifications from TX characteristic
                 await self.client.start_notify(self.tx_char, self.handle_rx)
                 self.connected = True
@@ -180,36 +207,39 @@ class PybricksUARTClient:
                 await self.client.disconnect()
             return False
     
-    async def write(self, message):
-        """Write a message to the hub"""
+    async def write(self, message, response=True):
+        """Write a message to the hub (response=False skips the acknowledgement)"""
         if not self.connected or not self.client or not self.rx_char:
             return False
         
         try:
             # Add newline to message to simulate pressing enter
             message = message + '\n'
-            await self.client.write_gatt_char(self.rx_char, message.encode())
+            await self.client.write_gatt_char(self.rx_char, message.encode(), response=response)
             return True
         except Exception as e:
             print(f"Error writing to hub: {e}")
             return False
     
-    async def send_motor_command(self, drive, steer):
-        """Send motor command to hub"""
-        drive_int = int(drive * 100)  # Convert to integer -100 to 100
-        steer_int = int(steer * 100)  # Convert to integer -100 to 100
-        
-        # Clamp values
-        drive_int = max(-100, min(100, drive_int))
-        steer_int = max(-100, min(100, steer_int))
+    async def write_frame(self, frame, response=True):
+        """Write a binary rc_protocol frame to the hub"""
+        if not self.connected or not self.client or not self.rx_char:
+            return False
         
-        # Create command
-        command = f"rc({drive_int},{steer_int})"
-        return await self.write(command)
+        try:
+            await self.client.write_gatt_char(self.rx_char, frame, response=response)
+            return True
+        except Exception as e:
+            print(f"Error writing to hub: {e}")
+            return False
+    
+    async def send_motor_command(self, drive_power, steer_power):
+        """Send motor command to hub (powers are integers -100 to 100)"""
+        return await self.write_frame(drive_frame(drive_power, steer_power), response=self.stream_response)
     
     async def send_stop_command(self):
         """Send stop command to hub"""
-        return await self.write("stop()")
+        return await self.write_frame(STOP_FRAME)
     
     async def disconnect(self):
         """Disconnect from hub"""
@@ -233,8 +263,8 @@ async def main():
     parser.add_argument("--hub", type=str, default="Pybricks Hub", help="Name of the hub to connect to")
     args = parser.parse_args()
     
-    # Create PS5 controller
-    controller = PS5Controller()
+    # Create PS5 controller (SPIKERC_CAPTURE / SPIKERC_REPLAY, see input_replay.py)
+    controller = open_input(PS5Controller)
     if not controller.controller:
         print("No controller detected. Exiting...")
         pygame.quit()
@@ -257,13 +287,17 @@ async def main():
     
     try:
         # Main control loop
-        deadband = 0.1  # Ignore small stick movements
-        update_rate = 0.05  # 50ms update rate = 20Hz
-        last_command_time = time.time()
+        mapping = default_mapping()  # Deadband, trigger boost and steering limit
+        update_rate = 0.05  # 50ms minimum between commands = 20Hz max
+        keepalive = 1.0  # Resend the current state this often so the hub doesn't time out
+        last_command_time = 0
         
         while True:
-            # Update controller state
-            controller.update()
+            # Hold back until update_rate has passed since the last command;
+            # whatever changed in the meantime is coalesced into one read
+            remaining = update_rate - (time.time() - last_command_time)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
             
             # Read controller values
             drive, steer, trigger, emergency_stop = controller.read()
@@ -275,28 +309,17 @@ async def main():
                 await asyncio.sleep(0.5)
                 break
             
-            # Apply deadband
-            if abs(drive) < deadband:
-                drive = 0
-            if abs(steer) < deadband:
-                steer = 0
+            # Deadband, 30-100% trigger boost and 70% steering limit in one call
+            drive_power, steer_power, power = mapping.map(drive, steer, trigger)
             
-            # Apply power scaling
-            power_scale = 0.3 + (trigger * 0.7)  # Scale from 30% to 100% based on trigger
-            final_drive = drive * power_scale
-            final_steer = steer * 0.7  # Limit steering to 70% to protect mechanisms
+            await uart_client.send_motor_command(drive_power, steer_power)
+            last_command_time = time.time()
             
-            # Only send commands at the specified update rate
-            current_time = time.time()
-            if current_time - last_command_time >= update_rate:
-                await uart_client.send_motor_command(final_drive, final_steer)
-                last_command_time = current_time
-                
-                # Print status update - use carriage return to overwrite
-                print(f"\rDrive: {int(final_drive*100):4d} | Steer: {int(final_steer*100):4d} | Power: {int(power_scale*100):3d}% | Status: {uart_client.status_message}", end="")
+            # Print status update - use carriage return to overwrite
+            print(f"\rDrive: {drive_power:4d} | Steer: {steer_power:4d} | Power: {power:3d}% | Status: {uart_client.status_message}", end="")
             
-            # Small delay to prevent CPU overload
-            await asyncio.sleep(0.01)
+            # Sleep until the controller changes instead of polling
+            await controller.wait_for_change(timeout=keepalive)
     
     except asyncio.CancelledError:
         # Expected when cancelling the task
@@ -1,12 +1,16 @@
 import asyncio
 import sys
-import struct
 from threading import Thread
 from inputs import get_gamepad
 import math
 
 from bleak import BleakClient, BleakScanner
-from bleak.backends.characteristic import BleakGATTCharacteristic
+
+from control_mapping import default_mapping
+from ble_sender import FrameSender
+from rc_protocol import SpikeFrameEncoder
+from input_replay import open_input, poll_interval
+from telemetry import TelemetryMonitor
 
 # This code has been updated to work with SPIKE Prime v3.4.3
 
@@ -55,19 +59,23 @@ async def uart_terminal():
         for task in asyncio.all_tasks():
             task.cancel()
 
-    def handle_rx(_: BleakGATTCharacteristic, data: bytearray):
-        print("received:", data)
+    # Decodes the hub's telemetry notifications
+    telemetry = TelemetryMonitor()
 
     async with BleakClient(device, disconnected_callback=handle_disconnect) as client:
-        await client.start_notify(UART_TX_CHAR_UUID, handle_rx)
+        await client.start_notify(UART_TX_CHAR_UUID, telemetry.handle_rx)
 
         print("Connected...")
 
         nus = client.services.get_service(UART_SERVICE_UUID)
         rx_char = nus.get_characteristic(UART_RX_CHAR_UUID)
 
-        joy = XboxController()
-        deadband = 0.1
+        # SPIKERC_CAPTURE / SPIKERC_REPLAY record or replay the pad, see input_replay.py
+        joy = open_input(XboxController)
+        # Writes happen on their own task; the loop below only samples the pad
+        # Frames are numbered and timestamped as they are written, see rc_protocol.py
+        sender = FrameSender(client, rx_char, encode=SpikeFrameEncoder().encode).start()
+        mapping = default_mapping()  # Deadband, trigger boost and steering limit
 
         # RC Car control logic
         # - Left stick vertical: Drive motor control (forward/backward)
@@ -86,49 +94,26 @@ async def uart_terminal():
             
             if disconnect:
                 print("Emergency stop - Disconnecting...")
+                print(sender.stats())
+                telemetry.close()
                 for task in asyncio.all_tasks():
                     task.cancel()
                 break
             else:
-                # Apply deadband to remove jitter when sticks are near center
-                if deadband >= l_stick_ver >= -deadband:
-                    l_stick_ver = 0
-                if deadband >= r_stick_hor >= -deadband:
-                    r_stick_hor = 0
-                
-                # Set power multiplier based on right trigger
-                # Base power is 30% when trigger is not pressed
-                # Full trigger press gives 100% power
-                if r_trigger < 0.1:  # Almost not pressed
-                    power_multiplier = 30  # Base power 30%
-                else:
-                    # Scale from 30% to 100% based on trigger position
-                    power_multiplier = 30 + (r_trigger * 70)
-
-                # Calculate drive power from left stick vertical position
-                # With PS5 controller, we invert the drive_power for correct direction
-                drive_power = l_stick_ver * (power_multiplier / 100)
-                
-                # Calculate steering power from right stick horizontal
-                # The steering motor usually needs less power, so we scale it to 70%
-                # This prevents damaging the steering mechanism
-                steering_power = r_stick_hor * 0.7
+                # Deadband, 30-100% trigger boost and the 70% steering limit
+                # in one shared mapping, already in SPIKE motor power range
+                drive_motor_power, steering_motor_power, power_multiplier = mapping.map(
+                    l_stick_ver, r_stick_hor, r_trigger)
                 
                 # Debug output for controller values
-                print(f"Drive: {drive_power:.2f}, Steer: {steering_power:.2f}, Boost: {power_multiplier:.0f}%   ", end="\r")
-                
-                # Scale values to SPIKE motor power range (-100 to 100)
-                drive_motor_power = int(drive_power * 100)
-                steering_motor_power = int(steering_power * 100)
+                print(f"Drive: {drive_motor_power:4d}, Steer: {steering_motor_power:4d}, Boost: {power_multiplier:3d}% | {telemetry.status()}   ", end="\r")
 
-                # Pack data to send to SPIKE Prime
-                controller_state = struct.pack("bbB",
-                                             drive_motor_power,    # Drive motor (B)
-                                             steering_motor_power, # Steering motor (A)
-                                             0)                    # Unused parameter
+                # Drive motor (B), steering motor (A)
+                controller_state = (drive_motor_power, steering_motor_power)
 
-                await client.write_gatt_char(rx_char, controller_state)
-                await asyncio.sleep(0.02)
+                # Hand the command to the sender, replacing any command still waiting
+                sender.submit(controller_state)
+                await poll_interval(joy, 0.02)
 
 
 # Stolen from https://stackoverflow.com/a/66867816/3105668
@@ -220,26 +205,26 @@ class XboxController(object):
                         self.LeftBumper = event.state
                     elif event.code == 'BTN_TR':
                         self.RightBumper = event.state
-                elif event.code == 'BTN_WEST':
-                    self.X = event.state  # previously switched with Y
-                elif event.code == 'BTN_EAST':
-                    self.B = event.state
-                elif event.code == 'BTN_THUMBL':
-                    self.LeftThumb = event.state
-                elif event.code == 'BTN_THUMBR':
-                    self.RightThumb = event.state
-                elif event.code == 'BTN_SELECT':
-                    self.Back = event.state
-                elif event.code == 'BTN_START':
-                    self.Start = event.state
-                elif event.code == 'BTN_TRIGGER_HAPPY1':
-                    self.LeftDPad = event.state
-                elif event.code == 'BTN_TRIGGER_HAPPY2':
-                    self.RightDPad = event.state
-                elif event.code == 'BTN_TRIGGER_HAPPY3':
-                    self.UpDPad = event.state
-                elif event.code == 'BTN_TRIGGER_HAPPY4':
-                    self.DownDPad = event.state
+                    
+                    # Remaining buttons
+                    elif event.code == 'BTN_THUMBL':
+                        self.LeftThumb = event.state
+                    elif event.code == 'BTN_THUMBR':
+                        self.RightThumb = event.state
+                    elif event.code == 'BTN_SELECT':
+                        self.Back = event.state
+                    elif event.code == 'BTN_START':
+                        self.Start = event.state
+                    elif event.code == 'BTN_TRIGGER_HAPPY1':
+                        self.LeftDPad = event.state
+                    elif event.code == 'BTN_TRIGGER_HAPPY2':
+                        self.RightDPad = event.state
+                    elif event.code == 'BTN_TRIGGER_HAPPY3':
+                        self.UpDPad = event.state
+                    elif event.code == 'BTN_TRIGGER_HAPPY4':
+                        self.DownDPad = event.state
+            except Exception as e:
+                print(f"Controller error: {e}")
 
 
 if __name__ == "__main__":
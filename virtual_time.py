@@ -0,0 +1,181 @@
+# Virtual time for the loopback pipeline
+# Runs the host's asyncio loop and the emulated hub on one simulated clock,
+# so a recorded session goes through host -> link -> hub as fast as the
+# computer can process it, with the same result every run. Whenever the
+# loop has nothing ready it jumps the clock to its next timer instead of
+# waiting, and the hub program (hub_emulator.py) only runs while the loop
+# is waiting, in strict turns, until its next sleep.
+#
+#   SPIKERC_VIRTUAL_TIME=1 SPIKERC_HUB=robot_python_code.py SPIKERC_REPLAY=lap.rci python pygame_uart_example.py
+#
+# install() (done by transport.py for SPIKERC_VIRTUAL_TIME) makes
+# asyncio.run() use the virtual loop and points time.monotonic,
+# time.perf_counter and time.time at the virtual clock, so frame
+# timestamps and replays follow it too. The originals stay available here
+# as real_perf_counter etc.
+
+import asyncio
+import math
+import selectors
+import threading
+import time
+
+real_monotonic = time.monotonic
+real_monotonic_ns = time.monotonic_ns
+real_perf_counter = time.perf_counter
+real_perf_counter_ns = time.perf_counter_ns
+real_time = time.time
+real_time_ns = time.time_ns
+
+
+class VirtualClock:
+    """Simulated seconds, shared by the event loop and one hub thread
+
+    The hub thread calls hub_wait() each time it sleeps and blocks there
+    until the loop gives it a turn, at its wake time or earlier when
+    has_work() says it has IRQs to handle. The loop hands out turns from
+    advance() and waits for the hub to sleep again, so at most one side
+    runs at a time.
+    """
+    def __init__(self):
+        self.now = 0.0
+        self._cond = threading.Condition()
+        self._hub_turn = False
+        self._hub_wake = None       # Next hub wake time, None without a hub
+        self._hub_has_work = None
+        self._started = real_perf_counter()
+
+    def time(self):
+        return self.now
+
+    # Hub thread
+
+    def hub_attach(self):
+        """Register a hub that should get its first turn right away"""
+        with self._cond:
+            self._hub_wake = self.now
+
+    def hub_first_turn(self):
+        """Called first thing on the hub thread, returns on its first turn"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._hub_turn)
+
+    def hub_wait(self, wake, has_work=None):
+        """Give the turn back to the loop until wake (seconds)"""
+        with self._cond:
+            self._hub_wake = wake
+            self._hub_has_work = has_work
+            self._hub_turn = False
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._hub_turn)
+
+    def hub_exit(self):
+        """The hub program ended, the loop runs on its own from now on"""
+        with self._cond:
+            self._hub_wake = None
+            self._hub_has_work = None
+            self._hub_turn = False
+            self._cond.notify_all()
+
+    # Event loop
+
+    def _run_hub(self):
+        with self._cond:
+            self._hub_turn = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._hub_turn)
+
+    def advance(self, timeout):
+        """The loop has nothing ready and would wait timeout seconds
+
+        Runs the hub if it is due, otherwise moves the clock to the end of
+        the timeout. Returns None if there is nothing to wait for at all,
+        so the caller has to block for real.
+        """
+        wake = self._hub_wake
+        if wake is not None and (wake <= self.now or (self._hub_has_work and self._hub_has_work())):
+            self._run_hub()
+            return 0
+        target = math.inf if timeout is None else self.now + timeout
+        if wake is not None and wake < target:
+            self.now = wake
+            self._run_hub()
+            return 0
+        if timeout is None:
+            return None
+        self.now = target
+        return 0
+
+    def report(self):
+        real = real_perf_counter() - self._started
+        return f"Virtual time {self.now:.1f} s in {real:.1f} s real ({self.now / real if real else 0:.0f}x)"
+
+
+class VirtualSelector(selectors.BaseSelector):
+    """Selector that advances the virtual clock instead of waiting"""
+    def __init__(self, clock):
+        self._selector = selectors.DefaultSelector()
+        self._clock = clock
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        ready = self._selector.select(0)
+        if ready:
+            return ready
+        if self._clock.advance(timeout) is None:
+            # Only another thread can wake the loop now
+            return self._selector.select(None)
+        return []
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """asyncio event loop running on a VirtualClock"""
+    def __init__(self, clock):
+        super().__init__(VirtualSelector(clock))
+        self.clock = clock
+
+    def time(self):
+        return self.clock.now
+
+    def close(self):
+        if not self.is_closed():
+            print(self.clock.report())
+        super().close()
+
+
+class VirtualTimePolicy(asyncio.DefaultEventLoopPolicy):
+    """Event loop policy handing out VirtualTimeLoops on one clock"""
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def new_event_loop(self):
+        return VirtualTimeLoop(self.clock)
+
+
+CLOCK = VirtualClock()
+
+
+def install(clock=CLOCK):
+    """Use virtual time for asyncio.run() and the time module"""
+    wall = real_time()
+    asyncio.set_event_loop_policy(VirtualTimePolicy(clock))
+    time.monotonic = time.perf_counter = clock.time
+    time.monotonic_ns = time.perf_counter_ns = lambda: round(clock.now * 1e9)
+    time.time = lambda: wall + clock.now
+    time.time_ns = lambda: round((wall + clock.now) * 1e9)
+    return clock
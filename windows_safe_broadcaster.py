@@ -10,12 +10,19 @@ import os
 import time
 
 # Import bleak but handle errors gracefully
+# (transport.py swaps in the loopback link with SPIKERC_TRANSPORT=loopback)
 try:
-    from bleak import BleakScanner, BleakClient
+    from transport import BleakScanner, BleakClient
 except ImportError:
     print("The 'bleak' package is required. Please install it with: pip install bleak")
     sys.exit(1)
 
+from controller_profiles import resolve_profile
+from control_mapping import default_mapping
+from ble_sender import stream_response
+from rc_protocol import drive_frame, STOP_FRAME
+from input_replay import open_input, poll_interval
+
 # Nordic UART Service UUIDs
 UART_SERVICE_UUID = "6e400001-b5a3-f393-e0a9-e50e24dcca9e"
 UART_RX_CHAR_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"  # Write to this characteristic
@@ -42,6 +49,9 @@ class SimpleController:
         print(f"Controller connected: {self.controller_name}")
         print(f"Number of axes: {self.controller.get_numaxes()}")
         print(f"Number of buttons: {self.controller.get_numbuttons()}")
+        
+        # Resolve axis/button indices once for this controller model
+        self.profile = resolve_profile(self.controller, 0)
     
     def read(self):
         """Read control values for RC car"""
@@ -51,21 +61,9 @@ class SimpleController:
         if not self.controller:
             return 0, 0, 0, 0
         
-        # Read stick values - invert Y so up is positive
-        left_y = -self.controller.get_axis(1)
-        
-        # Handle different controller types
-        if "dualsense" in self.controller_name.lower():
-            right_x = self.controller.get_axis(2)  # PS5 controller
-            right_trigger = (self.controller.get_axis(5) + 1) / 2.0  # 0 to 1
-        else:
-            right_x = self.controller.get_axis(3)  # Generic/Xbox controller
-            right_trigger = (self.controller.get_axis(5) + 1) / 2.0  # 0 to 1
-        
-        # Read bumper for emergency stop
-        right_bumper = 1 if self.controller.get_button(5) else 0
-        
-        return left_y, right_x, right_trigger, right_bumper
+        # Plain indexed reads through the resolved profile
+        # (drive with Y inverted so up is positive, steer, trigger 0..1, bumper)
+        return self.profile.rc_controls(self.controller)
     
     def close(self):
         """Clean up pygame resources"""
@@ -122,8 +120,8 @@ async def scan_for_hub():
 
 async def main():
     """Main program function"""
-    # Create controller
-    controller = SimpleController()
+    # Create controller (SPIKERC_CAPTURE / SPIKERC_REPLAY, see input_replay.py)
+    controller = open_input(SimpleController)
     if not controller.controller:
         print("No controller detected. Exiting...")
         pygame.quit()
@@ -180,8 +178,12 @@ async def main():
         
         print("Found UART service, ready to send commands")
         
+        # Stream drive frames without response when the hub allows it;
+        # test and stop messages stay acknowledged
+        rc_response = stream_response(client, rx_char)
+        
         # Send a test command
-        await client.write_gatt_char(rx_char, "test\n".encode())
+        await client.write_gatt_char(rx_char, "test\n".encode(), response=True)
         
         # Give hub time to initialize
         print("Waiting for hub to be ready...")
@@ -194,7 +196,7 @@ async def main():
         print("- Right trigger: Speed boost")
         print("- Right bumper: Emergency stop/disconnect")
         
-        deadband = 0.1  # Ignore small stick movements
+        mapping = default_mapping()  # Deadband, trigger boost and steering limit
         last_command_time = time.time()
         update_rate = 0.05  # 50ms = 20Hz
         
@@ -214,46 +216,36 @@ async def main():
             # Check for emergency stop
             if emergency_stop:
                 print("\nEmergency stop - stopping motors...")
-                await client.write_gatt_char(rx_char, "stop()\n".encode())
+                await client.write_gatt_char(rx_char, STOP_FRAME, response=True)
                 await asyncio.sleep(0.5)
                 break
             
-            # Apply deadband
-            if abs(drive) < deadband:
-                drive = 0
-            if abs(steer) < deadband:
-                steer = 0
-            
-            # Apply power scaling
-            power_scale = 0.3 + (trigger * 0.7)  # 30% to 100% based on trigger
-            final_drive = drive * power_scale
-            final_steer = steer * 0.7  # Limit steering to 70%
+            # Deadband, 30-100% trigger boost and 70% steering limit in one call
+            drive_int, steer_int, power = mapping.map(drive, steer, trigger)
             
             # Check if values changed significantly or update interval elapsed
-            drive_int = int(final_drive * 100)
-            steer_int = int(final_steer * 100)
             values_changed = (abs(drive_int - last_drive) > 5 or abs(steer_int - last_steer) > 5)
             time_elapsed = (time.time() - last_command_time) >= update_rate
             
             if values_changed or time_elapsed:
-                # Create command
-                command = f"rc({drive_int},{steer_int})\n"
+                # Create a binary drive frame
+                command = drive_frame(drive_int, steer_int)
                 
                 # Send command to hub
                 try:
-                    await client.write_gatt_char(rx_char, command.encode())
+                    await client.write_gatt_char(rx_char, command, response=rc_response)
                     last_command_time = time.time()
                     last_drive = drive_int
                     last_steer = steer_int
                     
                     # Print status
-                    print(f"\rDrive: {drive_int:4d} | Steer: {steer_int:4d} | Power: {int(power_scale*100):3d}%", end="")
+                    print(f"\rDrive: {drive_int:4d} | Steer: {steer_int:4d} | Power: {power:3d}%", end="")
                 except Exception as e:
                     print(f"\nError sending command: {e}")
                     break
             
             # Small delay to prevent CPU overload
-            await asyncio.sleep(0.01)
+            await poll_interval(controller, 0.01)
     
     except KeyboardInterrupt:
         print("\nUser interrupted - stopping...")
@@ -266,7 +258,7 @@ async def main():
             try:
                 # Send stop command
                 if rx_char:
-                    await client.write_gatt_char(rx_char, "stop()\n".encode())
+                    await client.write_gatt_char(rx_char, STOP_FRAME, response=True)
                     print("\nSent stop command")
                 
                 # Disconnect